@@ -7,14 +7,21 @@ import os
 import json
 import logging
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import re
+import time
+import hashlib
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import vertexai
 from vertexai.generative_models import GenerativeModel, SafetySetting
 from google.cloud import bigquery
 import functions_framework
 
+from nlp_cache import create_nlp_cache, analyze_with_cache
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,6 +31,30 @@ PROJECT_ID = os.environ.get('PROJECT_ID')
 BQ_DATASET = os.environ.get('BQ_DATASET', 'brand_health_raw')
 VERTEX_LOCATION = os.environ.get('VERTEX_LOCATION', 'us-central1')
 
+# Packed prompts: many records share one copy of the instructions and taxonomy per Gemini request
+NLP_PACKED_PROMPTS = os.environ.get('NLP_PACKED_PROMPTS', 'true').lower() == 'true'
+NLP_PROMPT_TOKEN_BUDGET = int(os.environ.get('NLP_PROMPT_TOKEN_BUDGET', '6000'))  # record text per packed prompt
+NLP_MAX_RECORDS_PER_PROMPT = int(os.environ.get('NLP_MAX_RECORDS_PER_PROMPT', '40'))
+CHARS_PER_TOKEN = 4  # rough estimate for English text
+RECORD_OVERHEAD_TOKENS = 12  # index and JSON quoting around each packed record
+OUTPUT_TOKENS_PER_RECORD = 80
+MAX_OUTPUT_TOKENS = 8192
+
+# Concurrent Vertex AI calls: at most NLP_MAX_CONCURRENCY in flight, 429/5xx retried with jittered backoff
+NLP_MAX_CONCURRENCY = int(os.environ.get('NLP_MAX_CONCURRENCY', '8'))
+NLP_MAX_RETRIES = int(os.environ.get('NLP_MAX_RETRIES', '5'))
+NLP_RETRY_BASE_SECONDS = float(os.environ.get('NLP_RETRY_BASE_SECONDS', '1.0'))
+NLP_RETRY_MAX_SECONDS = float(os.environ.get('NLP_RETRY_MAX_SECONDS', '32'))
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Result cache keyed by (sha256(cleaned text), NLP_MODEL, NLP_VERSION, prompt version); bump NLP_VERSION to re-analyze
+NLP_MODEL_NAME = 'gemini-1.5-flash'
+NLP_MODEL = f"vertex-ai-{NLP_MODEL_NAME}"
+NLP_VERSION = os.environ.get('NLP_VERSION', 'v1.0')
+NLP_CACHE_BACKEND = os.environ.get('NLP_CACHE_BACKEND', 'none')  # bigquery, gcs, sqlite or none
+NLP_CACHE_SQLITE_PATH = os.environ.get('NLP_CACHE_SQLITE_PATH', '/tmp/nlp_cache.db')
+NLP_CACHE_BUCKET = os.environ.get('NLP_CACHE_BUCKET', os.environ.get('GCS_BUCKET', 'brand-health-raw-data'))
+
 # Initialize Vertex AI
 vertexai.init(project=PROJECT_ID, location=VERTEX_LOCATION)
 
@@ -39,7 +70,7 @@ class NLPEnricher:
     """NLP enrichment using Vertex AI Gemini"""
     
     def __init__(self):
-        self.model = GenerativeModel("gemini-1.5-flash")
+        self.model = GenerativeModel(NLP_MODEL_NAME)
         self.bq_client = bigquery.Client()
         
         # Safety settings for financial content
@@ -53,71 +84,192 @@ class NLPEnricher:
                 threshold=SafetySetting.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE
             ),
         ]
+        
+        self.stats = {'requests': 0, 'retries': 0, 'packed_requests': 0, 'packed_records': 0,
+                      'individual_retries': 0, 'duplicates': 0}
+        self._stats_lock = threading.Lock()  # analyses run on NLP_MAX_CONCURRENCY threads
+        
+        # Editing either prompt changes the cache key, like bumping NLP_VERSION
+        self.prompt_version = hashlib.sha256(
+            (self._create_analysis_prompt('') + self._create_batch_prompt([])).encode('utf-8')
+        ).hexdigest()[:12]
+        self.cache = self._create_cache()
+    
+    def _create_cache(self):
+        return create_nlp_cache(
+            NLP_CACHE_BACKEND, NLP_MODEL, NLP_VERSION, self.prompt_version,
+            sqlite_path=NLP_CACHE_SQLITE_PATH, bq_client=self.bq_client, project_id=PROJECT_ID,
+            dataset_id=BQ_DATASET, bucket_name=NLP_CACHE_BUCKET
+        )
     
     def analyze_text_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
-        """Analyze a batch of texts for sentiment, severity, and topics"""
-        results = []
+        """
+        Analyze a batch of texts for sentiment, severity, and topics
+        With NLP_PACKED_PROMPTS, cleaned texts are packed into as few prompts as
+        NLP_PROMPT_TOKEN_BUDGET allows; texts a packed response leaves out or gets
+        wrong are retried one by one. Up to NLP_MAX_CONCURRENCY requests run at
+        once; results are in input order. Repeated texts are analyzed once, and texts
+        already in the result cache are not sent at all.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+        pending = []  # (position, cleaned text) worth a model call
+        first_positions = {}  # cleaned text -> first position it appears at
+        duplicates = {}  # position -> first position with the same cleaned text
+        for position, text in enumerate(texts):
+            cleaned_text = self._clean_text(text)
+            if len(cleaned_text.strip()) < 10:
+                results[position] = self._empty_analysis()
+            elif cleaned_text in first_positions:
+                duplicates[position] = first_positions[cleaned_text]
+            else:
+                first_positions[cleaned_text] = position
+                pending.append((position, cleaned_text))
+        self._count('duplicates', len(duplicates))
         
-        for text in texts:
-            try:
-                analysis = self._analyze_single_text(text)
-                results.append(analysis)
-            except Exception as e:
-                logger.error(f"Error analyzing text: {e}")
-                # Return default values on error
-                results.append({
-                    'sentiment': 0.0,
-                    'severity': 0.0,
-                    'topics': [],
-                    'language': 'en',
-                    'confidence': 0.0,
-                    'error': str(e)
-                })
+        for position, analysis in analyze_with_cache(self.cache, pending, self._analyze_pending).items():
+            results[position] = analysis
+        for position, first_position in duplicates.items():
+            results[position] = results[first_position]
         
+        cache_note = f", {self.cache.describe()}" if self.cache is not None else ''
+        logger.info(f"Analyzed {len(texts)} texts with {self.stats['requests']} Vertex AI requests "
+                    f"({self.stats['packed_requests']} packed, {self.stats['individual_retries']} individual retries, "
+                    f"{self.stats['retries']} backoff retries, {self.stats['duplicates']} duplicates{cache_note})")
         return results
     
+    def _analyze_pending(self, pending: List[Tuple[int, str]]) -> Dict[int, Tuple[Dict[str, Any], bool]]:
+        """Model analyses for (position, cleaned text) pairs as {position: (analysis, from_model)}"""
+        answered = {}
+        retry = pending  # (position, cleaned text) to analyze on its own
+        if NLP_PACKED_PROMPTS:
+            groups = self._pack_texts(pending)
+            retry = []
+            for group, analyses in zip(groups, self._map_concurrently(self._analyze_group, groups)):
+                for (position, cleaned_text), analysis in zip(group, analyses):
+                    if analysis is None:
+                        retry.append((position, cleaned_text))
+                    else:
+                        answered[position] = (analysis, True)
+        individual = self._map_concurrently(self._analyze_individually, [cleaned_text for _, cleaned_text in retry])
+        for (position, _), result in zip(retry, individual):
+            answered[position] = result
+        return answered
+    
+    def _map_concurrently(self, func, items: list) -> list:
+        """func over items on up to NLP_MAX_CONCURRENCY threads; results in input order"""
+        if len(items) <= 1 or NLP_MAX_CONCURRENCY <= 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(NLP_MAX_CONCURRENCY, len(items))) as executor:
+            return list(executor.map(func, items))
+    
+    def _count(self, stat: str, amount: int = 1):
+        with self._stats_lock:
+            self.stats[stat] += amount
+    
+    def _generate(self, prompt: str, max_output_tokens: int) -> str:
+        """One generate_content call, retried with jittered exponential backoff on 429 and 5xx"""
+        for attempt in range(NLP_MAX_RETRIES + 1):
+            self._count('requests')
+            try:
+                response = self.model.generate_content(
+                    prompt,
+                    safety_settings=self.safety_settings,
+                    generation_config={
+                        "temperature": 0.1,
+                        "top_p": 0.8,
+                        "top_k": 40,
+                        "max_output_tokens": max_output_tokens,
+                    }
+                )
+                return response.text
+            except Exception as e:
+                status = getattr(e, 'code', None)
+                if attempt >= NLP_MAX_RETRIES or status not in RETRYABLE_STATUS_CODES:
+                    raise
+                delay = min(NLP_RETRY_MAX_SECONDS, NLP_RETRY_BASE_SECONDS * (2 ** attempt)) * random.uniform(0.5, 1.5)
+                self._count('retries')
+                logger.warning(f"Vertex AI returned {status}, retrying in {delay:.1f}s "
+                               f"(attempt {attempt + 1}/{NLP_MAX_RETRIES})")
+                time.sleep(delay)
+    
+    def _analyze_text_safely(self, text: str) -> Dict[str, Any]:
+        try:
+            return self._analyze_single_text(text)
+        except Exception as e:
+            logger.error(f"Error analyzing text: {e}")
+            # Return default values on error
+            return dict(self._empty_analysis(), error=str(e))
+    
+    @staticmethod
+    def _empty_analysis() -> Dict[str, Any]:
+        return {
+            'sentiment': 0.0,
+            'severity': 0.0,
+            'topics': [],
+            'language': 'en',
+            'confidence': 0.0
+        }
+    
+    def _pack_texts(self, pending: List[Tuple[int, str]]) -> List[List[Tuple[int, str]]]:
+        """Split (position, cleaned text) pairs, in order, into groups that fit one packed prompt"""
+        groups, group, group_tokens = [], [], 0
+        for item in pending:
+            tokens = len(item[1]) // CHARS_PER_TOKEN + RECORD_OVERHEAD_TOKENS
+            if group and (group_tokens + tokens > NLP_PROMPT_TOKEN_BUDGET or len(group) >= NLP_MAX_RECORDS_PER_PROMPT):
+                groups.append(group)
+                group, group_tokens = [], 0
+            group.append(item)
+            group_tokens += tokens
+        if group:
+            groups.append(group)
+        return groups
+    
+    def _analyze_group(self, group: List[Tuple[int, str]]) -> List[Optional[Dict[str, Any]]]:
+        """Packed analysis of a group; a lone text goes straight to the single-text path"""
+        if len(group) == 1:
+            return [None]
+        analyses = self._analyze_packed([cleaned_text for _, cleaned_text in group])
+        self._count('individual_retries', analyses.count(None))
+        return analyses
+    
+    def _analyze_packed(self, texts: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """Analyze several cleaned texts in one request; None marks texts to retry on their own"""
+        prompt = self._create_batch_prompt(texts)
+        self._count('packed_requests')
+        self._count('packed_records', len(texts))
+        try:
+            response_text = self._generate(prompt, min(MAX_OUTPUT_TOKENS, OUTPUT_TOKENS_PER_RECORD * len(texts) + 50))
+            return self._parse_batch_response(response_text, len(texts))
+        except Exception as e:
+            logger.error(f"Vertex AI packed request for {len(texts)} texts failed: {e}")
+            return [None] * len(texts)
+    
     def _analyze_single_text(self, text: str) -> Dict[str, Any]:
         """Analyze single text using Vertex AI Gemini"""
         
         # Clean text
         cleaned_text = self._clean_text(text)
         if len(cleaned_text.strip()) < 10:
-            return {
-                'sentiment': 0.0,
-                'severity': 0.0,
-                'topics': [],
-                'language': 'en',
-                'confidence': 0.0
-            }
+            return self._empty_analysis()
         
+        return self._analyze_individually(cleaned_text)[0]
+    
+    def _analyze_individually(self, text: str) -> Tuple[Dict[str, Any], bool]:
+        """Single-text request for a cleaned text: (analysis, whether it is a model answer worth caching)"""
         # Create analysis prompt
-        prompt = self._create_analysis_prompt(cleaned_text)
+        prompt = self._create_analysis_prompt(text)
         
         try:
-            response = self.model.generate_content(
-                prompt,
-                safety_settings=self.safety_settings,
-                generation_config={
-                    "temperature": 0.1,
-                    "top_p": 0.8,
-                    "top_k": 40,
-                    "max_output_tokens": 200,
-                }
-            )
-            
-            # Parse response
-            return self._parse_gemini_response(response.text)
-            
+            response_text = self._generate(prompt, 200)
         except Exception as e:
             logger.error(f"Vertex AI API error: {e}")
-            return {
-                'sentiment': 0.0,
-                'severity': 0.0,
-                'topics': [],
-                'language': 'en',
-                'confidence': 0.0,
-                'error': str(e)
-            }
+            return dict(self._empty_analysis(), error=str(e)), False
+        
+        try:
+            return self._parse_gemini_response(response_text), True
+        except Exception as e:
+            logger.error(f"Error parsing Gemini response: {e}")
+            return self._empty_analysis(), False
     
     def _clean_text(self, text: str) -> str:
         """Clean text for analysis"""
@@ -153,35 +305,77 @@ Rules:
 
 Return only valid JSON, no other text."""
     
+    def _create_batch_prompt(self, texts: List[str]) -> str:
+        """Create one analysis prompt covering several texts, keyed by index"""
+        topics_str = ", ".join(FINANCIAL_TOPICS)
+        records = json.dumps([{'index': i, 'text': text} for i, text in enumerate(texts)], ensure_ascii=False)
+        
+        return f"""Analyze each of these financial service texts for sentiment, severity, and topics.
+
+Records (JSON array of {{"index", "text"}}):
+{records}
+
+Provide one analysis per record, as a JSON array in this exact format:
+[
+  {{
+    "index": <index of the record>,
+    "sentiment": <float between -1.0 and 1.0, where -1=very negative, 0=neutral, 1=very positive>,
+    "severity": <float between 0.0 and 1.0, where 0=minor issue, 1=critical issue>,
+    "topics": <array of relevant topics from: {topics_str}>,
+    "language": "en",
+    "confidence": <float between 0.0 and 1.0 indicating analysis confidence>
+  }}
+]
+
+Rules:
+- sentiment: -1.0 to 1.0 (negative to positive)
+- severity: 0.0 to 1.0 (minor to critical issues)
+- topics: max 3 most relevant topics from the list
+- confidence: how certain you are about the analysis
+- analyze every record on its own; one record must not influence another
+
+Return only the JSON array with exactly {len(texts)} objects, no other text."""
+    
+    def _parse_batch_response(self, response_text: str, count: int) -> List[Optional[Dict[str, Any]]]:
+        """Map a packed response back to record positions; unusable or missing entries stay None"""
+        results: List[Optional[Dict[str, Any]]] = [None] * count
+        # Each analysis is a flat object, so complete ones survive a truncated or wrapped array
+        for match in re.finditer(r'\{[^{}]*\}', response_text):
+            try:
+                result = json.loads(match.group())
+                index = int(result['index'])
+                if 0 <= index < count and results[index] is None:
+                    results[index] = self._normalize_analysis(result)
+            except Exception:
+                continue
+        missing = results.count(None)
+        if missing:
+            logger.warning(f"Packed Gemini response missing or malformed for {missing}/{count} records")
+        return results
+    
+    def _normalize_analysis(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate and clamp one parsed analysis"""
+        topics = result.get('topics', [])
+        if not isinstance(topics, list):
+            raise ValueError(f"topics is not a list: {topics!r}")
+        return {
+            'sentiment': max(-1.0, min(1.0, float(result.get('sentiment', 0.0)))),
+            'severity': max(0.0, min(1.0, float(result.get('severity', 0.0)))),
+            'topics': topics[:3],  # Max 3 topics
+            'language': result.get('language', 'en'),
+            'confidence': max(0.0, min(1.0, float(result.get('confidence', 0.5))))
+        }
+    
     def _parse_gemini_response(self, response_text: str) -> Dict[str, Any]:
-        """Parse Gemini response into structured data"""
-        try:
-            # Extract JSON from response
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group()
-                result = json.loads(json_str)
-                
-                # Validate and clean result
-                return {
-                    'sentiment': max(-1.0, min(1.0, float(result.get('sentiment', 0.0)))),
-                    'severity': max(0.0, min(1.0, float(result.get('severity', 0.0)))),
-                    'topics': result.get('topics', [])[:3],  # Max 3 topics
-                    'language': result.get('language', 'en'),
-                    'confidence': max(0.0, min(1.0, float(result.get('confidence', 0.5))))
-                }
-            else:
-                raise ValueError("No JSON found in response")
-                
-        except Exception as e:
-            logger.error(f"Error parsing Gemini response: {e}")
-            return {
-                'sentiment': 0.0,
-                'severity': 0.0,
-                'topics': [],
-                'language': 'en',
-                'confidence': 0.0
-            }
+        """Parse Gemini response into structured data; raises if it holds no usable analysis"""
+        # Extract JSON from response
+        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+        if not json_match:
+            raise ValueError("No JSON found in response")
+        result = json.loads(json_match.group())
+        
+        # Validate and clean result
+        return self._normalize_analysis(result)
 
 def enrich_reddit_records(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """Enrich Reddit records with NLP analysis"""
@@ -210,8 +404,8 @@ def enrich_reddit_records(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]
             'topics': analysis['topics'],
             'language': analysis['language'],
             'nlp_confidence': analysis['confidence'],
-            'nlp_model': 'vertex-ai-gemini-1.5-flash',
-            'nlp_version': 'v1.0',
+            'nlp_model': NLP_MODEL,
+            'nlp_version': NLP_VERSION,
             'nlp_processed_at': datetime.utcnow().isoformat() + 'Z'
         })
         
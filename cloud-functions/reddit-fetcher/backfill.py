@@ -0,0 +1,275 @@
+"""
+Time-sliced historical backfill for Reddit
+Splits a date range into fixed time slices per subreddit and fetches the
+subreddits in parallel worker processes that draw from one shared Reddit rate
+limit. Slices write to the usual raw/reddit/dt=YYYY-MM-DD partitions and are
+marked done in a manifest under manifests/reddit/backfill/{backfill_id}/, so
+rerunning the same command skips finished slices. Ingestion cursors are never touched.
+
+Reddit search has no date-range filter, so each worker takes one subreddit,
+pages every packed query newest-first down to the oldest pending slice once and
+buckets the hits into slices by created_utc. A query that fills the ~1000-result
+search depth is split by term; slices older than what a single term could still
+reach are written with what was found but left pending (reported as truncated,
+exit status 1) instead of being marked done.
+
+Usage: python backfill.py --start 2024-01-01 --end 2024-07-01 [--slice-hours 24] [--workers 4]
+"""
+
+import os
+import sys
+import json
+import hashlib
+import logging
+import argparse
+import functools
+import multiprocessing
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Set
+
+from google.cloud import storage
+
+from main import (IdempotentRedditFetcher, RELEVANT_SUBREDDITS, BUCKET_NAME, FANOUT_MANIFEST_PREFIX,
+                  REDDIT_REQUESTS_PER_MINUTE, REDDIT_RATE_BURST, all_brand_terms)
+from rate_limiter import SharedTokenBucket
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_WORKERS = int(os.environ.get('BACKFILL_WORKERS', '4'))
+BACKFILL_SLICE_HOURS = int(os.environ.get('BACKFILL_SLICE_HOURS', '24'))
+BACKFILL_MANIFEST_PREFIX = os.environ.get('BACKFILL_MANIFEST_PREFIX', f"{FANOUT_MANIFEST_PREFIX}/backfill")
+BACKFILL_NLP_ENABLED = os.environ.get('BACKFILL_NLP_ENABLED', 'true').lower() == 'true'
+
+
+def plan_slices(subreddits: List[str], start: datetime, end: datetime, slice_hours: int) -> List[Dict[str, Any]]:
+    """Cut [start, end) into slice_hours slices per subreddit, newest first"""
+    slices = []
+    slice_end = end
+    while slice_end > start:
+        slice_start = max(start, slice_end - timedelta(hours=slice_hours))
+        for subreddit_name in subreddits:
+            slices.append({
+                'slice_id': f"{subreddit_name.lower()}-{slice_start:%Y%m%dT%H%M}",
+                'subreddit': subreddit_name,
+                'start': slice_start.isoformat() + 'Z',
+                'end': slice_end.isoformat() + 'Z'
+            })
+        slice_end = slice_start
+    return slices
+
+
+def make_backfill_id(subreddits: List[str], start: datetime, end: datetime, slice_hours: int) -> str:
+    """Same range, subreddits and slicing give the same id, so a rerun finds its manifest"""
+    key = json.dumps([sorted(name.lower() for name in subreddits), start.isoformat(), end.isoformat(), slice_hours])
+    return f"{start:%Y%m%d}-{end:%Y%m%d}-{hashlib.sha256(key.encode('utf-8')).hexdigest()[:8]}"
+
+
+def _timestamp(iso: str) -> float:
+    return datetime.fromisoformat(iso.replace('Z', '+00:00')).timestamp()
+
+
+class BackfillManifest:
+    """plan.json and one slices/{slice_id}.json per finished slice under {prefix}/{backfill_id}"""
+
+    def __init__(self, storage_client: storage.Client, bucket_name: str, backfill_id: str,
+                 manifest_prefix: str = BACKFILL_MANIFEST_PREFIX):
+        self.bucket = storage_client.bucket(bucket_name)
+        self.backfill_id = backfill_id
+        self.base_path = f"{manifest_prefix}/{backfill_id}"
+
+    def record_plan(self, plan: Dict[str, Any]):
+        self.bucket.blob(f"{self.base_path}/plan.json").upload_from_string(
+            json.dumps(plan), content_type='application/json'
+        )
+
+    def completed(self) -> Set[str]:
+        """Slice ids already marked done"""
+        prefix = f"{self.base_path}/slices/"
+        return {blob.name[len(prefix):-len('.json')] for blob in self.bucket.list_blobs(prefix=prefix)}
+
+    def record_slice(self, entry: Dict[str, Any]):
+        self.bucket.blob(f"{self.base_path}/slices/{entry['slice_id']}.json").upload_from_string(
+            json.dumps(entry), content_type='application/json'
+        )
+
+
+# One fetcher per worker process, built by _init_worker
+_worker_fetcher: Optional[IdempotentRedditFetcher] = None
+_worker_nlp_enabled = BACKFILL_NLP_ENABLED
+
+
+def _init_worker(rate_limiter: SharedTokenBucket, nlp_enabled: bool):
+    global _worker_fetcher, _worker_nlp_enabled
+    logging.basicConfig(level=logging.INFO, format='%(processName)s %(levelname)s %(message)s')
+    _worker_fetcher = IdempotentRedditFetcher()
+    _worker_fetcher.rate_limiter = rate_limiter  # every process draws from the same budget
+    # The forest index is one unmerged blob; concurrent processes would overwrite each other
+    _worker_fetcher.comment_index = None
+    _worker_nlp_enabled = nlp_enabled
+
+
+def run_subreddit(slices: List[Dict[str, Any]], brand_terms: List[str], backfill_id: str,
+                  manifest_prefix: str = BACKFILL_MANIFEST_PREFIX) -> List[Dict[str, Any]]:
+    """
+    Search one subreddit's pending slices in a single pass, then write and mark them one by one (runs in a worker process)
+    Each packed query pages down to the oldest pending slice once and the hits are
+    bucketed into slices by created_utc, so older slices cost no extra searches.
+    Output is flushed and the seen index saved before a slice is marked, so a crash at
+    any point leaves the slice to be redone by the next run. A slice older than what
+    search could reach keeps what was found but is never marked done.
+    """
+    fetcher = _worker_fetcher
+    subreddit_name = slices[0]['subreddit']
+    requests_before = fetcher.request_count
+    try:
+        submissions, complete_since = fetcher.search_time_range(
+            subreddit_name, brand_terms, min(_timestamp(time_slice['start']) for time_slice in slices),
+            max(_timestamp(time_slice['end']) for time_slice in slices)
+        )
+    except Exception as e:
+        logger.error(f"Search of r/{subreddit_name} failed: {e}")
+        return [dict(time_slice, status='failed', error=str(e), requests=fetcher.request_count - requests_before)
+                for time_slice in slices]
+
+    entries = []
+    for time_slice in sorted(slices, key=lambda time_slice: time_slice['start'], reverse=True):
+        entries.append(_write_slice(fetcher, time_slice, submissions, complete_since, brand_terms,
+                                    backfill_id, manifest_prefix, requests_before))
+        requests_before = fetcher.request_count
+    return entries
+
+
+def _write_slice(fetcher: IdempotentRedditFetcher, time_slice: Dict[str, Any], submissions: list,
+                 complete_since: float, brand_terms: List[str], backfill_id: str, manifest_prefix: str,
+                 requests_before: int) -> Dict[str, Any]:
+    """Load comments for one slice's hits, write its new messages and mark it done if search reached its start"""
+    entry = dict(time_slice)
+    try:
+        start = _timestamp(time_slice['start'])
+        messages = fetcher.fetch_time_slice(time_slice['subreddit'], submissions, brand_terms,
+                                            start, _timestamp(time_slice['end']))
+        fetched = len(messages)
+        seen_index = fetcher.seen_index
+        if seen_index is not None:
+            fresh = []
+            for message in messages:
+                if not seen_index.check(message['event_id'], message['content_hash'], message['ts_event']):
+                    seen_index.record(message['event_id'], message['content_hash'], message['ts_event'])
+                    fresh.append(message)
+            messages = fresh
+
+        files = []
+        if messages:
+            if _worker_nlp_enabled:
+                messages = fetcher._enrich_with_nlp(messages)
+            sink = fetcher.create_output_sink(f"backfill-{time_slice['slice_id']}")
+            sink.write_all(messages)
+            files = sink.close()
+            if seen_index is not None:
+                seen_index.save()
+
+        truncated = start < complete_since
+        entry.update({
+            'backfill_id': backfill_id,
+            'status': 'truncated' if truncated else 'done',
+            'messages': len(messages),
+            'already_seen': fetched - len(messages),
+            'requests': fetcher.request_count - requests_before,
+            'files': files,
+            'completed_at': datetime.utcnow().isoformat() + 'Z'
+        })
+        if truncated:
+            # Marking it done would hide the gap; it stays pending for a narrower rerun or another source
+            entry['complete_since'] = datetime.utcfromtimestamp(complete_since).isoformat() + 'Z'
+            logger.error(f"Slice {time_slice['slice_id']} starts before {entry['complete_since']}, the oldest post "
+                         f"search reached in r/{time_slice['subreddit']}; not marking it done")
+        else:
+            BackfillManifest(fetcher.storage_client, BUCKET_NAME, backfill_id, manifest_prefix).record_slice(entry)
+        return entry
+    except Exception as e:
+        logger.error(f"Slice {time_slice['slice_id']} failed: {e}")
+        entry.update({'status': 'failed', 'error': str(e),
+                      'requests': fetcher.request_count - requests_before})
+        return entry
+
+
+def run_backfill(subreddits: List[str], start: datetime, end: datetime, slice_hours: int = BACKFILL_SLICE_HOURS,
+                 workers: int = BACKFILL_WORKERS, nlp_enabled: bool = BACKFILL_NLP_ENABLED,
+                 backfill_id: Optional[str] = None, requests_per_minute: float = REDDIT_REQUESTS_PER_MINUTE,
+                 manifest_prefix: str = BACKFILL_MANIFEST_PREFIX) -> Dict[str, Any]:
+    """Plan the slices, skip the ones already done and fetch the rest across worker processes"""
+    backfill_id = backfill_id or make_backfill_id(subreddits, start, end, slice_hours)
+    manifest = BackfillManifest(storage.Client(), BUCKET_NAME, backfill_id, manifest_prefix)
+    slices = plan_slices(subreddits, start, end, slice_hours)
+    done = manifest.completed()
+    todo = [time_slice for time_slice in slices if time_slice['slice_id'] not in done]
+    manifest.record_plan({
+        'backfill_id': backfill_id,
+        'created_at': datetime.utcnow().isoformat() + 'Z',
+        'start': start.isoformat() + 'Z',
+        'end': end.isoformat() + 'Z',
+        'slice_hours': slice_hours,
+        'subreddits': subreddits,
+        'slice_count': len(slices)
+    })
+    logger.info(f"Backfill {backfill_id}: {len(slices)} slices, {len(done)} already done, "
+                f"{len(todo)} to fetch with {workers} workers")
+
+    summary = {'backfill_id': backfill_id, 'slices': len(slices), 'skipped': len(slices) - len(todo),
+               'done': 0, 'failed': [], 'truncated': [], 'messages': 0, 'files': 0}
+    if not todo:
+        return summary
+
+    # spawn: worker processes must not inherit the parent's gRPC/HTTP client state
+    context = multiprocessing.get_context('spawn')
+    rate_limiter = SharedTokenBucket(requests_per_minute, capacity=REDDIT_RATE_BURST, context=context)
+    by_subreddit = {}
+    for time_slice in todo:
+        by_subreddit.setdefault(time_slice['subreddit'], []).append(time_slice)
+    task = functools.partial(run_subreddit, brand_terms=all_brand_terms(), backfill_id=backfill_id,
+                             manifest_prefix=manifest_prefix)
+    with context.Pool(min(workers, len(by_subreddit)), initializer=_init_worker,
+                      initargs=(rate_limiter, nlp_enabled)) as pool:
+        for entries in pool.imap_unordered(task, by_subreddit.values()):
+            for entry in entries:
+                summary['messages'] += entry.get('messages', 0)
+                summary['files'] += len(entry.get('files', []))
+                if entry['status'] == 'failed':
+                    summary['failed'].append(entry['slice_id'])
+                    continue
+                if entry['status'] == 'truncated':
+                    summary['truncated'].append(entry['slice_id'])
+                    continue
+                summary['done'] += 1
+                logger.info(f"[{summary['skipped'] + summary['done']}/{len(slices)}] {entry['slice_id']}: "
+                            f"{entry['messages']} messages, {entry['requests']} requests")
+    summary['rate_limit'] = rate_limiter.stats()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time-sliced parallel Reddit backfill')
+    parser.add_argument('--start', required=True, help='first day to backfill (YYYY-MM-DD, UTC)')
+    parser.add_argument('--end', help='day after the last one to backfill (YYYY-MM-DD, UTC; default: today)')
+    parser.add_argument('--slice-hours', type=int, default=BACKFILL_SLICE_HOURS)
+    parser.add_argument('--workers', type=int, default=BACKFILL_WORKERS)
+    parser.add_argument('--subreddits', help='comma-separated subreddits (default: RELEVANT_SUBREDDITS)')
+    parser.add_argument('--backfill-id', help='manifest id (default: derived from the range, subreddits and slicing)')
+    parser.add_argument('--no-nlp', action='store_true', help='skip NLP enrichment')
+    args = parser.parse_args()
+
+    start = datetime.strptime(args.start, '%Y-%m-%d')
+    end = datetime.strptime(args.end, '%Y-%m-%d') if args.end else datetime.utcnow().replace(
+        hour=0, minute=0, second=0, microsecond=0)
+    if end <= start:
+        parser.error('--end must be after --start')
+    subreddits = args.subreddits.split(',') if args.subreddits else RELEVANT_SUBREDDITS
+
+    summary = run_backfill(subreddits, start, end, slice_hours=args.slice_hours, workers=args.workers,
+                           nlp_enabled=BACKFILL_NLP_ENABLED and not args.no_nlp, backfill_id=args.backfill_id)
+    print(json.dumps(summary, indent=2))
+    sys.exit(1 if summary['failed'] or summary['truncated'] else 0)
+
+
+if __name__ == '__main__':
+    main()
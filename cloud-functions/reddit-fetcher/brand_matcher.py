@@ -0,0 +1,80 @@
+"""
+Multi-pattern brand matcher
+Aho-Corasick automaton over lowercased brand terms so each text is scanned once,
+regardless of how many brands or terms are tracked
+"""
+
+from collections import deque
+from typing import Dict, List, Tuple, Iterator
+
+
+class BrandMatcher:
+    """Aho-Corasick automaton compiled from a {brand_id: [terms]} dictionary"""
+
+    def __init__(self, brands: Dict[str, List[str]]):
+        self.brand_order = list(brands.keys())
+
+        # One entry per original term (duplicates kept so scoring matches the
+        # per-term scan): (brand_id, term_index, term)
+        self.terms: List[Tuple[str, int, str]] = []
+
+        # Automaton tables: goto transitions, failure links, outputs
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[int, int]]] = [[]]  # (pattern length, term entry index)
+
+        for brand_id, terms in brands.items():
+            for term_index, term in enumerate(terms):
+                entry_index = len(self.terms)
+                self.terms.append((brand_id, term_index, term))
+                self._add_pattern(term.lower(), entry_index)
+
+        self._build_failure_links()
+
+    def _add_pattern(self, pattern: str, entry_index: int):
+        """Insert a lowercased pattern into the trie"""
+        if not pattern:
+            return
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = next_state
+            state = next_state
+        self._output[state].append((len(pattern), entry_index))
+
+    def _build_failure_links(self):
+        """Breadth-first construction of failure links and merged outputs"""
+        queue = deque()
+        for next_state in self._goto[0].values():
+            self._fail[next_state] = 0
+            queue.append(next_state)
+
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def iter_matches(self, text_lower: str) -> Iterator[Tuple[int, int]]:
+        """Yield (start position, term entry index) for every occurrence in a lowercased text"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        state = 0
+
+        for index, char in enumerate(text_lower):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                for pattern_length, entry_index in output[state]:
+                    yield index - pattern_length + 1, entry_index
@@ -0,0 +1,189 @@
+"""
+Durable run checkpoints for the Reddit fetcher
+Progress (completed subreddit batches, completed query batches within the
+current subreddit batch, closed output parts and staged cursors) is saved to
+a GCS object so a retried invocation resumes where the previous one stopped
+"""
+
+import json
+import hashlib
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from google.cloud import storage
+from google.api_core import exceptions as gcp_exceptions
+
+logger = logging.getLogger(__name__)
+
+
+class RunCheckpoint:
+    """
+    Progress record for one fetch run, stored at {prefix}/{run_key}.json
+    Submission IDs already handled are appended as small segments under
+    {prefix}/{run_key}/seen/ so each save only uploads the IDs that are new
+    """
+
+    def __init__(self, storage_client: storage.Client, bucket_name: str, run_key: str,
+                 prefix: str = 'state/reddit/checkpoints'):
+        self.run_key = run_key
+        self.bucket = storage_client.bucket(bucket_name)
+        self.blob = self.bucket.blob(f"{prefix}/{run_key}.json")
+        self.seen_prefix = f"{prefix}/{run_key}/seen"
+        self.data = self._fresh()
+        self.resumed = False
+
+    @staticmethod
+    def derive_run_key(params: Dict[str, Any]) -> str:
+        """Stable key for a request body, so retries of the same request map to the same checkpoint"""
+        payload = json.dumps(params, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+    def _fresh(self) -> Dict[str, Any]:
+        now = datetime.utcnow().isoformat() + 'Z'
+        return {
+            'run_key': self.run_key,
+            'status': 'in_progress',
+            'created_at': now,
+            'updated_at': now,
+            'updated_at_epoch': time.time(),
+            'run_timestamp': None,
+            'completed_batches': [],
+            'current_batch': None,  # {'label', 'queries_hash', 'completed_queries', 'windows'}
+            'scan_plan': None,  # listing-scan groups and term-search subreddits chosen at the start
+            'pending_cursors': {},
+            'seen_segments': 0,  # number of {run_key}/seen/ segments that belong to this checkpoint
+            'unsaved_events': {},  # seen-event index records not yet persisted (current batch)
+            'files': [],
+            'progress': {'total_messages': 0, 'messages_by_subreddit': {}, 'subreddits_processed': 0},
+            'summary': {}
+        }
+
+    def load(self, ttl_seconds: int) -> Optional[Dict[str, Any]]:
+        """Load an existing checkpoint younger than ttl_seconds; returns it or None to start fresh"""
+        try:
+            data = json.loads(self.blob.download_as_bytes())
+        except gcp_exceptions.NotFound:
+            return None
+        except Exception as e:
+            logger.warning(f"Could not load checkpoint {self.run_key}: {e}")
+            return None
+
+        if time.time() - data.get('updated_at_epoch', 0) > ttl_seconds:
+            logger.info(f"Checkpoint {self.run_key} is stale, starting a new run")
+            return None
+        return data
+
+    def resume_from(self, data: Dict[str, Any]):
+        self.data = data
+        self.resumed = True
+        logger.info(f"Resuming run {self.run_key}: {len(data['completed_batches'])} batches done, "
+                    f"{len(data['files'])} files already written")
+
+    @property
+    def is_complete(self) -> bool:
+        return self.data['status'] == 'complete'
+
+    def batch_done(self, label: str) -> bool:
+        return label in self.data['completed_batches']
+
+    def batch_resume_point(self, label: str, queries_hash: str) -> Optional[Dict[str, Any]]:
+        """Progress inside a partially processed batch, if it was planned with the same queries"""
+        current = self.data.get('current_batch')
+        if current and current['label'] == label and current['queries_hash'] == queries_hash:
+            return current
+        return None
+
+    def record_query_batch(self, label: str, queries_hash: str, completed_queries: int,
+                           windows: Dict[str, Dict[str, Any]], unsaved_events: Optional[Dict[str, Any]] = None):
+        """Record that the first completed_queries query batches of a subreddit batch are done (call save after)"""
+        self.data['current_batch'] = {
+            'label': label,
+            'queries_hash': queries_hash,
+            'completed_queries': completed_queries,
+            'windows': windows
+        }
+        self.data['unsaved_events'] = unsaved_events or {}
+
+    def record_batch_complete(self, label: str, pending_cursors: Dict[str, Any]):
+        self.data['completed_batches'].append(label)
+        self.data['current_batch'] = None
+        self.data['unsaved_events'] = {}
+        self.data['pending_cursors'] = pending_cursors
+
+    def _seen_blob(self, segment: int) -> storage.Blob:
+        return self.bucket.blob(f"{self.seen_prefix}/{segment:06d}.json")
+
+    def add_seen_submissions(self, submission_ids: List[str]):
+        """
+        Upload submissions handled since the last save as the next segment; it only
+        counts once save records the new segment total, so a crash in between leaves
+        an orphan that the next call overwrites
+        """
+        if not submission_ids:
+            return
+        segment = self.data.get('seen_segments', 0)
+        self._seen_blob(segment).upload_from_string(json.dumps(submission_ids), content_type='application/json')
+        self.data['seen_segments'] = segment + 1
+
+    def seen_submissions(self) -> List[str]:
+        """Every submission ID recorded by the saved segments"""
+        submission_ids = list(self.data.get('seen_submissions', []))  # checkpoints written before segments
+        for segment in range(self.data.get('seen_segments', 0)):
+            submission_ids.extend(json.loads(self._seen_blob(segment).download_as_bytes()))
+        return submission_ids
+
+    def mark_complete(self, summary: Dict[str, Any]):
+        segments = self.data.get('seen_segments', 0)
+        self.data['status'] = 'complete'
+        self.data['summary'] = summary
+        self.data['seen_segments'] = 0
+        self.data.pop('seen_submissions', None)
+        self.save()
+        for segment in range(segments):
+            try:
+                self._seen_blob(segment).delete()
+            except gcp_exceptions.NotFound:
+                pass
+
+    def save(self, progress: Optional[Dict[str, Any]] = None):
+        """Upload the checkpoint; progress overrides the live counters with those of the committed position"""
+        self.data['updated_at'] = datetime.utcnow().isoformat() + 'Z'
+        self.data['updated_at_epoch'] = time.time()
+        data = dict(self.data, progress=progress) if progress is not None else self.data
+        self.blob.upload_from_string(json.dumps(data), content_type='application/json')
+
+
+class StreamCheckpoint:
+    """Position of the stream worker in each Reddit stream, stored in one GCS object"""
+
+    def __init__(self, storage_client: storage.Client, bucket_name: str, blob_path: str):
+        self.blob = storage_client.bucket(bucket_name).blob(blob_path)
+        self.data: Dict[str, Any] = {'streams': {}, 'files_written': 0, 'messages_written': 0}
+
+    def load(self) -> bool:
+        """Load the last saved position; False if the worker has never checkpointed"""
+        try:
+            self.data = json.loads(self.blob.download_as_bytes())
+            logger.info(f"Resuming streams from {self.data['updated_at']}")
+            return True
+        except gcp_exceptions.NotFound:
+            return False
+
+    def position(self, stream: str) -> Optional[float]:
+        """created_utc of the newest item processed from a stream"""
+        return self.data['streams'].get(stream, {}).get('created_utc')
+
+    def recent_ids(self, stream: str) -> List[str]:
+        return self.data['streams'].get(stream, {}).get('recent_ids', [])
+
+    def save(self, streams: Dict[str, Dict[str, Any]], files_written: int, messages_written: int):
+        """Record positions once everything processed up to them has been written"""
+        self.data = {
+            'streams': streams,
+            'files_written': self.data['files_written'] + files_written,
+            'messages_written': self.data['messages_written'] + messages_written,
+            'updated_at': datetime.utcnow().isoformat() + 'Z'
+        }
+        self.blob.upload_from_string(json.dumps(self.data), content_type='application/json')
@@ -0,0 +1,143 @@
+"""
+In-memory GCS and BigQuery clients for running the Reddit fetcher without credentials
+MemoryStorage keeps objects (with generation preconditions) in a dict and
+MemoryBigQuery has every table, returns no rows and accepts every insert. Used
+by the benchmark, the stream worker's --fake mode and the unit tests; pair
+with fake_reddit or the benchmark's replayed corpus for the Reddit side.
+"""
+
+import io
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from google.api_core import exceptions as gcp_exceptions
+
+
+class _MemoryWriter(io.BytesIO):
+    def __init__(self, blob: 'MemoryBlob', content_type: Optional[str]):
+        super().__init__()
+        self.blob = blob
+        self.content_type = content_type
+
+    def close(self):
+        if not self.closed:
+            self.blob.upload_from_string(self.getvalue(), content_type=self.content_type)
+        super().close()
+
+
+class MemoryBlob:
+    def __init__(self, storage: 'MemoryStorage', bucket_name: str, name: str):
+        self.storage = storage
+        self.bucket_name = bucket_name
+        self.name = name
+        self.generation: Optional[int] = None
+
+    @property
+    def _key(self) -> Tuple[str, str]:
+        return self.bucket_name, self.name
+
+    def exists(self) -> bool:
+        return self._key in self.storage.objects
+
+    def download_as_bytes(self, **kwargs) -> bytes:
+        with self.storage.lock:
+            if self._key not in self.storage.objects:
+                raise gcp_exceptions.NotFound(self.name)
+            data, self.generation = self.storage.objects[self._key]
+            self.storage.operations['read'] += 1
+            return data
+
+    def upload_from_string(self, data, content_type: Optional[str] = None, if_generation_match: Optional[int] = None,
+                           **kwargs):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        with self.storage.lock:
+            current = self.storage.objects.get(self._key, (None, 0))[1]
+            if if_generation_match is not None and if_generation_match != current:
+                raise gcp_exceptions.PreconditionFailed(self.name)
+            self.storage.generation += 1
+            self.storage.objects[self._key] = (bytes(data), self.storage.generation)
+            self.storage.operations['write'] += 1
+            self.storage.bytes_written += len(data)
+            self.generation = self.storage.generation
+
+    def open(self, mode: str = 'rb', content_type: Optional[str] = None, **kwargs):
+        if 'w' in mode:
+            return _MemoryWriter(self, content_type)
+        return io.BytesIO(self.download_as_bytes())
+
+    def delete(self):
+        with self.storage.lock:
+            self.storage.objects.pop(self._key, None)
+
+
+class MemoryBucket:
+    def __init__(self, storage: 'MemoryStorage', name: str):
+        self.storage = storage
+        self.name = name
+
+    def blob(self, name: str) -> MemoryBlob:
+        return MemoryBlob(self.storage, self.name, name)
+
+    def list_blobs(self, prefix: str = '') -> List[MemoryBlob]:
+        with self.storage.lock:
+            names = sorted(name for bucket, name in self.storage.objects if bucket == self.name and name.startswith(prefix))
+        return [self.blob(name) for name in names]
+
+
+class MemoryStorage:
+    """google.cloud.storage.Client stand-in holding objects in memory, with generation preconditions"""
+
+    def __init__(self):
+        self.objects: Dict[Tuple[str, str], Tuple[bytes, int]] = {}
+        self.generation = 0
+        self.lock = threading.RLock()
+        self.operations = {'read': 0, 'write': 0}
+        self.bytes_written = 0
+
+    def bucket(self, name: str) -> MemoryBucket:
+        return MemoryBucket(self, name)
+
+    def list_blobs(self, bucket_name: str, prefix: str = '') -> List[MemoryBlob]:
+        return self.bucket(bucket_name).list_blobs(prefix)
+
+
+class _QueryJob:
+    def result(self):
+        return []
+
+    def __iter__(self):
+        return iter([])
+
+
+class _Ref:
+    def __init__(self, *parts: str):
+        self.parts = parts
+        self.table_id = parts[-1]
+
+    def table(self, table_id: str) -> '_Ref':
+        return _Ref(*self.parts, table_id)
+
+
+class MemoryBigQuery:
+    """google.cloud.bigquery.Client stand-in: tables exist, queries return no rows, inserts succeed"""
+
+    def __init__(self):
+        self.operations = {'query': 0, 'insert': 0}
+
+    def dataset(self, dataset_id: str) -> _Ref:
+        return _Ref(dataset_id)
+
+    def get_table(self, table_ref):
+        return table_ref
+
+    def create_table(self, table):
+        return table
+
+    def query(self, query: str, job_config=None) -> _QueryJob:
+        self.operations['query'] += 1
+        return _QueryJob()
+
+    def insert_rows_json(self, table: str, rows: List[Dict[str, Any]]) -> list:
+        self.operations['insert'] += 1
+        return []
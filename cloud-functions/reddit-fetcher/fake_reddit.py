@@ -0,0 +1,165 @@
+"""
+Fake Reddit source for running the stream worker locally
+Generates submissions and comments for the requested subreddits at a steady
+rate and serves them through the parts of the PRAW API the fetcher uses:
+subreddit('a+b').stream.submissions()/comments(), .new() and .comments().
+Use with: python stream_worker.py --fake
+"""
+
+import time
+import random
+import itertools
+import threading
+from typing import Iterator, List, Optional
+
+PHRASES = [
+    'TD Bank charged me an overdraft fee twice this month',
+    'Anyone else locked out of the TD app today?',
+    'TD Canada Trust customer service was actually great',
+    'Switching my mortgage from TD to a credit union',
+    'Chase or Wells Fargo for a first checking account?',
+    'Budgeting tips for a new grad',
+    'TD Ameritrade transfer to Schwab still pending',
+    'Is a HELOC a good idea right now?',
+    'Toronto-Dominion bank froze my account with no explanation',
+    'Looking for a high-yield savings account',
+]
+
+
+class _Author:
+    def __init__(self, name: str):
+        self.name = name
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class _Subreddit:
+    def __init__(self, display_name: str):
+        self.display_name = display_name
+
+
+class FakeSubmission:
+    def __init__(self, id: str, subreddit: str, title: str, selftext: str, created_utc: float):
+        self.id = id
+        self.subreddit = _Subreddit(subreddit)
+        self.title = title
+        self.selftext = selftext
+        self.created_utc = created_utc
+        self.author = _Author(f"user_{id}")
+        self.score = 1
+        self.num_comments = 0
+        self.upvote_ratio = 1.0
+        self.url = f"https://reddit.com/r/{subreddit}/comments/{id}"
+        self.permalink = f"/r/{subreddit}/comments/{id}"
+        self.edited = False
+
+
+class FakeComment:
+    def __init__(self, id: str, subreddit: str, body: str, created_utc: float, parent_id: str):
+        self.id = id
+        self.subreddit = _Subreddit(subreddit)
+        self.body = body
+        self.created_utc = created_utc
+        self.author = _Author(f"user_{id}")
+        self.score = 1
+        self.permalink = f"/r/{subreddit}/comments/{parent_id[3:]}/_/{id}"
+        self.parent_id = parent_id
+        self.edited = False
+
+
+class FakeReddit:
+    """
+    Generates items_per_second submissions+comments (one submission per five items)
+    spread over the given subreddits, starting with history_seconds of backlog
+    """
+
+    def __init__(self, subreddits: List[str], items_per_second: float = 2.0,
+                 history_seconds: int = 3600, seed: int = 0):
+        self.subreddits = subreddits
+        self.items_per_second = items_per_second
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self.submissions: List[FakeSubmission] = []
+        self.comments: List[FakeComment] = []
+        self._generated_until = time.time() - history_seconds
+        self.requests = 0
+        self._lock = threading.Lock()  # shared by the worker's stream threads
+        self._generate()
+
+    def _generate(self):
+        """Create every item due between the last call and now"""
+        now = time.time()
+        interval = 1.0 / self.items_per_second
+        while self._generated_until + interval <= now:
+            self._generated_until += interval
+            subreddit = self._random.choice(self.subreddits)
+            item_id = f"{next(self._ids):x}"
+            text = self._random.choice(PHRASES)
+            if not self.submissions or self._random.random() < 0.2:
+                self.submissions.append(FakeSubmission(item_id, subreddit, text, '', self._generated_until))
+            else:
+                parent = self._random.choice(self.submissions[-50:])
+                parent.num_comments += 1
+                self.comments.append(FakeComment(item_id, parent.subreddit.display_name, text,
+                                                 self._generated_until, f"t3_{parent.id}"))
+
+    def _newest(self, items: list, names: set, limit: Optional[int]) -> list:
+        with self._lock:
+            self.requests += 1
+            self._generate()
+            matching = [item for item in reversed(items) if item.subreddit.display_name.lower() in names]
+        return matching[:limit or 1000]
+
+    def subreddit(self, display_name: str) -> 'FakeSubredditListing':
+        return FakeSubredditListing(self, display_name)
+
+
+class _FakeStream:
+    def __init__(self, reddit: FakeReddit, names: set, poll_seconds: float):
+        self.reddit = reddit
+        self.names = names
+        self.poll_seconds = poll_seconds
+
+    def _stream(self, items_attr: str, pause_after: Optional[int], skip_existing: bool) -> Iterator:
+        # Like PRAW: the first poll returns up to 100 existing items (oldest first), then only new ones
+        seen = set()
+        first = True
+        empty_polls = 0
+        while True:
+            batch = list(reversed(self.reddit._newest(getattr(self.reddit, items_attr), self.names, 100)))
+            fresh = [item for item in batch if item.id not in seen]
+            seen.update(item.id for item in fresh)
+            if first and skip_existing:
+                fresh = []
+            first = False
+            for item in fresh:
+                yield item
+            if fresh:
+                empty_polls = 0
+                continue
+            empty_polls += 1
+            if pause_after is not None and empty_polls > pause_after:
+                empty_polls = 0
+                yield None
+            time.sleep(self.poll_seconds)
+
+    def submissions(self, pause_after: Optional[int] = None, skip_existing: bool = False) -> Iterator:
+        return self._stream('submissions', pause_after, skip_existing)
+
+    def comments(self, pause_after: Optional[int] = None, skip_existing: bool = False) -> Iterator:
+        return self._stream('comments', pause_after, skip_existing)
+
+
+class FakeSubredditListing:
+    def __init__(self, reddit: FakeReddit, display_name: str, poll_seconds: float = 0.5):
+        self.reddit = reddit
+        self.display_name = display_name
+        self.names = {name.lower() for name in display_name.split('+')}
+        self.stream = _FakeStream(reddit, self.names, poll_seconds)
+
+    def new(self, limit: Optional[int] = 100) -> Iterator[FakeSubmission]:
+        return iter(self.reddit._newest(self.reddit.submissions, self.names, limit))
+
+    def comments(self, limit: Optional[int] = 100) -> Iterator[FakeComment]:
+        return iter(self.reddit._newest(self.reddit.comments, self.names, limit))
@@ -0,0 +1,142 @@
+"""
+Sharded fan-out for the Reddit fetcher
+A coordinator splits subreddits x brand-term query groups into shards and
+publishes one Pub/Sub work item per shard. Workers process shards in parallel,
+each with its own cursors, and record a manifest per shard; the last worker to
+finish writes the combined manifest for the fan-out
+"""
+
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from google.cloud import storage
+from google.cloud import pubsub_v1
+from google.api_core import exceptions as gcp_exceptions
+
+logger = logging.getLogger(__name__)
+
+
+def plan_shards(subreddits: List[str], term_groups: List[List[str]],
+                subreddits_per_shard: int, term_shards: int) -> List[Dict[str, Any]]:
+    """
+    Cross subreddit batches with term shards; every packed query group lands in
+    exactly one term shard, so fan-out issues no more searches than a serial run
+    """
+    subreddits_per_shard = max(1, subreddits_per_shard)
+    term_buckets = [term_groups[i::max(1, term_shards)] for i in range(max(1, term_shards))]
+    term_buckets = [bucket for bucket in term_buckets if bucket]
+
+    shards = []
+    for i in range(0, len(subreddits), subreddits_per_shard):
+        for term_shard, groups in enumerate(term_buckets):
+            shards.append({
+                'shard_id': f"{len(shards):04d}",
+                'subreddits': subreddits[i:i + subreddits_per_shard],
+                'term_groups': groups,
+                'term_shard': term_shard,
+                'term_shards': len(term_buckets)
+            })
+    return shards
+
+
+def shard_source_suffix(term_shard: int, term_shards: int) -> str:
+    """Cursor key suffix for a term shard; unsharded runs keep the plain reddit_{subreddit} key"""
+    return '' if term_shards <= 1 else f"#terms{term_shard + 1}of{term_shards}"
+
+
+class FanoutCoordinator:
+    """Publishes one work item per shard and records the plan next to the manifests"""
+
+    def __init__(self, publisher: pubsub_v1.PublisherClient, storage_client: storage.Client,
+                 bucket_name: str, topic_path: str, manifest_prefix: str = 'manifests/reddit'):
+        self.publisher = publisher
+        self.bucket = storage_client.bucket(bucket_name)
+        self.topic_path = topic_path
+        self.manifest_prefix = manifest_prefix
+
+    def publish(self, fanout_id: str, shards: List[Dict[str, Any]], worker_params: Dict[str, Any]) -> Dict[str, Any]:
+        plan = {
+            'fanout_id': fanout_id,
+            'created_at': datetime.utcnow().isoformat() + 'Z',
+            'shard_count': len(shards),
+            'worker_params': worker_params,
+            'shards': [{key: shard[key] for key in ('shard_id', 'subreddits', 'term_shard', 'term_shards')}
+                       for shard in shards]
+        }
+        self.bucket.blob(f"{self.manifest_prefix}/{fanout_id}/plan.json").upload_from_string(
+            json.dumps(plan), content_type='application/json'
+        )
+
+        futures = []
+        for shard in shards:
+            work_item = dict(worker_params, mode='shard', fanout_id=fanout_id,
+                             shard_count=len(shards), shard=shard)
+            futures.append(self.publisher.publish(
+                self.topic_path, json.dumps(work_item).encode('utf-8'),
+                fanout_id=fanout_id, shard_id=shard['shard_id']
+            ))
+        # Fail the coordinator (and let it be retried) unless every work item is accepted
+        message_ids = [future.result(timeout=60) for future in futures]
+        logger.info(f"Published {len(message_ids)} shard work items for fan-out {fanout_id}")
+
+        return {
+            'status': 'published',
+            'fanout_id': fanout_id,
+            'shards_published': len(message_ids),
+            'manifest': f"gs://{self.bucket.name}/{self.manifest_prefix}/{fanout_id}/manifest.json"
+        }
+
+
+class FanoutManifest:
+    """Per-shard manifests under {prefix}/{fanout_id}/shards/ and the combined manifest.json"""
+
+    def __init__(self, storage_client: storage.Client, bucket_name: str, fanout_id: str,
+                 manifest_prefix: str = 'manifests/reddit'):
+        self.bucket = storage_client.bucket(bucket_name)
+        self.fanout_id = fanout_id
+        self.base_path = f"{manifest_prefix}/{fanout_id}"
+
+    def record_shard(self, shard: Dict[str, Any], summary: Dict[str, Any], files: List[Dict[str, Any]]):
+        entry = {
+            'shard_id': shard['shard_id'],
+            'subreddits': shard['subreddits'],
+            'term_shard': shard['term_shard'],
+            'term_shards': shard['term_shards'],
+            'run_id': summary.get('run_id'),
+            'total_messages': summary.get('total_messages', 0),
+            'messages_by_subreddit': summary.get('messages_by_subreddit', {}),
+            'files': files,
+            'completed_at': datetime.utcnow().isoformat() + 'Z'
+        }
+        self.bucket.blob(f"{self.base_path}/shards/{shard['shard_id']}.json").upload_from_string(
+            json.dumps(entry), content_type='application/json'
+        )
+
+    def finalize_if_complete(self, shard_count: int) -> Optional[Dict[str, Any]]:
+        """Write manifest.json once every shard has reported; returns it if this call wrote it"""
+        shard_blobs = list(self.bucket.list_blobs(prefix=f"{self.base_path}/shards/"))
+        if len(shard_blobs) < shard_count:
+            logger.info(f"Fan-out {self.fanout_id}: {len(shard_blobs)}/{shard_count} shards done")
+            return None
+
+        shards = sorted((json.loads(blob.download_as_bytes()) for blob in shard_blobs),
+                        key=lambda entry: entry['shard_id'])
+        manifest = {
+            'fanout_id': self.fanout_id,
+            'completed_at': datetime.utcnow().isoformat() + 'Z',
+            'shard_count': shard_count,
+            'total_messages': sum(entry['total_messages'] for entry in shards),
+            'files_saved': sum(len(entry['files']) for entry in shards),
+            'shards': shards
+        }
+        try:
+            # Several workers can see the last shard land; only the first write wins
+            self.bucket.blob(f"{self.base_path}/manifest.json").upload_from_string(
+                json.dumps(manifest), content_type='application/json', if_generation_match=0
+            )
+        except gcp_exceptions.PreconditionFailed:
+            return None
+        logger.info(f"Fan-out {self.fanout_id} complete: {manifest['files_saved']} files from {shard_count} shards")
+        return manifest
@@ -0,0 +1,129 @@
+"""
+Streaming GCS sink for partitioned NDJSON output
+Records are gzip-compressed and uploaded in chunks as they are written, rolling
+over to a new part file at a configurable size, so memory stays flat
+regardless of run size
+"""
+
+import gzip
+import json
+import uuid
+import logging
+from typing import Dict, Any, List, Set
+
+from google.cloud import storage
+
+logger = logging.getLogger(__name__)
+
+
+class _PartWriter:
+    """One open part-*.jsonl.gz object being uploaded"""
+
+    def __init__(self, bucket: storage.Bucket, blob_path: str, chunk_size: int):
+        self.blob_path = blob_path
+        self.blob = bucket.blob(blob_path)
+        self.blob_writer = self.blob.open('wb', chunk_size=chunk_size, ignore_flush=True,
+                                          content_type='application/gzip')
+        self.gzip_file = gzip.GzipFile(fileobj=self.blob_writer, mode='wb')
+        self.records = 0
+        self.uncompressed_bytes = 0
+
+    def write(self, line: bytes):
+        self.gzip_file.write(line)
+        self.records += 1
+        self.uncompressed_bytes += len(line)
+
+    @property
+    def compressed_bytes(self) -> int:
+        return self.blob_writer.tell()
+
+    def close(self):
+        self.gzip_file.close()
+        self.blob_writer.close()
+
+
+class PartitionedNDJSONWriter:
+    """
+    Writes records to {prefix}/dt=YYYY-MM-DD/part-{run_timestamp}-{id}.jsonl.gz as they arrive
+    One part is open per event date; a part is closed and a new one started once
+    it reaches max_part_bytes of compressed output
+    """
+
+    def __init__(self, storage_client: storage.Client, bucket_name: str, run_timestamp: str,
+                 prefix: str = 'raw/reddit', max_part_bytes: int = 128 * 1024 * 1024,
+                 chunk_size: int = 4 * 1024 * 1024):
+        self.bucket_name = bucket_name
+        self.bucket = storage_client.bucket(bucket_name)
+        self.run_timestamp = run_timestamp
+        self.prefix = prefix
+        self.max_part_bytes = max_part_bytes
+        self.chunk_size = chunk_size  # must be a multiple of 256 KiB
+        self._open_parts: Dict[str, _PartWriter] = {}
+        self.saved_files: List[Dict[str, Any]] = []
+        self.records_written = 0
+
+    def _open_part(self, date_str: str) -> _PartWriter:
+        run_id = f"{self.run_timestamp}-{uuid.uuid4().hex[:8]}"
+        blob_path = f"{self.prefix}/dt={date_str}/part-{run_id}.jsonl.gz"
+        part = _PartWriter(self.bucket, blob_path, self.chunk_size)
+        self._open_parts[date_str] = part
+        return part
+
+    def _close_part(self, date_str: str):
+        part = self._open_parts.pop(date_str)
+        part.close()
+        self.saved_files.append({
+            'path': f"gs://{self.bucket_name}/{part.blob_path}",
+            'date': date_str,
+            'records': part.records,
+            'bytes': part.uncompressed_bytes
+        })
+        logger.info(f"Saved {part.records} messages to gs://{self.bucket_name}/{part.blob_path}")
+
+    def write(self, record: Dict[str, Any]):
+        """Append one record to its event-date partition"""
+        date_str = record['ts_event'][:10]  # Extract YYYY-MM-DD
+        part = self._open_parts.get(date_str) or self._open_part(date_str)
+        part.write((json.dumps(record, sort_keys=True) + '\n').encode('utf-8'))
+        self.records_written += 1
+
+        if part.compressed_bytes >= self.max_part_bytes:
+            self._close_part(date_str)
+
+    def write_all(self, records: List[Dict[str, Any]]):
+        for record in records:
+            self.write(record)
+
+    def open_part_paths(self) -> Set[str]:
+        """Parts still being uploaded; everything written so far is durable once all of them are closed"""
+        return {part.blob_path for part in self._open_parts.values()}
+
+    def committed(self, open_paths: Set[str]) -> bool:
+        """True once every part in open_paths (taken from open_part_paths) has been closed"""
+        return not open_paths & self.open_part_paths()
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """Finalize every open part so everything written so far is durable; returns the parts closed"""
+        closed_from = len(self.saved_files)
+        for date_str in list(self._open_parts):
+            self._close_part(date_str)
+        return self.saved_files[closed_from:]
+
+    def abort(self):
+        """
+        Drop every open part after a failed run: its records are not covered by a
+        checkpoint, and an abandoned upload would otherwise be finalized truncated
+        when the writer is garbage collected
+        """
+        for date_str in list(self._open_parts):
+            part = self._open_parts.pop(date_str)
+            try:
+                part.close()
+                part.blob.delete()
+            except Exception as e:
+                logger.warning(f"Could not discard unfinished part gs://{self.bucket_name}/{part.blob_path}: {e}")
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Finalize all parts and return every file written by this sink"""
+        self.flush()
+        return self.saved_files
@@ -8,19 +8,40 @@ import os
 import json
 import logging
 import hashlib
-import gzip
+import base64
+import uuid
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Set, Callable
 import time
-import uuid
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import praw
+from praw.const import API_PATH
+from praw.models import MoreComments
 from google.cloud import storage
 from google.cloud import secretmanager
 from google.cloud import bigquery
+from google.cloud import pubsub_v1
+from google.api_core import exceptions as gcp_exceptions
 import functions_framework
 import requests
 
+from brand_matcher import BrandMatcher
+from rate_limiter import AdaptiveRateLimiter
+from gcs_sink import PartitionedNDJSONWriter
+from checkpoint import RunCheckpoint
+from seen_index import SeenEventIndex
+from term_scheduler import TermYieldScheduler
+from subreddit_scheduler import SubredditPollScheduler
+from scan_planner import ListingScanPlanner
+from pipeline import BoundedPipeline, PipelineStageError
+from fanout import plan_shards, shard_source_suffix, FanoutCoordinator, FanoutManifest
+from state_backends import (StateBackend, SQLiteStateBackend, GCSStateBackend,
+                            BigQueryStateBackend, BigQueryAuditSink, gcs_merge_write)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -32,9 +53,74 @@ REDDIT_SECRET_NAME = os.environ.get('REDDIT_SECRET_NAME', 'reddit-credentials')
 BQ_DATASET = os.environ.get('BQ_DATASET', 'brand_health_raw')
 REDDIT_REQUESTS_PER_MINUTE = int(os.environ.get('REDDIT_REQUESTS_PER_MINUTE', '100'))
 BATCH_SIZE = int(os.environ.get('BATCH_SIZE', '1000'))
+DETECTION_CACHE_SIZE = int(os.environ.get('DETECTION_CACHE_SIZE', '20000'))
+REDDIT_MAX_QUERY_LENGTH = int(os.environ.get('REDDIT_MAX_QUERY_LENGTH', '512'))
+# Ingestion cursor storage: gcs (production), sqlite (tests/local) or bigquery
+STATE_BACKEND = os.environ.get('STATE_BACKEND', 'gcs')
+STATE_BUCKET = os.environ.get('STATE_BUCKET', BUCKET_NAME)
+STATE_GCS_BLOB = os.environ.get('STATE_GCS_BLOB', 'state/reddit/ingest_state.json')
+STATE_SQLITE_PATH = os.environ.get('STATE_SQLITE_PATH', '/tmp/reddit_ingest_state.db')
+STATE_AUDIT_BIGQUERY = os.environ.get('STATE_AUDIT_BIGQUERY', 'true').lower() == 'true'
+COMMENT_FOREST_INDEX_BLOB = os.environ.get('COMMENT_FOREST_INDEX_BLOB', 'state/reddit/comment_forest_index.json')
+PERSIST_COMMENT_FOREST_INDEX = os.environ.get('PERSIST_COMMENT_FOREST_INDEX', 'true').lower() == 'true'
+COMMENT_FOREST_INDEX_TTL_DAYS = int(os.environ.get('COMMENT_FOREST_INDEX_TTL_DAYS', '14'))
+# Comments per submission: one sorted listing of at most COMMENT_LIMIT comments, COMMENT_DEPTH levels deep
+COMMENT_SORT = os.environ.get('COMMENT_SORT', 'new')
+COMMENT_LIMIT = int(os.environ.get('COMMENT_LIMIT', '10'))
+COMMENT_DEPTH = int(os.environ.get('COMMENT_DEPTH', '2'))
+# Seen-event index: unchanged events emitted by earlier runs are skipped before NLP and writing
+SEEN_INDEX_ENABLED = os.environ.get('SEEN_INDEX_ENABLED', 'true').lower() == 'true'
+SEEN_INDEX_BLOB = os.environ.get('SEEN_INDEX_BLOB', 'state/reddit/seen_events.json')
+SEEN_INDEX_RECENT_DAYS = int(os.environ.get('SEEN_INDEX_RECENT_DAYS', '3'))
+SEEN_INDEX_RETENTION_DAYS = int(os.environ.get('SEEN_INDEX_RETENTION_DAYS', '30'))
+SEEN_INDEX_BLOOM_CAPACITY = int(os.environ.get('SEEN_INDEX_BLOOM_CAPACITY', '20000'))  # events per day
+SEEN_INDEX_ERROR_RATE = float(os.environ.get('SEEN_INDEX_ERROR_RATE', '0.001'))
+# Term scheduler: terms empty for TERM_BACKOFF_GRACE_CYCLES runs in a subreddit are searched exponentially less often
+TERM_SCHEDULER_ENABLED = os.environ.get('TERM_SCHEDULER_ENABLED', 'true').lower() == 'true'
+TERM_SCHEDULER_BLOB = os.environ.get('TERM_SCHEDULER_BLOB', 'state/reddit/term_yield.json')
+TERM_BACKOFF_GRACE_CYCLES = int(os.environ.get('TERM_BACKOFF_GRACE_CYCLES', '3'))
+TERM_BACKOFF_MAX_SKIP_CYCLES = int(os.environ.get('TERM_BACKOFF_MAX_SKIP_CYCLES', '32'))
+# Subreddit poll scheduler: scheduled runs poll only due subreddits, busy ones more often, within a daily request budget
+SUBREDDIT_SCHEDULER_ENABLED = os.environ.get('SUBREDDIT_SCHEDULER_ENABLED', 'true').lower() == 'true'
+SUBREDDIT_SCHEDULER_BLOB = os.environ.get('SUBREDDIT_SCHEDULER_BLOB', 'state/reddit/subreddit_polls.json')
+REDDIT_DAILY_REQUEST_BUDGET = int(os.environ.get('REDDIT_DAILY_REQUEST_BUDGET', '20000'))
+SUBREDDIT_POLL_MIN_INTERVAL_SECONDS = int(os.environ.get('SUBREDDIT_POLL_MIN_INTERVAL_SECONDS', '3600'))
+SUBREDDIT_POLL_MAX_INTERVAL_SECONDS = int(os.environ.get('SUBREDDIT_POLL_MAX_INTERVAL_SECONDS', str(7 * 86400)))
+# Listing scan: subreddits where reading /new and /comments is cheaper than term searches are scanned and matched locally
+LISTING_SCAN_ENABLED = os.environ.get('LISTING_SCAN_ENABLED', 'true').lower() == 'true'
+LISTING_SCAN_BLOB = os.environ.get('LISTING_SCAN_BLOB', 'state/reddit/listing_volumes.json')
+LISTING_SCAN_MAX_ITEMS = int(os.environ.get('LISTING_SCAN_MAX_ITEMS', '900'))  # listings stop at ~1000 items
+LISTING_PROBE_INTERVAL_SECONDS = int(os.environ.get('LISTING_PROBE_INTERVAL_SECONDS', '86400'))
+# Streaming output: parts roll over at this compressed size, uploads go out in chunks
+OUTPUT_PART_MAX_BYTES = int(os.environ.get('OUTPUT_PART_MAX_BYTES', str(128 * 1024 * 1024)))
+OUTPUT_UPLOAD_CHUNK_SIZE = int(os.environ.get('OUTPUT_UPLOAD_CHUNK_SIZE', str(4 * 1024 * 1024)))  # multiple of 256 KiB
+MULTIREDDIT_BATCH_SIZE = int(os.environ.get('MULTIREDDIT_BATCH_SIZE', '8'))  # 1 = one subreddit per search
+# Resumable runs: progress is checkpointed to GCS; a run stops cleanly once its time budget is spent (0 = no budget)
+CHECKPOINT_PREFIX = os.environ.get('CHECKPOINT_PREFIX', 'state/reddit/checkpoints')
+CHECKPOINT_TTL_SECONDS = int(os.environ.get('CHECKPOINT_TTL_SECONDS', '3600'))
+# Open parts are rolled once a checkpoint has waited this long for them, so progress survives a hard kill
+CHECKPOINT_ROLL_SECONDS = int(os.environ.get('CHECKPOINT_ROLL_SECONDS', '60'))
+# The budget defaults to the request timeout less enough time to drain the pipeline and close parts
+FUNCTION_TIMEOUT_SECONDS = int(os.environ.get('FUNCTION_TIMEOUT_SECONDS', '600'))
+RUN_TIME_BUDGET_MARGIN_SECONDS = int(os.environ.get('RUN_TIME_BUDGET_MARGIN_SECONDS', '90'))
+RUN_TIME_BUDGET_SECONDS = int(os.environ.get(
+    'RUN_TIME_BUDGET_SECONDS', str(max(0, FUNCTION_TIMEOUT_SECONDS - RUN_TIME_BUDGET_MARGIN_SECONDS))
+))
+# Fetch -> enrich -> write run as overlapping stages; each queue holds at most this many message chunks
+PIPELINE_QUEUE_SIZE = int(os.environ.get('PIPELINE_QUEUE_SIZE', '4'))
+# Fan-out mode: a coordinator publishes subreddit x term shards to REDDIT_SHARD_TOPIC for parallel workers
+REDDIT_SHARD_TOPIC = os.environ.get('REDDIT_SHARD_TOPIC', 'reddit-shard-work')
+FANOUT_SUBREDDITS_PER_SHARD = int(os.environ.get('FANOUT_SUBREDDITS_PER_SHARD', '4'))
+FANOUT_TERM_SHARDS = int(os.environ.get('FANOUT_TERM_SHARDS', '1'))
+FANOUT_MAX_WORKERS = int(os.environ.get('FANOUT_MAX_WORKERS', '8'))  # keep in line with max_instance_count
+FANOUT_MANIFEST_PREFIX = os.environ.get('FANOUT_MANIFEST_PREFIX', 'manifests/reddit')
 
-# Rate limiting
-REQUEST_DELAY = 60.0 / REDDIT_REQUESTS_PER_MINUTE  # seconds between requests
+# Rate limiting (token bucket shared by every request in a run, adapted from X-Ratelimit-* headers)
+REDDIT_RATE_BURST = int(os.environ.get('REDDIT_RATE_BURST', '10'))
+REDDIT_MAX_IN_FLIGHT = int(os.environ.get('REDDIT_MAX_IN_FLIGHT', '8'))
+REDDIT_ASYNC_FETCH = os.environ.get('REDDIT_ASYNC_FETCH', 'false').lower() == 'true'
+REDDIT_LISTING_PAGE_SIZE = 100  # Reddit returns at most 100 items per listing request
+REDDIT_SEARCH_DEPTH = 1000  # Reddit stops returning search results past ~1000 per query
 
 # Financial institutions to track - ULTRA COMPREHENSIVE TD Bank keywords
 FINANCIAL_BRANDS = {
@@ -112,6 +198,9 @@ FINANCIAL_BRANDS = {
     ]
 }
 
+# Compiled multi-pattern matcher over all brand terms (built once per instance)
+BRAND_MATCHER = BrandMatcher(FINANCIAL_BRANDS)
+
 # TD Bank focused subreddits - comprehensive coverage
 RELEVANT_SUBREDDITS = [
     # Core Personal Finance (high TD Bank activity)
@@ -135,100 +224,300 @@ RELEVANT_SUBREDDITS = [
     'maine', 'newhampshire', 'vermont', 'massachusetts', 'rhodeisland',
     ]
 
+def plan_search_queries(terms: List[str], max_length: int = REDDIT_MAX_QUERY_LENGTH) -> List[List[str]]:
+    """
+    Pack search terms into as few '"a" OR "b" OR ...' queries as fit in max_length
+    Terms are deduplicated case-insensitively (Reddit search ignores case) and
+    packed first-fit decreasing by length
+    """
+    unique_terms = {}
+    for term in terms:
+        cleaned = term.replace('"', '').strip()
+        if cleaned and cleaned.lower() not in unique_terms:
+            unique_terms[cleaned.lower()] = cleaned
+    
+    groups = []
+    lengths = []
+    for term in sorted(unique_terms.values(), key=len, reverse=True):
+        quoted_length = len(term) + 2
+        for i, group in enumerate(groups):
+            if lengths[i] + len(' OR ') + quoted_length <= max_length:
+                group.append(term)
+                lengths[i] += len(' OR ') + quoted_length
+                break
+        else:
+            # Terms longer than the limit still get a query of their own
+            groups.append([term])
+            lengths.append(quoted_length)
+    
+    return groups
+
+def build_search_query(terms: List[str]) -> str:
+    """Build a boolean OR query of quoted phrases"""
+    return ' OR '.join(f'"{term}"' for term in terms)
+
 class IngestionState:
-    """Manages ingestion state for idempotent processing"""
+    """
+    Manages ingestion state for idempotent processing
+    All cursors are loaded once at startup from a pluggable backend, served
+    from memory, and committed in one write at the end of the run
+    """
     
-    def __init__(self, bq_client: bigquery.Client):
-        self.bq_client = bq_client
-        self.dataset_id = BQ_DATASET
-        self.table_id = 'ingest_state'
-        self._ensure_state_table()
+    def __init__(self, backend: StateBackend, audit_sink: Optional[BigQueryAuditSink] = None,
+                 seed_backend: Optional[StateBackend] = None, source_prefix: str = 'reddit_'):
+        self.backend = backend
+        self.audit_sink = audit_sink
+        self._cursors: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        self._pending: Dict[str, Tuple[str, str]] = {}
+        self.load_all(source_prefix, seed_backend)
     
-    def _ensure_state_table(self):
-        """Create ingestion state table if it doesn't exist"""
-        table_ref = self.bq_client.dataset(self.dataset_id).table(self.table_id)
-        
+    def load_all(self, source_prefix: str = '', seed_backend: Optional[StateBackend] = None):
+        """Load every cursor for sources with the given prefix; an empty store is seeded from seed_backend"""
+        started_at = time.time()
         try:
-            self.bq_client.get_table(table_ref)
-            logger.info("Ingestion state table exists")
-        except Exception:
-            # Create table
-            schema = [
-                bigquery.SchemaField("source", "STRING", mode="REQUIRED"),
-                bigquery.SchemaField("cursor_iso", "STRING", mode="NULLABLE"),
-                bigquery.SchemaField("tie_breaker_id", "STRING", mode="NULLABLE"),
-                bigquery.SchemaField("updated_at", "TIMESTAMP", mode="REQUIRED"),
-            ]
-            
-            table = bigquery.Table(table_ref, schema=schema)
-            table = self.bq_client.create_table(table)
-            logger.info(f"Created ingestion state table: {table.table_id}")
+            self._cursors = self.backend.load_all(source_prefix)
+            if not self._cursors and seed_backend is not None:
+                self._cursors = seed_backend.load_all(source_prefix)
+                self._pending = dict(self._cursors)
+                logger.info(f"Seeded {len(self._cursors)} cursors from {seed_backend.name} state")
+            logger.info(f"Loaded {len(self._cursors)} ingestion cursors from {self.backend.name} "
+                        f"in {time.time() - started_at:.3f}s")
+        except Exception as e:
+            logger.warning(f"Could not load ingestion state: {e}")
     
     def get_state(self, source: str) -> Tuple[Optional[str], Optional[str]]:
         """Get the last cursor and tie-breaker ID for a source"""
-        query = f"""
-        SELECT cursor_iso, tie_breaker_id
-        FROM `{PROJECT_ID}.{self.dataset_id}.{self.table_id}`
-        WHERE source = @source
-        ORDER BY updated_at DESC
-        LIMIT 1
-        """
-        
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("source", "STRING", source)
-            ]
-        )
+        return self._cursors.get(source, (None, None))
+    
+    def update_state(self, source: str, cursor_iso: str, tie_breaker_id: str):
+        """Stage a cursor update for a source; persisted by commit()"""
+        self._cursors[source] = (cursor_iso, tie_breaker_id)
+        self._pending[source] = (cursor_iso, tie_breaker_id)
+        logger.info(f"Updated state for {source}: cursor={cursor_iso}, tie_breaker={tie_breaker_id}")
+    
+    def pending(self, sources: Optional[List[str]] = None) -> Dict[str, Tuple[str, str]]:
+        """Staged, uncommitted cursor updates (optionally only for the given sources)"""
+        if sources is None:
+            return dict(self._pending)
+        return {source: self._pending[source] for source in sources if source in self._pending}
+    
+    def restore_pending(self, updates: Dict[str, Tuple[str, str]]):
+        """Re-stage cursor updates carried over from an interrupted run's checkpoint"""
+        for source, (cursor_iso, tie_breaker_id) in updates.items():
+            self._cursors[source] = (cursor_iso, tie_breaker_id)
+            self._pending[source] = (cursor_iso, tie_breaker_id)
+    
+    def commit(self):
+        """Write all staged cursor updates in one backend write; cursors never move backwards"""
+        if not self._pending:
+            return
         
         try:
-            results = list(self.bq_client.query(query, job_config=job_config))
-            if results:
-                row = results[0]
-                return row.cursor_iso, row.tie_breaker_id
-            return None, None
+            self.backend.commit(self._pending)
+            logger.info(f"Committed {len(self._pending)} ingestion cursors to {self.backend.name}")
+            if self.audit_sink:
+                self.audit_sink.record(self._pending)
+            self._pending = {}
         except Exception as e:
-            logger.warning(f"Could not get state for {source}: {e}")
-            return None, None
+            logger.error(f"Could not commit ingestion state: {e}")
+
+def create_ingestion_state(bq_client: Optional[bigquery.Client], storage_client: Optional[storage.Client],
+                           backend_name: str = STATE_BACKEND) -> IngestionState:
+    """Build IngestionState for the configured backend (gcs, sqlite or bigquery)"""
+    seed_backend = None
+    if backend_name == 'sqlite':
+        backend = SQLiteStateBackend(STATE_SQLITE_PATH)
+    elif backend_name == 'gcs':
+        backend = GCSStateBackend(storage_client, STATE_BUCKET, STATE_GCS_BLOB)
+        # Cursors written before the move off BigQuery carry over on first run
+        if bq_client is not None:
+            seed_backend = BigQueryStateBackend(bq_client, PROJECT_ID, BQ_DATASET)
+    elif backend_name == 'bigquery':
+        backend = BigQueryStateBackend(bq_client, PROJECT_ID, BQ_DATASET)
+    else:
+        raise ValueError(f"Unknown STATE_BACKEND: {backend_name}")
     
-    def update_state(self, source: str, cursor_iso: str, tie_breaker_id: str):
-        """Update the cursor state for a source"""
-        query = f"""
-        INSERT INTO `{PROJECT_ID}.{self.dataset_id}.{self.table_id}`
-        (source, cursor_iso, tie_breaker_id, updated_at)
-        VALUES (@source, @cursor_iso, @tie_breaker_id, CURRENT_TIMESTAMP())
-        """
-        
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("source", "STRING", source),
-                bigquery.ScalarQueryParameter("cursor_iso", "STRING", cursor_iso),
-                bigquery.ScalarQueryParameter("tie_breaker_id", "STRING", tie_breaker_id),
-            ]
-        )
-        
+    audit_sink = None
+    if STATE_AUDIT_BIGQUERY and bq_client is not None and backend_name != 'bigquery':
+        audit_sink = BigQueryAuditSink(bq_client, PROJECT_ID, BQ_DATASET)
+    
+    return IngestionState(backend, audit_sink=audit_sink, seed_backend=seed_backend)
+
+class CommentForestIndex:
+    """
+    Persisted submission_id -> num_comments from earlier runs, used to skip unchanged comment forests
+    Saves merge this run's entries into the stored index (generation-matched), so
+    concurrent fan-out workers don't drop each other's entries
+    """
+    
+    def __init__(self, storage_client: storage.Client, blob_path: str = COMMENT_FOREST_INDEX_BLOB,
+                 max_attempts: int = 8):
+        self.blob = storage_client.bucket(BUCKET_NAME).blob(blob_path)
+        self.max_attempts = max_attempts
+        self.entries: Dict[str, List[float]] = {}  # id -> [num_comments, last_seen_epoch]
+        self._updated: Dict[str, List[float]] = {}  # entries recorded by this run, not yet saved
+        self._load()
+    
+    def _read(self) -> Tuple[Dict[str, List[float]], int]:
+        try:
+            data = self.blob.download_as_bytes()
+            return json.loads(data), int(self.blob.generation)
+        except gcp_exceptions.NotFound:
+            return {}, 0
+    
+    def _load(self):
+        try:
+            self.entries, _ = self._read()
+            logger.info(f"Loaded comment forest index with {len(self.entries)} submissions")
+        except Exception as e:
+            logger.warning(f"Could not load comment forest index: {e}")
+            self.entries = {}
+    
+    def is_unchanged(self, submission_id: str, num_comments: int) -> bool:
+        entry = self.entries.get(submission_id)
+        return entry is not None and entry[0] == num_comments
+    
+    def record(self, submission_id: str, num_comments: int):
+        self.entries[submission_id] = self._updated[submission_id] = [num_comments, time.time()]
+    
+    def _merge(self, entries: Dict[str, List[float]]) -> Dict[str, List[float]]:
+        """Newest observation per submission wins; submissions not seen within the TTL are dropped"""
+        for submission_id, entry in self._updated.items():
+            current = entries.get(submission_id)
+            if current is None or current[1] <= entry[1]:
+                entries[submission_id] = entry
+        cutoff = time.time() - COMMENT_FOREST_INDEX_TTL_DAYS * 86400
+        return {k: v for k, v in entries.items() if v[1] >= cutoff}
+    
+    def save(self):
+        """Merge this run's entries into the stored index"""
+        if not self._updated:
+            return
         try:
-            self.bq_client.query(query, job_config=job_config)
-            logger.info(f"Updated state for {source}: cursor={cursor_iso}, tie_breaker={tie_breaker_id}")
+            saved = gcs_merge_write(self.blob, self._read, self._merge, self.max_attempts)
         except Exception as e:
-            logger.error(f"Could not update state for {source}: {e}")
+            logger.error(f"Could not save comment forest index: {e}")
+            return
+        if not saved:
+            logger.error(f"Could not save comment forest index after {self.max_attempts} attempts")
+            return
+        logger.info(f"Saved comment forest index with {len(self._updated)} updated submissions")
+        self._updated = {}
+
+class CommentPolicy:
+    """
+    Which comments to load for a submission
+    Reddit sorts and trims the listing server-side (sort, limit, depth), so only the
+    comments kept are transferred; 'more comments' stubs are dropped rather than expanded
+    """
+    
+    SORTS = ('new', 'top', 'best', 'controversial', 'old', 'qa')
+    
+    def __init__(self, sort: str = COMMENT_SORT, limit: int = COMMENT_LIMIT, depth: int = COMMENT_DEPTH):
+        if sort not in self.SORTS:
+            raise ValueError(f"Unknown comment sort '{sort}', expected one of {self.SORTS}")
+        self.sort = sort
+        self.limit = max(1, limit)
+        self.depth = max(1, depth)
+    
+    def params(self) -> Dict[str, Any]:
+        return {'sort': 'confidence' if self.sort == 'best' else self.sort, 'limit': self.limit, 'depth': self.depth}
+    
+    def select(self, top_level: list) -> list:
+        """Flatten the returned forest breadth-first (listing order within a level), at most limit comments"""
+        selected = []
+        level = list(top_level)
+        for _ in range(self.depth):
+            next_level = []
+            for comment in level:
+                if isinstance(comment, MoreComments):
+                    continue
+                selected.append(comment)
+                if len(selected) >= self.limit:
+                    return selected
+                next_level.extend(getattr(comment, 'replies', None) or [])
+            level = next_level
+        return selected
+    
+    def as_dict(self) -> Dict[str, Any]:
+        return {'sort': self.sort, 'limit': self.limit, 'depth': self.depth}
 
 class IdempotentRedditFetcher:
     """Idempotent Reddit fetcher with natural IDs and state tracking"""
     
-    def __init__(self):
-        self.reddit = self._initialize_reddit()
-        self.storage_client = storage.Client()
-        self.bq_client = bigquery.Client()
-        self.state_manager = IngestionState(self.bq_client)
+    def __init__(self, requests_per_minute: Optional[float] = None, reddit_factory=None,
+                 storage_client: Optional[storage.Client] = None, bq_client: Optional[bigquery.Client] = None,
+                 rate_budget_share: float = 1.0):
+        self._reddit_credentials = None
+        # reddit_factory() builds a client (e.g. fake_reddit.FakeReddit for local runs); defaults to PRAW
+        self._reddit_factory = reddit_factory or self._initialize_reddit
+        self.reddit = self._reddit_factory()
+        # Clients can be passed in (benchmark.py replays against in-memory stand-ins)
+        self.storage_client = storage_client or storage.Client()
+        self.bq_client = bq_client or bigquery.Client()
+        self.state_manager = create_ingestion_state(self.bq_client, self.storage_client)
         self.request_count = 0
         self.start_time = time.time()
         
+        # One limiter paces every Reddit request in this run (sync and async); fan-out
+        # workers pace against their share of the X-Ratelimit budget as well as their rate
+        self.rate_limiter = AdaptiveRateLimiter(requests_per_minute or REDDIT_REQUESTS_PER_MINUTE,
+                                                capacity=REDDIT_RATE_BURST, budget_share=rate_budget_share)
+        self.api_seconds = 0.0
+        self._stats_lock = threading.Lock()
+        
+        # PRAW is not thread-safe: async workers each get their own client
+        self._thread_local = threading.local()
+        self._executor = None
+        
+        # Per-run submission dedup (comments are fetched once per submission per run); forests
+        # loaded by earlier runs are skipped while num_comments is unchanged
+        self._seen_submissions = set()
+        self.comment_index = CommentForestIndex(self.storage_client) if PERSIST_COMMENT_FOREST_INDEX else None
+        self.comment_stats = {'fetched': 0, 'comments_loaded': 0, 'persisted_skips': 0,
+                              'duplicate_submissions': 0}
+        self.comment_policy = CommentPolicy()
+        self.seen_index = SeenEventIndex(
+            self.storage_client, BUCKET_NAME, SEEN_INDEX_BLOB,
+            recent_days=SEEN_INDEX_RECENT_DAYS, retention_days=SEEN_INDEX_RETENTION_DAYS,
+            bloom_capacity=SEEN_INDEX_BLOOM_CAPACITY, error_rate=SEEN_INDEX_ERROR_RATE
+        ) if SEEN_INDEX_ENABLED else None
+        self.search_stats = {'searches': 0, 'pages': 0, 'early_exits': 0, 'truncated': 0, 'splits': 0}
+        
+        # Per-subreddit term yield for this run: terms searched and emitted posts and comments matching each term
+        self.searched_terms: Dict[str, set] = {}
+        self.term_hits: Dict[str, Dict[str, int]] = {}
+        self.term_scheduler = TermYieldScheduler(
+            self.storage_client, BUCKET_NAME, TERM_SCHEDULER_BLOB,
+            grace_cycles=TERM_BACKOFF_GRACE_CYCLES, max_skip_cycles=TERM_BACKOFF_MAX_SKIP_CYCLES
+        ) if TERM_SCHEDULER_ENABLED else None
+        
+        # Listing scans: per-subreddit items read and posts matched this run feed the scan/search cost model
+        self.scan_planner = ListingScanPlanner(
+            self.storage_client, BUCKET_NAME, LISTING_SCAN_BLOB,
+            max_listing_items=LISTING_SCAN_MAX_ITEMS, probe_interval_seconds=LISTING_PROBE_INTERVAL_SECONDS
+        ) if LISTING_SCAN_ENABLED else None
+        self.scan_stats = {'scans': 0, 'pages': 0, 'posts': 0, 'comments': 0, 'truncated': 0}
+        
+        # Built on first use and kept for the fetcher's lifetime (one run, stream worker or backfill process)
+        self.nlp_enricher = None
+        self.scanned_counts: Dict[str, Dict[str, int]] = {}
+        self.matched_posts: Dict[str, int] = {}
+        
+        # Per-run brand detection memo keyed by content hash (bounded LRU)
+        self._detection_cache = OrderedDict()
+        self.detection_cache_hits = 0
+        self.detection_cache_misses = 0
+        
     def _get_reddit_credentials(self) -> Dict[str, str]:
         """Retrieve Reddit API credentials from Secret Manager"""
+        if self._reddit_credentials:
+            return self._reddit_credentials
         client = secretmanager.SecretManagerServiceClient()
         name = f"projects/{PROJECT_ID}/secrets/{REDDIT_SECRET_NAME}/versions/latest"
         response = client.access_secret_version(request={"name": name})
-        return json.loads(response.payload.data.decode("UTF-8"))
+        self._reddit_credentials = json.loads(response.payload.data.decode("UTF-8"))
+        return self._reddit_credentials
     
     def _initialize_reddit(self) -> praw.Reddit:
         """Initialize Reddit API client"""
@@ -241,16 +530,47 @@ class IdempotentRedditFetcher:
             password=creds.get('password')
         )
     
+    def _thread_reddit(self) -> praw.Reddit:
+        """Reddit client owned by the current worker thread"""
+        reddit = getattr(self._thread_local, 'reddit', None)
+        if reddit is None:
+            reddit = self._reddit_factory()
+            self._thread_local.reddit = reddit
+        return reddit
+    
+    def _observe_api_call(self, reddit: praw.Reddit, started_at: float):
+        """Feed Reddit's reported budget to the limiter and account time spent in the API"""
+        with self._stats_lock:
+            self.api_seconds += time.time() - started_at
+        try:
+            limits = reddit.auth.limits
+            self.rate_limiter.observe(limits.get('remaining'), limits.get('used'), limits.get('reset_timestamp'))
+        except Exception as e:
+            logger.debug(f"Rate limit headers unavailable: {e}")
+    
+    def rate_limit_stats(self) -> Dict[str, Any]:
+        """Per-run pacing stats: time waited on the limiter versus time spent in API calls"""
+        stats = self.rate_limiter.stats()
+        stats.update({
+            'api_seconds': round(self.api_seconds, 3),
+            'wall_seconds': round(time.time() - self.start_time, 3)
+        })
+        return stats
+    
+    def nlp_cache_stats(self) -> Optional[Dict[str, Any]]:
+        """NLP result cache hits and misses for this fetcher's enricher (None if nothing was enriched or no cache)"""
+        cache = self.nlp_enricher.cache if self.nlp_enricher else None
+        if cache is None:
+            return None
+        return dict(cache.stats, hit_ratio=round(cache.hit_ratio(), 3))
+    
     def _rate_limit(self):
         """Enforce rate limiting"""
-        self.request_count += 1
-        elapsed = time.time() - self.start_time
-        expected_time = self.request_count * REQUEST_DELAY
-        
-        if elapsed < expected_time:
-            sleep_time = expected_time - elapsed
-            logger.debug(f"Rate limiting: sleeping {sleep_time:.2f}s")
-            time.sleep(sleep_time)
+        with self._stats_lock:  # also called from executor threads
+            self.request_count += 1
+        sleep_time = self.rate_limiter.acquire()
+        if sleep_time > 0:
+            logger.debug(f"Rate limiting: slept {sleep_time:.2f}s")
     
     def _generate_event_id(self, reddit_type: str, reddit_id: str) -> str:
         """Generate stable event ID for Reddit posts/comments"""
@@ -279,7 +599,37 @@ class IdempotentRedditFetcher:
         if not text or len(text.strip()) < 2:
             return {'brand_id': None, 'matched_terms': [], 'match_positions': [], 'confidence_score': 0.0}
         
-        text_lower = text.lower()
+        return self._detect_brand_mentions_lower(text, text.lower(), debug=debug)
+    
+    def detect_brand_mentions_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """
+        Brand detection for many texts at once
+        Each distinct text (by content hash) is lowercased and scanned once per run;
+        repeats are served from a bounded LRU. Returned dicts are shared, do not mutate.
+        """
+        results = []
+        for text in texts:
+            if not text or len(text.strip()) < 2:
+                results.append({'brand_id': None, 'matched_terms': [], 'match_positions': [], 'confidence_score': 0.0})
+                continue
+            
+            content_hash = self._generate_content_hash(text)
+            detection = self._detection_cache.get(content_hash)
+            if detection is not None:
+                self._detection_cache.move_to_end(content_hash)
+                self.detection_cache_hits += 1
+            else:
+                detection = self._detect_brand_mentions_lower(text, text.lower())
+                self._detection_cache[content_hash] = detection
+                self.detection_cache_misses += 1
+                if len(self._detection_cache) > DETECTION_CACHE_SIZE:
+                    self._detection_cache.popitem(last=False)
+            results.append(detection)
+        
+        return results
+    
+    def _detect_brand_mentions_lower(self, text: str, text_lower: str, debug: bool = False) -> Dict[str, Any]:
+        """Run brand detection on a text whose lowercased form is already computed"""
         results = {
             'brand_id': None,
             'matched_terms': [],
@@ -295,59 +645,54 @@ class IdempotentRedditFetcher:
                 'all_matches_found': []
             }
         
+        # Scan the text once and group matches by brand in term order
+        matches_by_brand = {}
+        for pos, entry_index in BRAND_MATCHER.iter_matches(text_lower):
+            brand_id, term_index, term = BRAND_MATCHER.terms[entry_index]
+            matches_by_brand.setdefault(brand_id, []).append((term_index, pos, term))
+        
         # Check each brand
-        for brand_id, terms in FINANCIAL_BRANDS.items():
+        for brand_id in BRAND_MATCHER.brand_order:
             brand_matches = []
             brand_positions = []
             
             if debug:
                 results['debug_info']['brands_checked'].append(brand_id)
             
-            # Check each term for this brand (case-insensitive)
-            for term in terms:
-                term_lower = term.lower()
+            for _, pos, term in sorted(matches_by_brand.get(brand_id, [])):
+                term_length = len(term.lower())
                 
-                # Find all occurrences of this term
-                start_pos = 0
-                while True:
-                    pos = text_lower.find(term_lower, start_pos)
-                    if pos == -1:
-                        break
-                    
-                    # Check word boundaries for better matching
-                    is_word_boundary = True
-                    if pos > 0 and text_lower[pos-1].isalnum():
-                        is_word_boundary = False
-                    if pos + len(term_lower) < len(text_lower) and text_lower[pos + len(term_lower)].isalnum():
-                        is_word_boundary = False
-                    
-                    # For short terms like "TD", be more strict about word boundaries
-                    if len(term_lower) <= 3 and not is_word_boundary:
-                        start_pos = pos + 1
-                        continue
-                    
-                    # Record the match
-                    match_info = {
+                # Check word boundaries for better matching
+                is_word_boundary = True
+                if pos > 0 and text_lower[pos-1].isalnum():
+                    is_word_boundary = False
+                if pos + term_length < len(text_lower) and text_lower[pos + term_length].isalnum():
+                    is_word_boundary = False
+                
+                # For short terms like "TD", be more strict about word boundaries
+                if term_length <= 3 and not is_word_boundary:
+                    continue
+                
+                # Record the match
+                match_info = {
+                    'term': term,
+                    'position': pos,
+                    'length': len(term),
+                    'context': text[max(0, pos-20):pos+len(term)+20],
+                    'word_boundary': is_word_boundary,
+                    'confidence': 1.0 if is_word_boundary else 0.7
+                }
+                
+                brand_matches.append(term)
+                brand_positions.append(match_info)
+                
+                if debug:
+                    results['debug_info']['all_matches_found'].append({
+                        'brand_id': brand_id,
                         'term': term,
                         'position': pos,
-                        'length': len(term),
-                        'context': text[max(0, pos-20):pos+len(term)+20],
-                        'word_boundary': is_word_boundary,
-                        'confidence': 1.0 if is_word_boundary else 0.7
-                    }
-                    
-                    brand_matches.append(term)
-                    brand_positions.append(match_info)
-                    
-                    if debug:
-                        results['debug_info']['all_matches_found'].append({
-                            'brand_id': brand_id,
-                            'term': term,
-                            'position': pos,
-                            'context': match_info['context']
-                        })
-                    
-                    start_pos = pos + 1
+                        'context': match_info['context']
+                    })
             
             # If this brand has matches, calculate confidence
             if brand_matches:
@@ -375,18 +720,13 @@ class IdempotentRedditFetcher:
         
         return results
     
-    def fetch_incremental_posts_and_comments(self, 
-                                           subreddit_name: str, 
-                                           brand_terms: List[str],
-                                           since_timestamp: Optional[int] = None,
-                                           initial_fetch: bool = False) -> List[Dict[str, Any]]:
-        """Fetch posts and comments incrementally with pagination"""
-        
-        all_messages = []
-        source_key = f"reddit_{subreddit_name}"
-        
-        # Get last state
+    def _resolve_since(self, source_key: str, since_timestamp: Optional[int], initial_fetch: bool,
+                       fallback_source_key: Optional[str] = None) -> Tuple[int, Optional[str]]:
+        """Resolve the fetch window start for a source from the request or stored cursor"""
+        # Get last state (a shard's first run starts from its subreddit's unsharded cursor)
         last_cursor, last_tie_breaker = self.state_manager.get_state(source_key)
+        if last_cursor is None and fallback_source_key:
+            last_cursor, last_tie_breaker = self.state_manager.get_state(fallback_source_key)
         
         # Calculate overlap window (2 hours for clock skew tolerance)
         overlap_seconds = 2 * 3600
@@ -399,102 +739,642 @@ class IdempotentRedditFetcher:
             # Initial fetch: get last 7 days
             since_timestamp = int((datetime.utcnow() - timedelta(days=7)).timestamp())
         
-        logger.info(f"Fetching {subreddit_name} since {datetime.fromtimestamp(since_timestamp)} (initial={initial_fetch})")
+        return since_timestamp, last_tie_breaker
+    
+    def _resolve_subreddit_since(self, subreddit_name: str, since_timestamp: Optional[int], initial_fetch: bool,
+                                 source_suffix: str = '') -> Tuple[int, Optional[str]]:
+        """_resolve_since for a subreddit's source key (a shard falls back to the unsharded cursor)"""
+        return self._resolve_since(
+            f"reddit_{subreddit_name}{source_suffix}", since_timestamp, initial_fetch,
+            fallback_source_key=f"reddit_{subreddit_name}" if source_suffix else None
+        )
+    
+    def fetch_incremental_posts_and_comments(self, 
+                                           subreddit_name: str, 
+                                           brand_terms: List[str],
+                                           since_timestamp: Optional[int] = None,
+                                           initial_fetch: bool = False) -> List[Dict[str, Any]]:
+        """Fetch posts and comments incrementally with pagination"""
+        results = self.fetch_multireddit_posts_and_comments(
+            [subreddit_name], brand_terms, since_timestamp=since_timestamp, initial_fetch=initial_fetch
+        )
+        return results[subreddit_name]
+    
+    def _init_windows(self, subreddit_names: List[str], since_timestamp: Optional[int],
+                      initial_fetch: bool, source_suffix: str = '') -> Dict[str, Dict[str, Any]]:
+        """Per-subreddit window and cursor tracking, keyed by lowercase name"""
+        windows = {}
+        for subreddit_name in subreddit_names:
+            source_key = f"reddit_{subreddit_name}{source_suffix}"
+            sub_since, last_tie_breaker = self._resolve_subreddit_since(subreddit_name, since_timestamp,
+                                                                        initial_fetch, source_suffix)
+            windows[subreddit_name.lower()] = {
+                'name': subreddit_name,
+                'source_key': source_key,
+                'since': sub_since,
+                'max_timestamp': sub_since,
+                'max_tie_breaker': last_tie_breaker or "",
+                'messages': []
+            }
+            logger.info(f"Fetching {subreddit_name} since {datetime.fromtimestamp(sub_since)} (initial={initial_fetch})")
+        return windows
+    
+    def _search_submissions(self, reddit: praw.Reddit, listing_name: str, query: str, limit: int,
+                            cutoff: Optional[float] = None) -> Tuple[list, bool]:
+        """
+        Run one newest-first search against a subreddit or multireddit
+        Pages are pulled lazily and the search stops at the first result older than
+        cutoff, so quiet listings cost a single page. The caller rate-limits the first
+        page; follow-up pages are rate-limited here. Returns (submissions, truncated);
+        truncated means limit results came back without reaching cutoff.
+        """
+        started_at = time.time()
+        pages = 1
+        try:
+            listing = reddit.subreddit(listing_name).search(query, sort='new', time_filter='all', limit=limit)
+            submissions, pages, stopped_early = self._read_newest_first(listing, cutoff)
+            if stopped_early:
+                with self._stats_lock:
+                    self.search_stats['early_exits'] += 1
+            return submissions, not stopped_early and len(submissions) >= limit
+        finally:
+            with self._stats_lock:
+                self.search_stats['searches'] += 1
+                self.search_stats['pages'] += pages
+            self._observe_api_call(reddit, started_at)
+    
+    def _search_window(self, reddit: praw.Reddit, subreddit_names: List[str], term_group: List[str],
+                       windows: Dict[str, Dict[str, Any]], since_override: Optional[float] = None) -> list:
+        """
+        Search term_group over subreddit_names back to the start of their windows
+        One search returns at most REDDIT_SEARCH_DEPTH results. When it fills up before
+        reaching the window start, the posts older than its last result are out of reach,
+        so the subreddit group (then the term group) is halved and searched again. A
+        single term in a single subreddit that still overflows marks that window
+        truncated, which holds its cursor. The caller rate-limits the first search.
+        """
+        label = '+'.join(subreddit_names)
+        cutoff = min(self._window_since(windows[name.lower()], since_override) for name in subreddit_names)
+        submissions, truncated = self._search_submissions(reddit, label, build_search_query(term_group),
+                                                          REDDIT_SEARCH_DEPTH, cutoff=cutoff)
+        if not truncated:
+            return submissions
+        
+        with self._stats_lock:
+            self.search_stats['truncated'] += 1
+        if len(subreddit_names) > 1:
+            half = len(subreddit_names) // 2
+            parts = [(subreddit_names[:half], term_group), (subreddit_names[half:], term_group)]
+        elif len(term_group) > 1:
+            half = len(term_group) // 2
+            parts = [(subreddit_names, term_group[:half]), (subreddit_names, term_group[half:])]
+        else:
+            logger.error(f"Search for {term_group[0]!r} in r/{label} hit the {REDDIT_SEARCH_DEPTH}-result depth "
+                         f"before reaching its window start; holding the cursor of r/{label}")
+            window = windows[label.lower()]
+            window['truncated'] = True
+            # Everything at or after the oldest result was returned; older matches may be missing
+            oldest = min(submission.created_utc for submission in submissions)
+            window['complete_since'] = max(window.get('complete_since', oldest), oldest)
+            return submissions
         
+        logger.warning(f"Search for {len(term_group)} terms in {label} hit the {REDDIT_SEARCH_DEPTH}-result depth "
+                       f"before reaching its window start; splitting it")
+        with self._stats_lock:
+            self.search_stats['splits'] += 1
+        # The halves cover everything the full search returned, and reach further back
+        submissions = []
+        for part_names, part_terms in parts:
+            self._rate_limit()
+            submissions.extend(self._search_window(reddit, part_names, part_terms, windows, since_override))
+        return submissions
+    
+    def _read_newest_first(self, listing, cutoff: Optional[float]) -> Tuple[list, int, bool]:
+        """Pull items from a newest-first listing until one is older than cutoff; returns (items, pages, stopped_early)"""
+        items = []
+        pages = 1
+        listing = iter(listing)
+        while True:
+            if items and len(items) % REDDIT_LISTING_PAGE_SIZE == 0:
+                # The next item comes from a new page request
+                self._rate_limit()
+                pages += 1
+            try:
+                item = next(listing)
+            except StopIteration:
+                return items, pages, False
+            if cutoff is not None and item.created_utc < cutoff:
+                return items, pages, True
+            items.append(item)
+    
+    def _scan_listing(self, reddit: praw.Reddit, listing_name: str, kind: str, cutoff: float) -> Tuple[list, bool]:
+        """
+        Read a subreddit's /new ('new') or /comments ('comments') listing back to cutoff (caller rate-limits page one)
+        Returns (items, complete). A listing ends after ~1000 items, so one that runs out
+        after LISTING_SCAN_MAX_ITEMS or more without reaching cutoff is incomplete: items
+        older than its last one were never returned.
+        """
+        started_at = time.time()
+        pages = 1
         try:
-            subreddit = self.reddit.subreddit(subreddit_name)
-            max_timestamp = since_timestamp
-            max_tie_breaker = last_tie_breaker or ""
+            listing = getattr(reddit.subreddit(listing_name), kind)(limit=None)
+            items, pages, stopped_early = self._read_newest_first(listing, cutoff)
+            complete = stopped_early or len(items) < LISTING_SCAN_MAX_ITEMS
+            with self._stats_lock:
+                self.scan_stats['posts' if kind == 'new' else 'comments'] += len(items)
+                if not complete:
+                    self.scan_stats['truncated'] += 1
+            return items, complete
+        finally:
+            with self._stats_lock:
+                self.scan_stats['scans'] += 1
+                self.scan_stats['pages'] += pages
+            self._observe_api_call(reddit, started_at)
+    
+    def probe_listing_volume(self, subreddit_name: str) -> Tuple[float, float]:
+        """Posts and comments per hour, measured from one page of /new and one of /comments"""
+        rates = []
+        for kind in ('new', 'comments'):
+            self._rate_limit()
+            started_at = time.time()
+            try:
+                items = list(getattr(self.reddit.subreddit(subreddit_name), kind)(limit=REDDIT_LISTING_PAGE_SIZE))
+            finally:
+                self._observe_api_call(self.reddit, started_at)
+            if not items:
+                rates.append(0.0)
+                continue
+            span_hours = max(1.0, (time.time() - min(item.created_utc for item in items)) / 3600)
+            rates.append(len(items) / span_hours)
+        return rates[0], rates[1]
+    
+    def _fetch_comments(self, reddit: praw.Reddit, submission_id: str) -> list:
+        """Load one sorted, size- and depth-limited comment listing for a submission (caller handles rate limiting)"""
+        started_at = time.time()
+        try:
+            # Response is [submission listing, comment listing]
+            response = reddit.get(API_PATH['submission'].format(id=submission_id), params=self.comment_policy.params())
+            comments = self.comment_policy.select(response[1].children)
+            with self._stats_lock:
+                self.comment_stats['comments_loaded'] += len(comments)
+            return comments
+        finally:
+            self._observe_api_call(reddit, started_at)
+    
+    @staticmethod
+    def _window_since(window: Dict[str, Any], since_override: Optional[float] = None) -> float:
+        """Window start, reaching further back for catch-up searches of demoted terms"""
+        return window['since'] if since_override is None else min(window['since'], since_override)
+    
+    def _route_submissions(self, submissions: list, windows: Dict[str, Dict[str, Any]],
+                           since_override: Optional[float] = None) -> list:
+        """Route each hit back to its subreddit and apply that subreddit's window"""
+        batch_since = min(self._window_since(window, since_override) for window in windows.values())
+        routed = []
+        for submission in submissions:
+            if submission.created_utc < batch_since:
+                continue
+            # Each submission is handled once per run, however many queries return it
+            if submission.id in self._seen_submissions:
+                self.comment_stats['duplicate_submissions'] += 1
+                continue
+            window = windows.get(submission.subreddit.display_name.lower())
+            if window and submission.created_utc >= self._window_since(window, since_override):
+                self._seen_submissions.add(submission.id)
+                routed.append((submission, window))
+        return routed
+    
+    def _comments_unchanged(self, submission) -> bool:
+        """True if an earlier run loaded this submission's comments at its current num_comments (nothing new to emit)"""
+        if self.comment_index and self.comment_index.is_unchanged(submission.id, submission.num_comments):
+            self.comment_stats['persisted_skips'] += 1
+            return True
+        return False
+    
+    def _remember_comments(self, submission_id: str, num_comments: int):
+        self.comment_stats['fetched'] += 1
+        if self.comment_index:
+            self.comment_index.record(submission_id, num_comments)
+    
+    def _handle_submission(self, submission, window: Dict[str, Any], brand_detection: Dict[str, Any],
+                           searched_brands: set):
+        """Emit a matching post and advance its subreddit cursor"""
+        brand_id = brand_detection['brand_id']
+        if brand_id in searched_brands and brand_detection['confidence_score'] > 0.3:
+            post_data = self._process_submission(submission, brand_id, window['name'])
+            if post_data:
+                # Add brand detection metadata
+                post_data['metadata']['brand_detection'] = {
+                    'matched_terms': brand_detection['matched_terms'],
+                    'confidence_score': brand_detection['confidence_score'],
+                    'match_count': len(brand_detection['match_positions'])
+                }
+                window['messages'].append(post_data)
+                self.matched_posts[window['name']] = self.matched_posts.get(window['name'], 0) + 1
+                self._credit_terms(window, brand_detection)
             
-            # Search for each brand term
-            for brand_id, terms in FINANCIAL_BRANDS.items():
-                if not any(term in brand_terms for term in terms):
-                    continue  # Skip if this brand's terms aren't in the search
-                
-                for term in terms:
-                    if term not in brand_terms:
-                        continue
-                        
-                    query = f'"{term}"'
+            # Update max timestamp and tie-breaker
+            if submission.created_utc > window['max_timestamp'] or \
+               (submission.created_utc == window['max_timestamp'] and submission.id > window['max_tie_breaker']):
+                window['max_timestamp'] = submission.created_utc
+                window['max_tie_breaker'] = submission.id
+    
+    def _credit_terms(self, window: Dict[str, Any], brand_detection: Dict[str, Any]):
+        """Credit every term an emitted post or comment matched with a hit in its subreddit (drives term scheduling)"""
+        hits = self.term_hits.setdefault(window['name'], {})
+        for term in {term.lower() for term in brand_detection['matched_terms']}:
+            hits[term] = hits.get(term, 0) + 1
+    
+    def _handle_comments(self, comments: list, window: Dict[str, Any], searched_brands: set,
+                         since_override: Optional[float] = None):
+        """Emit matching comments and advance their subreddit cursor"""
+        since = self._window_since(window, since_override)
+        comments = [c for c in comments if c.created_utc >= since]
+        comment_detections = self.detect_brand_mentions_batch([c.body for c in comments])
+        
+        for comment, brand_detection in zip(comments, comment_detections):
+            brand_id = brand_detection['brand_id']
+            if brand_id in searched_brands and brand_detection['confidence_score'] > 0.3:
+                comment_data = self._process_comment(comment, brand_id, window['name'])
+                if comment_data:
+                    # Add brand detection metadata
+                    comment_data['metadata']['brand_detection'] = {
+                        'matched_terms': brand_detection['matched_terms'],
+                        'confidence_score': brand_detection['confidence_score'],
+                        'match_count': len(brand_detection['match_positions'])
+                    }
+                    window['messages'].append(comment_data)
+                    self._credit_terms(window, brand_detection)
                     
-                    try:
-                        self._rate_limit()
-                        
-                        # Search posts with pagination
-                        limit = 500 if initial_fetch else 100
-                        submissions = list(subreddit.search(query, sort='new', time_filter='all', limit=limit))
-                        
-                        for submission in submissions:
-                            if submission.created_utc < since_timestamp:
-                                continue
-                                
-                            # Use enhanced brand detection for posts
-                            post_text = f"{submission.title}\n\n{submission.selftext}".strip()
-                            brand_detection = self.detect_brand_mentions(post_text)
-                            
-                            if brand_detection['brand_id'] == brand_id and brand_detection['confidence_score'] > 0.3:
-                                post_data = self._process_submission(submission, brand_id, subreddit_name)
-                                if post_data:
-                                    # Add brand detection metadata
-                                    post_data['metadata']['brand_detection'] = {
-                                        'matched_terms': brand_detection['matched_terms'],
-                                        'confidence_score': brand_detection['confidence_score'],
-                                        'match_count': len(brand_detection['match_positions'])
-                                    }
-                                    all_messages.append(post_data)
-                                
-                                # Update max timestamp and tie-breaker
-                                if submission.created_utc > max_timestamp or \
-                                   (submission.created_utc == max_timestamp and submission.id > max_tie_breaker):
-                                    max_timestamp = submission.created_utc
-                                    max_tie_breaker = submission.id
-                            
-                            # Process comments with rate limiting
-                            try:
-                                self._rate_limit()
-                                submission.comments.replace_more(limit=2)
-                                
-                                for comment in submission.comments.list()[:10]:  # Top 10 comments
-                                    if comment.created_utc < since_timestamp:
-                                        continue
-                                    
-                                    # Use enhanced brand detection for comments
-                                    brand_detection = self.detect_brand_mentions(comment.body)
-                                    if brand_detection['brand_id'] == brand_id and brand_detection['confidence_score'] > 0.3:
-                                        comment_data = self._process_comment(comment, brand_id, subreddit_name)
-                                        if comment_data:
-                                            # Add brand detection metadata
-                                            comment_data['metadata']['brand_detection'] = {
-                                                'matched_terms': brand_detection['matched_terms'],
-                                                'confidence_score': brand_detection['confidence_score'],
-                                                'match_count': len(brand_detection['match_positions'])
-                                            }
-                                            all_messages.append(comment_data)
-                                            
-                                            # Update max timestamp and tie-breaker
-                                            if comment.created_utc > max_timestamp or \
-                                               (comment.created_utc == max_timestamp and comment.id > max_tie_breaker):
-                                                max_timestamp = comment.created_utc
-                                                max_tie_breaker = comment.id
-                                                
-                            except Exception as e:
-                                logger.warning(f"Error processing comments for {submission.id}: {e}")
-                                continue
-                        
-                    except Exception as e:
-                        logger.error(f"Error searching {subreddit_name} for '{term}': {e}")
-                        continue
+                    # Update max timestamp and tie-breaker
+                    if comment.created_utc > window['max_timestamp'] or \
+                       (comment.created_utc == window['max_timestamp'] and comment.id > window['max_tie_breaker']):
+                        window['max_timestamp'] = comment.created_utc
+                        window['max_tie_breaker'] = comment.id
+    
+    def _record_searched(self, windows: Dict[str, Dict[str, Any]], term_group: List[str]):
+        for window in windows.values():
+            self.searched_terms.setdefault(window['name'], set()).update(term.lower() for term in term_group)
+    
+    def _finish_windows(self, windows: Dict[str, Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        """Update state for each subreddit that advanced and return messages per subreddit"""
+        for window in windows.values():
+            if window.get('truncated'):
+                # Posts between the window start and the oldest result were never returned;
+                # the next run searches this window again (the seen index drops repeats)
+                logger.warning(f"Not advancing the cursor of {window['name']}: a search was truncated")
+            elif window['max_timestamp'] > window['since']:
+                max_cursor_iso = datetime.fromtimestamp(window['max_timestamp']).isoformat() + 'Z'
+                self.state_manager.update_state(window['source_key'], max_cursor_iso, window['max_tie_breaker'])
+            logger.info(f"Fetched {len(window['messages'])} messages from {window['name']}")
+        return {window['name']: window['messages'] for window in windows.values()}
+    
+    def _handle_search_hits(self, routed: list, searched_brands: set, since_override: Optional[float] = None):
+        """Emit matching posts from routed (submission, window) pairs and the matching comments under them"""
+        # Use enhanced brand detection for posts (memoized across queries)
+        post_detections = self.detect_brand_mentions_batch(
+            [f"{submission.title}\n\n{submission.selftext}".strip() for submission, _ in routed]
+        )
+        
+        for (submission, window), brand_detection in zip(routed, post_detections):
+            self._handle_submission(submission, window, brand_detection, searched_brands)
             
-            # Update state if we processed any messages
-            if max_timestamp > since_timestamp:
-                max_cursor_iso = datetime.fromtimestamp(max_timestamp).isoformat() + 'Z'
-                self.state_manager.update_state(source_key, max_cursor_iso, max_tie_breaker)
+            # Process comments with rate limiting (routing hands each submission over once per run)
+            if self._comments_unchanged(submission):
+                continue
+            try:
+                self._rate_limit()
+                comments = self._fetch_comments(self.reddit, submission.id)
+                self._remember_comments(submission.id, submission.num_comments)
+                self._handle_comments(comments, window, searched_brands, since_override)
+            except Exception as e:
+                logger.warning(f"Error processing comments for {submission.id}: {e}")
+                continue
+    
+    def fetch_multireddit_posts_and_comments(self,
+                                             subreddit_names: List[str],
+                                             brand_terms: List[str],
+                                             since_timestamp: Optional[int] = None,
+                                             initial_fetch: bool = False,
+                                             term_groups: Optional[List[List[str]]] = None,
+                                             resume_point: Optional[Dict[str, Any]] = None,
+                                             on_query_complete=None,
+                                             source_suffix: str = '',
+                                             group_since: Optional[List[Optional[float]]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Fetch posts and comments for a batch of subreddits with one 'sub1+sub2+...' search per query
+        Results are split back per subreddit; each subreddit keeps its own cursor and window
+        
+        resume_point ({'completed_queries', 'windows'}) skips query batches finished by an
+        interrupted run; on_query_complete(completed_queries, windows) is called after each
+        query batch so the caller can drain window messages and checkpoint. group_since
+        optionally gives each term group an earlier start (catch-up for demoted terms).
+        """
+        windows = self._init_windows(subreddit_names, since_timestamp, initial_fetch, source_suffix)
+        batch_label = '+'.join(subreddit_names)
+        
+        # Brands whose terms are part of this search; hits are attributed locally
+        searched_brands = {brand_id for brand_id, terms in FINANCIAL_BRANDS.items()
+                           if any(term in brand_terms for term in terms)}
+        
+        # Pack the terms into as few OR queries as Reddit accepts
+        if term_groups is None:
+            term_groups = plan_search_queries(brand_terms)
+        
+        completed_queries = 0
+        if resume_point:
+            completed_queries = resume_point['completed_queries']
+            for name, position in resume_point['windows'].items():
+                if name in windows:
+                    windows[name]['max_timestamp'] = position['max_timestamp']
+                    windows[name]['max_tie_breaker'] = position['max_tie_breaker']
+                    windows[name]['truncated'] = position.get('truncated', False)
+            logger.info(f"Resuming {batch_label} after {completed_queries}/{len(term_groups)} query batches")
+        
+        for query_index in range(completed_queries, len(term_groups)):
+            term_group = term_groups[query_index]
+            query = build_search_query(term_group)
+            since_override = group_since[query_index] if group_since else None
+            
+            try:
+                self._rate_limit()
                 
-        except Exception as e:
-            logger.error(f"Error processing subreddit {subreddit_name}: {e}")
+                # Search back to the window start, splitting searches that overflow the search depth
+                submissions = self._search_window(self.reddit, subreddit_names, term_group, windows, since_override)
+                self._record_searched(windows, term_group)
+                routed = self._route_submissions(submissions, windows, since_override)
+                self._handle_search_hits(routed, searched_brands, since_override)
+                
+            except Exception as e:
+                logger.error(f"Error searching {batch_label} for {query}: {e}")
+            
+            completed_queries += 1
+            if on_query_complete:
+                on_query_complete(completed_queries, windows)
+        
+        return self._finish_windows(windows)
+    
+    def fetch_listing_scan(self, subreddit_names: List[str], brand_terms: List[str],
+                           since_timestamp: Optional[int] = None, initial_fetch: bool = False,
+                           source_suffix: str = '') -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Read /new and /comments for a batch of subreddits back to their cursors and match locally
+        Used where most traffic is about the brand: a page of 100 items replaces a search per
+        packed query plus a comment-forest request per matching post
+        """
+        windows = self._init_windows(subreddit_names, since_timestamp, initial_fetch, source_suffix)
+        batch_label = '+'.join(subreddit_names)
+        searched_brands = {brand_id for brand_id, terms in FINANCIAL_BRANDS.items()
+                           if any(term in brand_terms for term in terms)}
+        cutoff = min(window['since'] for window in windows.values())
+        
+        self._rate_limit()
+        submissions, posts_complete = self._scan_listing(self.reddit, batch_label, 'new', cutoff)
+        self._rate_limit()
+        comments, comments_complete = self._scan_listing(self.reddit, batch_label, 'comments', cutoff)
+        for kind, items, complete in [('new', submissions, posts_complete), ('comments', comments, comments_complete)]:
+            if not complete:
+                self._hold_unreached_windows(windows, f"/{kind} of r/{batch_label}", items[-1].created_utc)
+        
+        comments_by_window: Dict[str, list] = {}
+        for item, kind in [(submission, 'posts') for submission in submissions] + [(comment, 'comments') for comment in comments]:
+            key = item.subreddit.display_name.lower()
+            window = windows.get(key)
+            if window and item.created_utc >= window['since']:
+                counts = self.scanned_counts.setdefault(window['name'], {'posts': 0, 'comments': 0})
+                counts[kind] += 1
+                if kind == 'comments':
+                    comments_by_window.setdefault(key, []).append(item)
+        
+        routed = self._route_submissions(submissions, windows)
+        post_detections = self.detect_brand_mentions_batch(
+            [f"{submission.title}\n\n{submission.selftext}".strip() for submission, _ in routed]
+        )
+        for (submission, window), brand_detection in zip(routed, post_detections):
+            self._handle_submission(submission, window, brand_detection, searched_brands)
+        for key, window_comments in comments_by_window.items():
+            self._handle_comments(window_comments, windows[key], searched_brands)
+        
+        return self._finish_windows(windows)
+    
+    @staticmethod
+    def _hold_unreached_windows(windows: Dict[str, Dict[str, Any]], listing_label: str, oldest: float):
+        """Mark windows starting before oldest (the last item a listing returned) truncated, which holds their cursors"""
+        for window in windows.values():
+            if window['since'] < oldest:
+                logger.error(f"{listing_label} ended before reaching the window start of {window['name']}; "
+                             f"holding its cursor")
+                window['truncated'] = True
+                window['complete_since'] = max(window.get('complete_since', oldest), oldest)
+    
+    def handle_submission(self, submission, searched_brands: set) -> List[Dict[str, Any]]:
+        """Messages for one submission outside any fetch window (stream worker); detection and record shape as in a run"""
+        window = self._detached_window(submission.subreddit.display_name)
+        detection = self.detect_brand_mentions_batch([f"{submission.title}\n\n{submission.selftext}".strip()])[0]
+        self._handle_submission(submission, window, detection, searched_brands)
+        return window['messages']
+    
+    def handle_comments(self, comments: list, searched_brands: set) -> List[Dict[str, Any]]:
+        """Messages for comments outside any fetch window (stream worker), grouped by subreddit"""
+        groups: Dict[str, Tuple[Dict[str, Any], list]] = {}
+        for comment in comments:
+            name = comment.subreddit.display_name
+            if name.lower() not in groups:
+                groups[name.lower()] = (self._detached_window(name), [])
+            groups[name.lower()][1].append(comment)
+        messages = []
+        for window, window_comments in groups.values():
+            self._handle_comments(window_comments, window, searched_brands)
+            messages.extend(window['messages'])
+        return messages
+    
+    @staticmethod
+    def _detached_window(subreddit_name: str) -> Dict[str, Any]:
+        """A window that accepts any item and whose cursor is never saved"""
+        return {'name': subreddit_name, 'since': 0, 'max_timestamp': 0, 'max_tie_breaker': '', 'messages': []}
+    
+    def scan_listing(self, listing_name: str, kind: str, cutoff: float) -> Tuple[list, bool]:
+        """Rate-limited read of /new ('new') or /comments ('comments') back to cutoff; returns (items, complete)"""
+        self._rate_limit()
+        return self._scan_listing(self.reddit, listing_name, kind, cutoff)
+    
+    def subreddit_stream(self, listing_name: str, kind: str, **kwargs):
+        """PRAW submission or comment stream of a (multi)subreddit on the calling thread's own client"""
+        return getattr(self._thread_reddit().subreddit(listing_name).stream, kind)(**kwargs)
+    
+    def search_time_range(self, subreddit_name: str, brand_terms: List[str],
+                          start: float, end: float) -> Tuple[list, float]:
+        """
+        Posts in r/subreddit_name created in [start, end) that match brand_terms, for historical backfill
+        Reddit search has no date range, so each packed query pages newest-first down to
+        start exactly once; callers bucket the hits by created_utc instead of searching
+        again per time slice. A query that fills the search depth is split by term as in
+        _search_window. Cursors are left alone and search errors propagate. Returns
+        (submissions, complete_since): every match at or after complete_since was returned,
+        older ones are out of reach of search (complete_since == start when none overflowed).
+        """
+        window = {'name': subreddit_name, 'since': start, 'max_timestamp': start,
+                  'max_tie_breaker': '', 'messages': []}
+        windows = {subreddit_name.lower(): window}
+        found = {}
+        for term_group in plan_search_queries(brand_terms):
+            self._rate_limit()
+            for submission in self._search_window(self.reddit, [subreddit_name], term_group, windows):
+                if start <= submission.created_utc < end:
+                    found.setdefault(submission.id, submission)
+        return (sorted(found.values(), key=lambda submission: submission.created_utc, reverse=True),
+                window.get('complete_since', start))
+
+    def fetch_time_slice(self, subreddit_name: str, submissions: list, brand_terms: List[str],
+                         start: float, end: float) -> List[Dict[str, Any]]:
+        """Matching posts created in [start, end) out of search_time_range hits, and the matching comments under them"""
+        window = {'name': subreddit_name, 'since': start, 'max_timestamp': start,
+                  'max_tie_breaker': '', 'messages': []}
+        searched_brands = {brand_id for brand_id, terms in FINANCIAL_BRANDS.items()
+                           if any(term in brand_terms for term in terms)}
+        routed = self._route_submissions([submission for submission in submissions
+                                          if start <= submission.created_utc < end],
+                                         {subreddit_name.lower(): window})
+        self._handle_search_hits(routed, searched_brands)
+        return window['messages']
+    
+    async def _call_limited(self, semaphore: asyncio.Semaphore, func, *args):
+        """Run a blocking Reddit call in the worker pool once a token and an in-flight slot are free"""
+        async with semaphore:
+            with self._stats_lock:
+                self.request_count += 1
+            await self.rate_limiter.acquire_async()
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+    
+    def _search_in_thread(self, subreddit_names: List[str], term_group: List[str],
+                          windows: Dict[str, Dict[str, Any]], since_override: Optional[float] = None) -> list:
+        return self._search_window(self._thread_reddit(), subreddit_names, term_group, windows, since_override)
+    
+    def _comments_in_thread(self, submission_id: str) -> list:
+        # Rebind to this thread's client so no PRAW instance is shared across threads
+        return self._fetch_comments(self._thread_reddit(), submission_id)
+    
+    async def fetch_multireddit_posts_and_comments_async(self,
+                                                         subreddit_names: List[str],
+                                                         brand_terms: List[str],
+                                                         semaphore: asyncio.Semaphore,
+                                                         since_timestamp: Optional[int] = None,
+                                                         initial_fetch: bool = False,
+                                                         term_groups: Optional[List[List[str]]] = None,
+                                                         source_suffix: str = '',
+                                                         group_since: Optional[List[Optional[float]]] = None,
+                                                         routed_ids: Optional[Set[str]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Async variant of fetch_multireddit_posts_and_comments: all searches, then all comment loads, in flight at once
+        routed_ids, if given, collects the submissions this batch handled (its share of _seen_submissions)
+        """
+        windows = self._init_windows(subreddit_names, since_timestamp, initial_fetch, source_suffix)
+        batch_label = '+'.join(subreddit_names)
+        searched_brands = {brand_id for brand_id, terms in FINANCIAL_BRANDS.items()
+                           if any(term in brand_terms for term in terms)}
+        
+        if term_groups is None:
+            term_groups = plan_search_queries(brand_terms)
+        queries = [build_search_query(term_group) for term_group in term_groups]
+        overrides = group_since or [None] * len(term_groups)
+        search_results = await asyncio.gather(*[
+            self._call_limited(semaphore, self._search_in_thread, subreddit_names, term_group, windows, since_override)
+            for term_group, since_override in zip(term_groups, overrides)
+        ], return_exceptions=True)
+        
+        # Results are handled in query order so output matches the sequential path
+        routed = []
+        for query, term_group, since_override, submissions in zip(queries, term_groups, overrides, search_results):
+            if isinstance(submissions, Exception):
+                logger.error(f"Error searching {batch_label} for {query}: {submissions}")
+                continue
+            self._record_searched(windows, term_group)
+            query_routed = self._route_submissions(submissions, windows, since_override)
+            post_detections = self.detect_brand_mentions_batch(
+                [f"{submission.title}\n\n{submission.selftext}".strip() for submission, _ in query_routed]
+            )
+            for (submission, window), brand_detection in zip(query_routed, post_detections):
+                self._handle_submission(submission, window, brand_detection, searched_brands)
+            routed.extend((submission, window, since_override) for submission, window in query_routed)
+        if routed_ids is not None:
+            routed_ids.update(submission.id for submission, _, _ in routed)
+        
+        routed = [(submission, window, since_override) for submission, window, since_override in routed
+                  if not self._comments_unchanged(submission)]
+        fetched = await asyncio.gather(*[
+            self._call_limited(semaphore, self._comments_in_thread, submission.id)
+            for submission, _, _ in routed
+        ], return_exceptions=True)
         
-        logger.info(f"Fetched {len(all_messages)} messages from {subreddit_name}")
-        return all_messages
+        for (submission, window, since_override), comments in zip(routed, fetched):
+            if isinstance(comments, Exception):
+                logger.warning(f"Error processing comments for {submission.id}: {comments}")
+                continue
+            self._remember_comments(submission.id, submission.num_comments)
+            self._handle_comments(comments, window, searched_brands, since_override)
+        
+        return self._finish_windows(windows)
+    
+    async def fetch_batches_async(self,
+                                  subreddit_batches: List[List[str]],
+                                  brand_terms: List[str],
+                                  since_timestamp: Optional[int] = None,
+                                  initial_fetch: bool = False,
+                                  max_in_flight: int = REDDIT_MAX_IN_FLIGHT,
+                                  term_groups: Optional[List[List[str]]] = None,
+                                  source_suffix: str = '',
+                                  batch_plans: Optional[List[Tuple[List[List[str]], Optional[List[Optional[float]]]]]] = None,
+                                  on_batch_complete: Optional[Callable[[List[str], Dict[str, List[Dict[str, Any]]], Set[str]], None]] = None,
+                                  deadline: Optional[float] = None
+                                  ) -> List[Optional[Dict[str, List[Dict[str, Any]]]]]:
+        """
+        Fetch every subreddit batch concurrently under the shared token bucket
+        batch_plans optionally gives each batch its own (term_groups, group_since).
+        on_batch_complete(batch, messages, routed_ids) runs as each batch finishes, so
+        it can be checkpointed while the others are still in flight. Batches still
+        running at deadline (epoch seconds) are cancelled and come back as None;
+        failed batches come back empty.
+        """
+        if batch_plans is None:
+            batch_plans = [(term_groups, None)] * len(subreddit_batches)
+        semaphore = asyncio.Semaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        
+        async def fetch_batch(batch, batch_term_groups, batch_group_since):
+            routed_ids = set()
+            messages = await self.fetch_multireddit_posts_and_comments_async(
+                batch, brand_terms, semaphore, since_timestamp=since_timestamp, initial_fetch=initial_fetch,
+                term_groups=batch_term_groups, source_suffix=source_suffix, group_since=batch_group_since,
+                routed_ids=routed_ids
+            )
+            if on_batch_complete:
+                on_batch_complete(batch, messages, routed_ids)
+            return messages
+        
+        tasks = [asyncio.ensure_future(fetch_batch(batch, batch_term_groups, batch_group_since))
+                 for batch, (batch_term_groups, batch_group_since) in zip(subreddit_batches, batch_plans)]
+        try:
+            timeout = None if deadline is None else max(0.0, deadline - time.time())
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        finally:
+            self._executor.shutdown(wait=False)
+        
+        results = []
+        for batch, task in zip(subreddit_batches, tasks):
+            if task.cancelled():
+                results.append(None)
+            elif task.exception() is not None:
+                if isinstance(task.exception(), PipelineStageError):
+                    raise task.exception()
+                logger.error(f"Error processing subreddits {batch}: {task.exception()}")
+                results.append({})
+            else:
+                results.append(task.result())
+        return results
     
     def _process_submission(self, submission, brand_id: str, subreddit_name: str) -> Optional[Dict[str, Any]]:
         """Process Reddit submission into standardized format with natural ID"""
@@ -568,10 +1448,12 @@ class IdempotentRedditFetcher:
         
         try:
             # Import NLP enrichment function
-            from main_nlp import enrich_reddit_records
+            from main_nlp import NLPEnricher, enrich_reddit_records
+            if self.nlp_enricher is None:
+                self.nlp_enricher = NLPEnricher()
             
             # Process messages with NLP
-            enriched_messages = enrich_reddit_records(messages)
+            enriched_messages = enrich_reddit_records(messages, enricher=self.nlp_enricher)
             logger.info(f"Successfully enriched {len(messages)} messages with NLP analysis")
             return enriched_messages
             
@@ -592,107 +1474,731 @@ class IdempotentRedditFetcher:
                 })
             return messages
     
+    def create_output_sink(self, run_timestamp: str) -> PartitionedNDJSONWriter:
+        """Streaming writer for raw/reddit/dt=.../part-*.jsonl.gz output"""
+        return PartitionedNDJSONWriter(
+            self.storage_client, BUCKET_NAME, run_timestamp,
+            prefix='raw/reddit', max_part_bytes=OUTPUT_PART_MAX_BYTES, chunk_size=OUTPUT_UPLOAD_CHUNK_SIZE
+        )
+    
     def save_to_gcs_partitioned(self, messages: List[Dict[str, Any]], run_timestamp: str):
         """Save messages to GCS in partitioned format with gzip compression"""
         if not messages:
             logger.info("No messages to save")
             return
-        messages_by_date = {}
-        for msg in messages:
-            event_date = msg['ts_event'][:10]  # Extract YYYY-MM-DD
-            if event_date not in messages_by_date:
-                messages_by_date[event_date] = []
-            messages_by_date[event_date].append(msg)
-        
-        bucket = self.storage_client.bucket(BUCKET_NAME)
-        saved_files = []
-        
-        for date_str, date_messages in messages_by_date.items():
-            # Create partitioned path with run timestamp and UUID for uniqueness
-            run_id = f"{run_timestamp}-{uuid.uuid4().hex[:8]}"
-            blob_path = f"raw/reddit/dt={date_str}/part-{run_id}.jsonl.gz"
-            
-            # Convert to NDJSON and compress
-            ndjson_content = '\n'.join([json.dumps(msg, sort_keys=True) for msg in date_messages])
-            compressed_content = gzip.compress(ndjson_content.encode('utf-8'))
+        
+        sink = self.create_output_sink(run_timestamp)
+        sink.write_all(messages)
+        return [saved['path'] for saved in sink.close()]
+
+class RunDeadlineReached(Exception):
+    """Raised at a checkpoint once the run's time budget is spent; the next invocation resumes"""
+
+
+class RedditIngestionRun:
+    """
+    One fetch run over a list of subreddits
+    Fetching, NLP enrichment and the GCS writer run as overlapping pipeline stages
+    joined by bounded queues. Progress (finished subreddit batches, finished query
+    batches, closed parts, staged cursors) is checkpointed from the writer stage
+    so a retried invocation resumes where this one stopped. A checkpoint update
+    only takes effect once every part open when it was taken has been closed: at
+    rollover, at the end of the run, or when a checkpoint has waited
+    checkpoint_roll_seconds (the open parts are rolled then).
+    """
+    
+    def __init__(self, fetcher: IdempotentRedditFetcher, run_key: str, subreddits: List[str],
+                 brand_terms: List[str], since_timestamp: Optional[int] = None, initial_fetch: bool = False,
+                 multireddit_batch_size: int = MULTIREDDIT_BATCH_SIZE, async_fetch: bool = False,
+                 explicit_run_id: bool = False, time_budget_seconds: int = RUN_TIME_BUDGET_SECONDS,
+                 term_groups: Optional[List[List[str]]] = None, source_suffix: str = '',
+                 checkpoint_roll_seconds: int = CHECKPOINT_ROLL_SECONDS):
+        self.fetcher = fetcher
+        self.run_key = run_key
+        self.brand_terms = brand_terms
+        self.term_groups = term_groups or plan_search_queries(brand_terms)
+        self.source_suffix = source_suffix
+        self.since_timestamp = since_timestamp
+        self.initial_fetch = initial_fetch
+        self.async_fetch = async_fetch
+        self.explicit_run_id = explicit_run_id
+        self.time_budget_seconds = time_budget_seconds
+        self.checkpoint_roll_seconds = checkpoint_roll_seconds
+        self.started_at = time.time()
+        self.subreddits = subreddits
+        self.multireddit_batch_size = multireddit_batch_size
+        self.subreddit_batches = [subreddits[i:i + multireddit_batch_size]
+                                  for i in range(0, len(subreddits), multireddit_batch_size)]
+        self.scan_groups: List[List[str]] = []
+        self.checkpoint = RunCheckpoint(fetcher.storage_client, BUCKET_NAME, run_key, prefix=CHECKPOINT_PREFIX)
+        self.sink: Optional[PartitionedNDJSONWriter] = None
+        self.pipeline: Optional[BoundedPipeline] = None
+        self._completed_subreddits: List[str] = []
+        # Checkpoint updates waiting for their output parts to close:
+        # (open part paths, update, new IDs, progress, staged at)
+        self._pending_updates: List[Tuple[Set[str], Callable[[], None], List[str], Dict[str, Any], float]] = []
+        self._seen_staged: Set[str] = set()  # submission IDs already carried by a staged update
+        self._files_recorded = 0  # sink parts already listed in the checkpoint
+        self._request_costs: Dict[str, float] = {}  # subreddit -> API requests spent on it by this invocation
+        # Start of each subreddit's fetch window, captured before this run stages new cursors
+        self._window_starts = {
+            subreddit_name: fetcher._resolve_subreddit_since(subreddit_name, since_timestamp, initial_fetch,
+                                                             source_suffix)[0]
+            for subreddit_name in subreddits
+        }
+    
+    @property
+    def files(self) -> List[Dict[str, Any]]:
+        """Every output part written by this run, across resumed invocations"""
+        return self.checkpoint.data['files']
+    
+    @property
+    def progress(self) -> Dict[str, Any]:
+        return self.checkpoint.data['progress']
+    
+    def _past_deadline(self) -> bool:
+        return self.time_budget_seconds > 0 and time.time() - self.started_at >= self.time_budget_seconds
+    
+    def _new_seen_submissions(self, handled: Optional[Set[str]] = None) -> List[str]:
+        """Submissions handled since the last staged update (only those in handled, if given)"""
+        new_ids = sorted((self.fetcher._seen_submissions if handled is None else handled) - self._seen_staged)
+        self._seen_staged.update(new_ids)
+        return new_ids
+    
+    def _stage_update(self, update: Callable[[], None], new_seen: List[str]):
+        """
+        Called on the writer thread by a pipeline barrier: everything the update covers
+        has been written, and it is applied once the parts holding it are closed. Parts
+        close at rollover, or here once the oldest staged update has waited
+        checkpoint_roll_seconds, so a killed instance loses at most that much work.
+        """
+        progress = json.loads(json.dumps(self.progress))
+        now = time.time()
+        self._pending_updates.append((self.sink.open_part_paths(), update, new_seen, progress, now))
+        if now - self._pending_updates[0][4] >= self.checkpoint_roll_seconds:
+            self.sink.flush()  # the next write opens new parts
+        self._apply_committed_updates()
+    
+    def _apply_committed_updates(self, save: bool = False):
+        """Apply and save every staged update whose output is now in closed parts"""
+        new_seen, progress = [], None
+        while self._pending_updates and self.sink.committed(self._pending_updates[0][0]):
+            _, update, update_seen, progress, _ = self._pending_updates.pop(0)
+            update()
+            new_seen.extend(update_seen)
+        if progress is None and not save:
+            return
+        self.checkpoint.data['files'].extend(self.sink.saved_files[self._files_recorded:])
+        self._files_recorded = len(self.sink.saved_files)
+        self.checkpoint.add_seen_submissions(new_seen)
+        self.checkpoint.save(progress)
+    
+    def _close_parts(self):
+        """Finalize all open parts (end of run or deadline) and apply every staged update"""
+        self.sink.flush()
+        self._apply_committed_updates(save=True)
+    
+    def _unseen(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Drop events whose content was already emitted by an earlier run"""
+        seen_index = self.fetcher.seen_index
+        if seen_index is None:
+            return messages
+        fresh = []
+        for message in messages:
+            if not seen_index.check(message['event_id'], message['content_hash'], message['ts_event']):
+                seen_index.record(message['event_id'], message['content_hash'], message['ts_event'])
+                fresh.append(message)
+        return fresh
+    
+    def _emit(self, batch_messages: Dict[str, List[Dict[str, Any]]]):
+        """Queue new or changed messages for enrichment and writing (blocks while the pipeline is full)"""
+        chunk = {'counts': {}, 'messages': []}
+        for subreddit_name, subreddit_messages in batch_messages.items():
+            subreddit_messages = self._unseen(subreddit_messages)
+            chunk['messages'].extend(subreddit_messages)
+            chunk['counts'][subreddit_name] = len(subreddit_messages)
+        self.pipeline.put(chunk)
+    
+    def _enrich_stage(self, chunk: Dict[str, Any]) -> Dict[str, Any]:
+        if chunk['messages']:
+            logger.info(f"Starting NLP enrichment for {len(chunk['messages'])} messages")
+            chunk['messages'] = self.fetcher._enrich_with_nlp(chunk['messages'])
+        return chunk
+    
+    def _write_stage(self, chunk: Dict[str, Any]):
+        self.sink.write_all(chunk['messages'])
+        counts = self.progress['messages_by_subreddit']
+        for subreddit_name, count in chunk['counts'].items():
+            counts[subreddit_name] = counts.get(subreddit_name, 0) + count
+        self.progress['total_messages'] += len(chunk['messages'])
+        if self._pending_updates:
+            self._apply_committed_updates()  # a part may have rolled over
+    
+    def _resume(self) -> Optional[Dict[str, Any]]:
+        """Pick up an interrupted run; returns the summary if this run_id already finished"""
+        existing = self.checkpoint.load(CHECKPOINT_TTL_SECONDS)
+        if existing is None:
+            return None
+        if existing['status'] == 'complete':
+            # A retry of a finished run_id is answered from the checkpoint; scheduled
+            # runs (derived keys) start a new run
+            if not self.explicit_run_id:
+                return None
+            self.checkpoint.data = existing
+            return dict(existing['summary'], already_complete=True)
+        
+        self.checkpoint.resume_from(existing)
+        self.fetcher.state_manager.restore_pending(existing['pending_cursors'])
+        self.fetcher._seen_submissions.update(self.checkpoint.seen_submissions())
+        self._seen_staged.update(self.fetcher._seen_submissions)
+        if self.fetcher.seen_index:
+            self.fetcher.seen_index.restore(existing.get('unsaved_events', {}))
+        return None
+    
+    def _batch_plan(self, subreddit_batch: List[str]) -> Tuple[List[List[str]], Optional[List[Optional[float]]]]:
+        """
+        Term groups for one subreddit batch, skipping terms the scheduler has backed off
+        Demoted terms that came due are packed into their own queries that search back
+        to when they last ran (less the usual 2 hour overlap), so skipped cycles leave no gap
+        """
+        scheduler = self.fetcher.term_scheduler
+        if scheduler is None:
+            return self.term_groups, None
+        
+        terms = [term for term_group in self.term_groups for term in term_group]
+        regular, catch_up, catch_up_since = scheduler.plan(
+            [f"{subreddit_name}{self.source_suffix}" for subreddit_name in subreddit_batch], terms
+        )
+        if len(regular) == len(terms):
+            return self.term_groups, None
+        
+        regular_groups = plan_search_queries(regular)
+        catch_up_groups = plan_search_queries(catch_up)
+        catch_up_since = catch_up_since - 2 * 3600 if catch_up_since is not None else None
+        logger.info(f"Term schedule for {'+'.join(subreddit_batch)}: {len(regular)} regular, "
+                    f"{len(catch_up)} catch-up, {len(terms) - len(regular) - len(catch_up)} skipped terms")
+        return (regular_groups + catch_up_groups,
+                [None] * len(regular_groups) + [catch_up_since] * len(catch_up_groups))
+    
+    @staticmethod
+    def _scan_label(scan_group: List[str]) -> str:
+        return 'scan:' + '+'.join(scan_group)
+    
+    def _plan_modes(self):
+        """
+        Pick listing scan or term search per subreddit; the plan is kept in the checkpoint
+        so a resumed run finishes the batches it started. Term shards always search.
+        """
+        plan = self.checkpoint.data.get('scan_plan')
+        planner = self.fetcher.scan_planner
+        if plan is None:
+            plan = {'scan_groups': [], 'search': self.subreddits, 'decisions': {}}
+            if planner is not None and not self.source_suffix and not self.initial_fetch:
+                now = time.time()
+                window_hours = {name: max(0.0, now - self._window_starts[name]) / 3600 for name in self.subreddits}
+                query_share = len(self.term_groups) / max(1, min(self.multireddit_batch_size, len(self.subreddits)))
+                plan = planner.plan(self.subreddits, window_hours, query_share,
+                                    probe=self.fetcher.probe_listing_volume)
+            self.checkpoint.data['scan_plan'] = plan
+        
+        self.scan_groups = plan['scan_groups']
+        self.subreddit_batches = [plan['search'][i:i + self.multireddit_batch_size]
+                                  for i in range(0, len(plan['search']), self.multireddit_batch_size)]
+        if self.scan_groups:
+            logger.info(f"Listing scan for {self.scan_groups}, term search for {len(plan['search'])} subreddits")
+    
+    def _scan_batch(self, scan_group: List[str]):
+        """Fetch one group of subreddits by listing scan"""
+        batch_messages = self.fetcher.fetch_listing_scan(
+            scan_group, self.brand_terms,
+            since_timestamp=self.since_timestamp,
+            initial_fetch=self.initial_fetch,
+            source_suffix=self.source_suffix
+        )
+        self._complete_batch(scan_group, batch_messages, label=self._scan_label(scan_group))
+    
+    def _note_requests(self, subreddit_batch: List[str], requests_before: int):
+        for subreddit_name in subreddit_batch:
+            self._request_costs[subreddit_name] = (self.fetcher.request_count - requests_before) / len(subreddit_batch)
+    
+    def _fetch_batch(self, subreddit_batch: List[str]):
+        """Fetch one subreddit batch, checkpointing after every query batch"""
+        label = '+'.join(subreddit_batch)
+        term_groups, group_since = self._batch_plan(subreddit_batch)
+        plan = [term_groups, group_since] if group_since else term_groups
+        queries_hash = hashlib.sha256(json.dumps(plan).encode('utf-8')).hexdigest()[:16]
+        
+        def on_query_complete(completed_queries: int, windows: Dict[str, Dict[str, Any]]):
+            # Drain what this query produced so it is durable before the checkpoint says so
+            drained = {}
+            for window in windows.values():
+                drained[window['name']] = window['messages']
+                window['messages'] = []
+            self._emit(drained)
             
-            # Upload to GCS
-            blob = bucket.blob(blob_path)
-            blob.upload_from_string(compressed_content, content_type='application/gzip')
+            # Snapshot now; staged by the writer once everything queued so far is written
+            positions = {name: {'max_timestamp': window['max_timestamp'],
+                                'max_tie_breaker': window['max_tie_breaker'],
+                                'truncated': window.get('truncated', False)}
+                         for name, window in windows.items()}
+            new_seen = self._new_seen_submissions()
+            unsaved_events = self.fetcher.seen_index.unsaved() if self.fetcher.seen_index else None
+            self.pipeline.barrier(lambda: self._stage_update(
+                lambda: self.checkpoint.record_query_batch(label, queries_hash, completed_queries,
+                                                           positions, unsaved_events),
+                new_seen
+            ))
+            if self._past_deadline():
+                raise RunDeadlineReached(f"Time budget spent in {label} after {completed_queries} query batches")
+        
+        batch_messages = self.fetcher.fetch_multireddit_posts_and_comments(
+            subreddit_names=subreddit_batch,
+            brand_terms=self.brand_terms,
+            since_timestamp=self.since_timestamp,
+            initial_fetch=self.initial_fetch,
+            term_groups=term_groups,
+            resume_point=self.checkpoint.batch_resume_point(label, queries_hash),
+            on_query_complete=on_query_complete,
+            source_suffix=self.source_suffix,
+            group_since=group_since
+        )
+        self._complete_batch(subreddit_batch, batch_messages)
+    
+    def _complete_batch(self, subreddit_batch: List[str], batch_messages: Dict[str, List[Dict[str, Any]]],
+                        label: Optional[str] = None, seen_ids: Optional[Set[str]] = None):
+        """
+        Queue a finished batch's remaining messages, then checkpoint its staged cursors once written
+        seen_ids limits the checkpointed submissions to this batch's own (async batches run
+        side by side; one still in flight must not have its submissions marked handled)
+        """
+        label = label or '+'.join(subreddit_batch)
+        self._emit(batch_messages)
+        self._completed_subreddits.extend(subreddit_batch)
+        
+        # Only cursors of batches whose output is in closed parts are carried in the checkpoint
+        sources = [f"reddit_{subreddit_name}{self.source_suffix}" for subreddit_name in subreddit_batch]
+        batch_cursors = self.fetcher.state_manager.pending(sources)
+        new_seen = self._new_seen_submissions(seen_ids)
+        unsaved_events = self.fetcher.seen_index.unsaved() if self.fetcher.seen_index else None
+        subreddit_count = len(batch_messages)
+        
+        def on_committed():
+            pending_cursors = dict(self.checkpoint.data['pending_cursors'])
+            pending_cursors.update(batch_cursors)
+            self.checkpoint.record_batch_complete(label, pending_cursors)
+            if unsaved_events:
+                # Output is durable now; a retry after a crash should not re-emit it
+                self.fetcher.seen_index.save(unsaved_events)
+        
+        def on_written():
+            self.progress['subreddits_processed'] += subreddit_count
+            self._stage_update(on_committed, new_seen)
+        
+        self.pipeline.barrier(on_written)
+    
+    def _summary(self, status: str) -> Dict[str, Any]:
+        fetcher = self.fetcher
+        return {
+            'status': status,
+            'run_id': self.run_key,
+            'run_timestamp': self.checkpoint.data['run_timestamp'],
+            'resumed': self.checkpoint.resumed,
+            'total_messages': self.progress['total_messages'],
+            'subreddits_processed': self.progress['subreddits_processed'],
+            'messages_by_subreddit': self.progress['messages_by_subreddit'],
+            'files_saved': len(self.checkpoint.data['files']),
+            'initial_fetch': self.initial_fetch,
+            'async_fetch': bool(self.async_fetch),
+            'api_requests_made': fetcher.request_count,
+            'rate_limit': fetcher.rate_limit_stats(),
+            'comment_forests': fetcher.comment_stats,
+            'comment_policy': fetcher.comment_policy.as_dict(),
+            'search_pages': fetcher.search_stats,
+            'listing_scan': {
+                'scan_groups': self.scan_groups,
+                'stats': fetcher.scan_stats,
+                'probes': fetcher.scan_planner.stats['probes'] if fetcher.scan_planner else 0
+            },
+            'seen_events': fetcher.seen_index.stats if fetcher.seen_index else None,
+            'term_schedule': fetcher.term_scheduler.summary() if fetcher.term_scheduler else None,
+            'brand_detection_cache': {
+                'hits': fetcher.detection_cache_hits,
+                'misses': fetcher.detection_cache_misses
+            },
+            'nlp_cache': fetcher.nlp_cache_stats(),
+            'pipeline': self.pipeline.stats() if self.pipeline else None
+        }
+    
+    def _commit(self):
+        """Advance cursors and remember expanded comment forests and emitted events; only called once output is saved"""
+        self.fetcher.state_manager.commit()
+        if self.fetcher.comment_index:
+            self.fetcher.comment_index.save()
+        if self.fetcher.seen_index:
+            self.fetcher.seen_index.save()
+    
+    def _record_term_yield(self):
+        """Close a scheduling cycle for every subreddit fetched by this invocation"""
+        scheduler = self.fetcher.term_scheduler
+        if scheduler is None:
+            return
+        for subreddit_name in self._completed_subreddits:
+            searched = self.fetcher.searched_terms.get(subreddit_name)
+            if searched:
+                scheduler.record(f"{subreddit_name}{self.source_suffix}", sorted(searched),
+                                 self.fetcher.term_hits.get(subreddit_name, {}))
+        scheduler.save()
+    
+    def _record_listing_volumes(self):
+        """Update per-subreddit volume and match rate for the scan/search cost model"""
+        planner = self.fetcher.scan_planner
+        if planner is None or self.source_suffix:
+            return
+        now = time.time()
+        scanned = {name for scan_group in self.scan_groups for name in scan_group}
+        for subreddit_name in self._completed_subreddits:
+            counts = self.fetcher.scanned_counts.get(subreddit_name, {})
+            planner.record(
+                subreddit_name, 'scan' if subreddit_name in scanned else 'search',
+                window_hours=max(0.0, now - self._window_starts[subreddit_name]) / 3600,
+                matched_posts=self.fetcher.matched_posts.get(subreddit_name, 0),
+                scanned_posts=counts.get('posts', 0) if subreddit_name in scanned else None,
+                scanned_comments=counts.get('comments', 0) if subreddit_name in scanned else None
+            )
+        planner.save()
+    
+    def poll_observations(self) -> Dict[str, Dict[str, float]]:
+        """New messages, API requests and window start for every subreddit fetched by this invocation"""
+        return {
+            subreddit_name: {
+                'messages': self.progress['messages_by_subreddit'].get(subreddit_name, 0),
+                'requests': self._request_costs.get(subreddit_name, 0.0),
+                'window_start': self._window_starts[subreddit_name]
+            }
+            for subreddit_name in self._completed_subreddits
+        }
+    
+    def run(self) -> Tuple[Dict[str, Any], int]:
+        finished = self._resume()
+        if finished is not None:
+            return finished, 200
+        
+        if not self.checkpoint.data['run_timestamp']:
+            self.checkpoint.data['run_timestamp'] = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+        self._plan_modes()
+        self.sink = self.fetcher.create_output_sink(self.checkpoint.data['run_timestamp'])
+        self.checkpoint.save()
+        self.pipeline = BoundedPipeline([
+            ('enrich', self._enrich_stage),
+            ('write', self._write_stage)
+        ], maxsize=PIPELINE_QUEUE_SIZE).start()
+        
+        remaining_scans = [scan_group for scan_group in self.scan_groups
+                           if not self.checkpoint.batch_done(self._scan_label(scan_group))]
+        remaining_batches = [batch for batch in self.subreddit_batches
+                             if not self.checkpoint.batch_done('+'.join(batch))]
+        if self.checkpoint.resumed:
+            logger.info(f"{len(remaining_scans) + len(remaining_batches)}/"
+                        f"{len(self.scan_groups) + len(self.subreddit_batches)} subreddit batches left to fetch")
+        
+        try:
+            for scan_group in remaining_scans:
+                requests_before = self.fetcher.request_count
+                try:
+                    self._scan_batch(scan_group)
+                except PipelineStageError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Error scanning subreddits {scan_group}: {e}")
+                    continue
+                self._note_requests(scan_group, requests_before)
+                if self._past_deadline():
+                    raise RunDeadlineReached(f"Time budget spent after listing scan of {scan_group}")
             
-            saved_files.append(f"gs://{BUCKET_NAME}/{blob_path}")
-            logger.info(f"Saved {len(date_messages)} messages to gs://{BUCKET_NAME}/{blob_path}")
+            if self.async_fetch:
+                # Keep many searches and comment loads in flight under the shared token bucket;
+                # each batch is checkpointed as it finishes, and the rest stop at the deadline
+                requests_before = self.fetcher.request_count
+                
+                def on_batch_complete(subreddit_batch, batch_messages, routed_ids):
+                    if batch_messages:  # failed batches come back empty and are retried next run
+                        self._complete_batch(subreddit_batch, batch_messages, seen_ids=routed_ids)
+                
+                deadline = self.started_at + self.time_budget_seconds if self.time_budget_seconds > 0 else None
+                batch_results = asyncio.run(self.fetcher.fetch_batches_async(
+                    remaining_batches,
+                    brand_terms=self.brand_terms,
+                    since_timestamp=self.since_timestamp,
+                    initial_fetch=self.initial_fetch,
+                    term_groups=self.term_groups,
+                    source_suffix=self.source_suffix,
+                    batch_plans=[self._batch_plan(batch) for batch in remaining_batches],
+                    on_batch_complete=on_batch_complete,
+                    deadline=deadline
+                ))
+                # Concurrent batches share the request counter; split the cost evenly
+                self._note_requests([name for batch in remaining_batches for name in batch], requests_before)
+                unfinished = [batch for batch, result in zip(remaining_batches, batch_results) if result is None]
+                if unfinished:
+                    raise RunDeadlineReached(f"Time budget spent with {len(unfinished)} async subreddit batches in flight")
+            else:
+                for i, subreddit_batch in enumerate(remaining_batches, 1):
+                    requests_before = self.fetcher.request_count
+                    try:
+                        self._fetch_batch(subreddit_batch)
+                    except (RunDeadlineReached, PipelineStageError):
+                        raise
+                    except Exception as e:
+                        logger.error(f"Error processing subreddits {subreddit_batch}: {e}")
+                        continue
+                    self._note_requests(subreddit_batch, requests_before)
+                    
+                    # Log progress
+                    logger.info(f"Processed {i}/{len(remaining_batches)} subreddit batches, "
+                                f"{self.progress['total_messages']} total messages")
+                    if self._past_deadline() and i < len(remaining_batches):
+                        raise RunDeadlineReached(f"Time budget spent after {i} subreddit batches")
+        except RunDeadlineReached as e:
+            # Everything up to the last checkpoint is durable; the next invocation resumes from it
+            logger.warning(f"{e}; stopping early, run {self.run_key} will resume on the next invocation")
+            self.pipeline.close()
+            self._close_parts()
+            self._commit()
+            return self._summary('partial'), 202
         
-        return saved_files
+        except BaseException:
+            # Let in-flight work finish so it is not written half-way, without committing anything
+            try:
+                self.pipeline.close()
+            except PipelineStageError:
+                pass
+            self.sink.abort()
+            raise
+        
+        # Drain the pipeline and finalize all open parts
+        self.pipeline.close()
+        self._close_parts()
+        self._commit()
+        self._record_term_yield()
+        self._record_listing_volumes()
+        
+        summary = self._summary('success')
+        self.checkpoint.mark_complete(summary)
+        return summary, 200
+
+def all_brand_terms() -> List[str]:
+    """Every brand term, in FINANCIAL_BRANDS order"""
+    terms = []
+    for brand_terms in FINANCIAL_BRANDS.values():
+        terms.extend(brand_terms)
+    return terms
+
+def parse_request_params(request) -> Dict[str, Any]:
+    """Request body, unwrapping Pub/Sub push / Eventarc envelopes ({'message': {'data': base64-json}})"""
+    request_json = request.get_json(silent=True) or {}
+    message = request_json.get('message')
+    if isinstance(message, dict) and 'data' in message:
+        try:
+            return json.loads(base64.b64decode(message['data']).decode('utf-8')) or {}
+        except Exception as e:
+            logger.warning(f"Could not decode Pub/Sub message data: {e}")
+            return {}
+    return request_json
+
+def resolve_since_timestamp(initial_fetch: bool, target_date: Optional[str]) -> Optional[int]:
+    # For initial fetch or if no target date, process multiple days
+    if initial_fetch or not target_date:
+        return None  # Will use state or default to 7 days
+    # Calculate since timestamp for specific date
+    date_obj = datetime.strptime(target_date, '%Y-%m-%d')
+    return int(date_obj.timestamp())
+
+def coordinate_fanout(params: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """Split subreddits x term groups into shards and publish one work item per shard"""
+    subreddits = params.get('subreddits', RELEVANT_SUBREDDITS)
+    fanout_id = params.get('fanout_id') or f"{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    shards = plan_shards(
+        subreddits,
+        plan_search_queries(all_brand_terms()),
+        subreddits_per_shard=int(params.get('subreddits_per_shard', FANOUT_SUBREDDITS_PER_SHARD)),
+        term_shards=int(params.get('term_shards', FANOUT_TERM_SHARDS))
+    )
+    
+    # Workers share one Reddit OAuth quota: split the request budget across concurrent workers
+    workers = max(1, min(len(shards), FANOUT_MAX_WORKERS))
+    worker_params = {
+        'initial_fetch': params.get('initial_fetch', False),
+        'date': params.get('date'),
+        'async_fetch': params.get('async_fetch', REDDIT_ASYNC_FETCH),
+        'requests_per_minute': REDDIT_REQUESTS_PER_MINUTE / workers,
+        'rate_budget_share': 1.0 / workers
+    }
+    
+    publisher = pubsub_v1.PublisherClient()
+    coordinator = FanoutCoordinator(publisher, storage.Client(), BUCKET_NAME,
+                                    publisher.topic_path(PROJECT_ID, REDDIT_SHARD_TOPIC),
+                                    manifest_prefix=FANOUT_MANIFEST_PREFIX)
+    result = coordinator.publish(fanout_id, shards, worker_params)
+    result['workers'] = workers
+    return result, 200
+
+def run_shard(params: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """Process one fan-out work item and record which files it produced"""
+    shard = params['shard']
+    fanout_id = params['fanout_id']
+    initial_fetch = params.get('initial_fetch', False)
+    term_groups = shard['term_groups']
+    
+    fetcher = IdempotentRedditFetcher(requests_per_minute=params.get('requests_per_minute'),
+                                      rate_budget_share=params.get('rate_budget_share', 1.0))
+    run = RedditIngestionRun(
+        fetcher, f"{fanout_id}-{shard['shard_id']}", shard['subreddits'],
+        [term for term_group in term_groups for term in term_group],
+        since_timestamp=resolve_since_timestamp(initial_fetch, params.get('date')),
+        initial_fetch=initial_fetch,
+        multireddit_batch_size=len(shard['subreddits']),
+        async_fetch=params.get('async_fetch', False),
+        explicit_run_id=True,  # Pub/Sub redeliveries resume or acknowledge the same shard run
+        term_groups=term_groups,
+        source_suffix=shard_source_suffix(shard['term_shard'], shard['term_shards'])
+    )
+    summary, status_code = run.run()
+    if summary['status'] != 'success':
+        # Not acknowledged: Pub/Sub redelivers and the retry resumes from the checkpoint
+        return summary, 503
+    
+    manifest = FanoutManifest(fetcher.storage_client, BUCKET_NAME, fanout_id, manifest_prefix=FANOUT_MANIFEST_PREFIX)
+    manifest.record_shard(shard, summary, run.files)
+    combined = manifest.finalize_if_complete(params['shard_count'])
+    summary['fanout'] = {
+        'fanout_id': fanout_id,
+        'shard_id': shard['shard_id'],
+        'manifest_written': combined is not None
+    }
+    return summary, status_code
+
+def term_report(params: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """Search terms the scheduler is currently backing off, per subreddit"""
+    scheduler = TermYieldScheduler(
+        storage.Client(project=PROJECT_ID), BUCKET_NAME, TERM_SCHEDULER_BLOB,
+        grace_cycles=TERM_BACKOFF_GRACE_CYCLES, max_skip_cycles=TERM_BACKOFF_MAX_SKIP_CYCLES
+    )
+    demoted = scheduler.demoted()
+    subreddit = params.get('subreddit')
+    if subreddit:
+        demoted = [entry for entry in demoted if entry['subreddit'] == subreddit.lower()]
+    return {
+        'status': 'success',
+        'tracked_pairs': len(scheduler.terms),
+        'demoted_pairs': len(demoted),
+        'demoted': demoted
+    }, 200
+
+def create_poll_scheduler(storage_client: storage.Client) -> SubredditPollScheduler:
+    return SubredditPollScheduler(
+        storage_client, BUCKET_NAME, SUBREDDIT_SCHEDULER_BLOB,
+        daily_request_budget=REDDIT_DAILY_REQUEST_BUDGET,
+        min_interval_seconds=SUBREDDIT_POLL_MIN_INTERVAL_SECONDS,
+        max_interval_seconds=SUBREDDIT_POLL_MAX_INTERVAL_SECONDS
+    )
+
+def record_polls(poll_scheduler: SubredditPollScheduler, run: RedditIngestionRun) -> Dict[str, Any]:
+    """Update arrival rates from a finished run and queue each polled subreddit's next poll"""
+    # Intervals count from when the poll started, so an hourly subreddit is due again by the next hourly run
+    polled_at = run.started_at
+    observations = run.poll_observations()
+    for subreddit_name, observation in observations.items():
+        poll_scheduler.record(subreddit_name, observation['messages'], observation['requests'],
+                              observation['window_start'], polled_at=polled_at)
+    poll_scheduler.reschedule(RELEVANT_SUBREDDITS)
+    poll_scheduler.save()
+    
+    report = poll_scheduler.report(RELEVANT_SUBREDDITS)
+    return {
+        'polled': sorted(observations),
+        'daily_request_budget': report['daily_request_budget'],
+        'planned_daily_requests': report['planned_daily_requests'],
+        'expected_lag_hours': report['expected_lag_hours'],
+        'next_due_at': poll_scheduler.next_due_at(RELEVANT_SUBREDDITS)
+    }
+
+def poll_report(params: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """Estimated arrival rates, poll intervals and next-due times for RELEVANT_SUBREDDITS"""
+    report = create_poll_scheduler(storage.Client(project=PROJECT_ID)).report(RELEVANT_SUBREDDITS)
+    return dict(report, status='success'), 200
 
 @functions_framework.http
 def fetch_reddit_data_idempotent(request):
     """Cloud Function entry point for idempotent Reddit fetching"""
     try:
         # Parse request parameters
-        request_json = request.get_json(silent=True) or {}
+        request_json = parse_request_params(request)
         
-        # Parameters
-        initial_fetch = request_json.get('initial_fetch', False)
-        target_date = request_json.get('date')
-        subreddits = request_json.get('subreddits', RELEVANT_SUBREDDITS)
-        
-        # For initial fetch or if no target date, process multiple days
-        if initial_fetch or not target_date:
-            since_timestamp = None  # Will use state or default to 7 days
-        else:
-            # Calculate since timestamp for specific date
-            date_obj = datetime.strptime(target_date, '%Y-%m-%d')
-            since_timestamp = int(date_obj.timestamp())
+        # mode: run (default, one serial run), coordinate (publish shards), shard (fan-out worker),
+        # term_report (demoted search terms) or poll_report (subreddit poll schedule)
+        mode = request_json.get('mode', 'run')
+        if mode == 'coordinate':
+            return coordinate_fanout(request_json)
+        if mode == 'shard':
+            return run_shard(request_json)
+        if mode == 'term_report':
+            return term_report(request_json)
+        if mode == 'poll_report':
+            return poll_report(request_json)
         
         fetcher = IdempotentRedditFetcher()
-        run_timestamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
-        
-        # Collect all brand terms for efficient searching
-        all_brand_terms = []
-        for terms in FINANCIAL_BRANDS.values():
-            all_brand_terms.extend(terms)
-        
-        # Collect all messages
-        all_messages = []
-        processed_subreddits = 0
+        if any(key in request_json for key in ('comment_sort', 'comment_limit', 'comment_depth')):
+            fetcher.comment_policy = CommentPolicy(
+                sort=request_json.get('comment_sort', COMMENT_SORT),
+                limit=int(request_json.get('comment_limit', COMMENT_LIMIT)),
+                depth=int(request_json.get('comment_depth', COMMENT_DEPTH))
+            )
         
-        # Process each subreddit
-        for subreddit_name in subreddits:
-            try:
-                messages = fetcher.fetch_incremental_posts_and_comments(
-                    subreddit_name=subreddit_name,
-                    brand_terms=all_brand_terms,
-                    since_timestamp=since_timestamp,
-                    initial_fetch=initial_fetch
-                )
-                all_messages.extend(messages)
-                processed_subreddits += 1
-                
-                # Log progress
-                if processed_subreddits % 5 == 0:
-                    logger.info(f"Processed {processed_subreddits}/{len(subreddits)} subreddits, {len(all_messages)} total messages")
-                    
-            except Exception as e:
-                logger.error(f"Error processing subreddit {subreddit_name}: {e}")
-                continue
-        
-        # Enrich all messages with NLP analysis
-        logger.info(f"Starting NLP enrichment for {len(all_messages)} messages")
-        enriched_messages = fetcher._enrich_with_nlp(all_messages)
-        
-        # Save enriched data to GCS
-        saved_files = fetcher.save_to_gcs_partitioned(enriched_messages, run_timestamp)
+        # Parameters
+        initial_fetch = request_json.get('initial_fetch', False)
+        target_date = request_json.get('date')
+        subreddits = request_json.get('subreddits')
+        poll_scheduler = None
+        if subreddits is None:
+            if SUBREDDIT_SCHEDULER_ENABLED and not initial_fetch and not target_date:
+                # Scheduled runs poll only the subreddits that are due, most overdue first
+                poll_scheduler = create_poll_scheduler(fetcher.storage_client)
+                subreddits = poll_scheduler.due(RELEVANT_SUBREDDITS)
+                if not subreddits:
+                    return {
+                        'status': 'success',
+                        'message': 'No subreddits due',
+                        'total_messages': 0,
+                        'next_due_at': poll_scheduler.next_due_at(RELEVANT_SUBREDDITS)
+                    }, 200
+                logger.info(f"{len(subreddits)}/{len(RELEVANT_SUBREDDITS)} subreddits due: {subreddits}")
+            else:
+                subreddits = RELEVANT_SUBREDDITS
+        multireddit_batch_size = max(1, int(request_json.get('multireddit_batch_size', MULTIREDDIT_BATCH_SIZE)))
+        async_fetch = request_json.get('async_fetch', REDDIT_ASYNC_FETCH)
         
-        return {
-            'status': 'success',
-            'run_timestamp': run_timestamp,
-            'total_messages': len(all_messages),
-            'subreddits_processed': processed_subreddits,
-            'files_saved': len(saved_files) if saved_files else 0,
+        # Retries of the same request share a checkpoint; pass run_id to name the run explicitly
+        run_id = request_json.get('run_id')
+        run_key = run_id or RunCheckpoint.derive_run_key({
             'initial_fetch': initial_fetch,
-            'api_requests_made': fetcher.request_count
-        }, 200
+            'date': target_date,
+            'subreddits': subreddits,
+            'multireddit_batch_size': multireddit_batch_size,
+            'async_fetch': bool(async_fetch)
+        })
+        
+        run = RedditIngestionRun(
+            fetcher, run_key, subreddits, all_brand_terms(),
+            since_timestamp=resolve_since_timestamp(initial_fetch, target_date),
+            initial_fetch=initial_fetch,
+            multireddit_batch_size=multireddit_batch_size,
+            async_fetch=async_fetch,
+            explicit_run_id=bool(run_id)
+        )
+        summary, status_code = run.run()
+        if poll_scheduler is not None and summary.get('status') == 'success' and not summary.get('already_complete'):
+            summary['poll_schedule'] = record_polls(poll_scheduler, run)
+        return summary, status_code
         
     except Exception as e:
         logger.error(f"Error in fetch_reddit_data_idempotent: {e}")
@@ -0,0 +1,153 @@
+"""
+Bounded producer/consumer pipeline for the Reddit fetcher
+The caller (fetch) feeds items into a chain of worker-thread stages (enrich,
+write) connected by bounded queues, so the stages overlap and a slow stage
+applies backpressure instead of letting work pile up in memory. Barriers let
+the caller run a callback once everything queued before it has cleared every
+stage (used for checkpoints).
+"""
+
+import time
+import queue
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class PipelineStageError(Exception):
+    """A pipeline stage failed; the run must stop"""
+
+
+class _Barrier:
+    def __init__(self, callback: Callable[[], None]):
+        self.callback = callback
+
+
+class _StageTimer:
+    def __init__(self):
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.wait_input_seconds = 0.0
+        self.wait_output_seconds = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'items': self.items,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'wait_input_seconds': round(self.wait_input_seconds, 3),
+            'wait_output_seconds': round(self.wait_output_seconds, 3)
+        }
+
+
+class BoundedPipeline:
+    """
+    stages: [(name, func)] run in order, each on its own thread; func(item) returns
+    the item passed to the next stage. Queues hold at most maxsize items each.
+    """
+
+    def __init__(self, stages: List[Tuple[str, Callable[[Any], Any]]], maxsize: int = 4,
+                 producer_name: str = 'fetch'):
+        self.stages = stages
+        self.producer_name = producer_name
+        self.queues = [queue.Queue(maxsize=max(1, maxsize)) for _ in stages]
+        self.timers = {name: _StageTimer() for name, _ in stages}
+        self.producer_timer = _StageTimer()
+        self.error: Optional[BaseException] = None
+        self._threads: List[threading.Thread] = []
+        self._started_at = None
+        self._closed = False
+
+    def start(self) -> 'BoundedPipeline':
+        self._started_at = time.time()
+        for index, (name, func) in enumerate(self.stages):
+            thread = threading.Thread(target=self._run_stage, args=(index, name, func),
+                                      name=f"pipeline-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def _put(self, index: int, item: Any, timer: _StageTimer):
+        """Blocking put that gives up if a stage has failed (so nothing waits on a dead consumer)"""
+        started = time.time()
+        try:
+            while True:
+                if self.error is not None and item is not _STOP:
+                    raise PipelineStageError(str(self.error)) from self.error
+                try:
+                    self.queues[index].put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+        finally:
+            timer.wait_output_seconds += time.time() - started
+
+    def _run_stage(self, index: int, name: str, func: Callable[[Any], Any]):
+        timer = self.timers[name]
+        is_last = index == len(self.stages) - 1
+        while True:
+            started = time.time()
+            item = self.queues[index].get()
+            timer.wait_input_seconds += time.time() - started
+
+            if item is _STOP:
+                if not is_last:
+                    self._put(index + 1, _STOP, timer)
+                return
+            if self.error is not None:
+                continue  # drain so upstream never blocks
+
+            try:
+                if isinstance(item, _Barrier):
+                    if is_last:
+                        item.callback()
+                    else:
+                        self._put(index + 1, item, timer)
+                    continue
+
+                started = time.time()
+                result = func(item)
+                timer.busy_seconds += time.time() - started
+                timer.items += 1
+                if not is_last:
+                    self._put(index + 1, result, timer)
+            except PipelineStageError:
+                continue
+            except BaseException as e:
+                logger.error(f"Pipeline stage {name} failed: {e}")
+                self.error = e
+
+    def put(self, item: Any):
+        """Feed one item to the first stage; blocks while the pipeline is full"""
+        self._put(0, item, self.producer_timer)
+        self.producer_timer.items += 1
+
+    def barrier(self, callback: Callable[[], None]):
+        """Run callback on the last stage's thread once every earlier item has cleared the pipeline"""
+        self._put(0, _Barrier(callback), self.producer_timer)
+
+    def close(self):
+        """Wait for queued work to finish; raises PipelineStageError if any stage failed"""
+        if not self._closed:
+            self._closed = True
+            self._put(0, _STOP, self.producer_timer)
+            started = time.time()
+            for thread in self._threads:
+                thread.join()
+            self.producer_timer.wait_output_seconds += time.time() - started
+        if self.error is not None:
+            raise PipelineStageError(str(self.error)) from self.error
+
+    def stats(self) -> Dict[str, Any]:
+        wall_seconds = time.time() - self._started_at if self._started_at else 0.0
+        producer = self.producer_timer.as_dict()
+        # The producer's own work is everything it did while not blocked on the pipeline
+        producer['busy_seconds'] = round(max(0.0, wall_seconds - self.producer_timer.wait_output_seconds), 3)
+        del producer['wait_input_seconds']
+        stats = {self.producer_name: producer}
+        stats.update({name: timer.as_dict() for name, timer in self.timers.items()})
+        stats['wall_seconds'] = round(wall_seconds, 3)
+        return stats
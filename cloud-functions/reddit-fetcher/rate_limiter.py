@@ -0,0 +1,174 @@
+"""
+Rate limiting for Reddit API calls
+Token bucket shared by the sequential and async fetch paths, with adaptive
+pacing driven by Reddit's X-Ratelimit-* response headers, and a process-shared
+bucket for multi-process backfills
+"""
+
+import time
+import asyncio
+import threading
+import multiprocessing
+from typing import Dict, Any, Optional
+
+
+class TokenBucket:
+    """Thread-safe token bucket; every Reddit request in a run draws from the same bucket"""
+
+    def __init__(self, requests_per_minute: float, capacity: int = 1):
+        self.rate = requests_per_minute / 60.0  # tokens per second
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+        # Run statistics
+        self.requests = 0
+        self.wait_seconds = 0.0
+
+    def _take(self, now: float) -> float:
+        """Take a token (lock held) and return how long the caller must wait before using it"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        # Tokens may go negative: later callers queue up behind earlier reservations
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def _reserve(self) -> float:
+        with self._lock:
+            wait = self._take(time.monotonic())
+            self.requests += 1
+            self.wait_seconds += wait
+            return wait
+
+    def acquire(self) -> float:
+        """Block until a request may be made; returns seconds waited"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self) -> float:
+        """Await until a request may be made without blocking the event loop"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'wait_seconds': round(self.wait_seconds, 3)
+            }
+
+
+class AdaptiveRateLimiter(TokenBucket):
+    """
+    Paces requests from the budget Reddit reports (X-Ratelimit-Remaining/Used/Reset)
+    Bursts freely while most of the window's budget remains and spreads the
+    remainder over the time left as usage approaches the limit. Spacing is
+    handed out from the last reservation, so concurrent callers queue behind
+    each other, and every request still takes a token from the fixed bucket,
+    which stays the ceiling and is the only pacing until headers are seen or
+    once the window has reset.
+    A fan-out worker sharing the OAuth client with others paces against its
+    budget_share of the reported budget, spread evenly over the time left.
+    """
+
+    def __init__(self, requests_per_minute: float, capacity: int = 1, reserve: int = 5,
+                 budget_share: float = 1.0):
+        super().__init__(requests_per_minute, capacity=capacity)
+        self.reserve = reserve  # requests held back for other clients / retries
+        self.budget_share = min(1.0, max(0.01, budget_share))
+        self.remaining: Optional[float] = None
+        self.used: Optional[float] = None
+        self.reset_at: Optional[float] = None  # epoch seconds
+        self.next_allowed_at: Optional[float] = None  # monotonic time of the next header-paced slot
+        self.header_updates = 0
+
+    def observe(self, remaining: Optional[float], used: Optional[float], reset_timestamp: Optional[float]):
+        """Record the latest rate limit headers"""
+        if remaining is None or reset_timestamp is None:
+            return
+        with self._lock:
+            self.remaining = float(remaining)
+            self.used = float(used or 0)
+            self.reset_at = float(reset_timestamp)
+            self.header_updates += 1
+
+    def _take(self, now: float) -> float:
+        bucket_wait = super()._take(now)  # REDDIT_REQUESTS_PER_MINUTE stays the ceiling
+        wall_now = time.time()
+        if self.remaining is None or self.reset_at is None or wall_now >= self.reset_at:
+            self.remaining = None
+            self.next_allowed_at = None
+            return bucket_wait
+
+        seconds_to_reset = self.reset_at - wall_now
+        self.remaining -= 1  # local estimate until the next response updates it
+        budget = self.remaining * self.budget_share - self.reserve
+        if budget <= 0:
+            # Window (or this worker's share of it) exhausted: wait for it to reset
+            return max(bucket_wait, seconds_to_reset)
+        if self.budget_share < 1.0:
+            # Other workers draw on the same window: no bursting, just this share spread evenly
+            spacing = seconds_to_reset / budget
+        else:
+            window = self.remaining + self.used
+            pressure = 1.0 - (self.remaining / window) if window > 0 else 1.0
+            # No delay while the window is fresh, even spacing over the time left as it drains
+            spacing = (pressure ** 2) * seconds_to_reset / budget
+
+        # Queue behind earlier reservations rather than measuring every wait from now
+        slot = max(now, self.next_allowed_at or now)
+        self.next_allowed_at = slot + spacing
+        return max(bucket_wait, slot - now)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        with self._lock:
+            stats.update({
+                'header_updates': self.header_updates,
+                'remaining': self.remaining,
+                'used': self.used,
+                'reset_in_seconds': round(max(0.0, self.reset_at - time.time()), 1) if self.reset_at else None
+            })
+        return stats
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Token bucket kept in shared memory so worker processes draw from one budget
+    Create it in the parent and hand it to workers at start-up (Pool initargs).
+    Pacing is fixed: X-Ratelimit headers seen by one process are not shared.
+    """
+
+    def __init__(self, requests_per_minute: float, capacity: int = 1, context=None):
+        super().__init__(requests_per_minute, capacity=capacity)
+        # tokens, updated_at (epoch seconds, comparable across processes), requests, wait_seconds
+        self._shared = (context or multiprocessing).Array('d', [float(self.capacity), time.time(), 0.0, 0.0])
+        self._lock = self._shared.get_lock()
+
+    def _reserve(self) -> float:
+        with self._lock:
+            shared = self._shared
+            now = time.time()
+            tokens = min(self.capacity, shared[0] + max(0.0, now - shared[1]) * self.rate) - 1
+            shared[0], shared[1] = tokens, now
+            wait = 0.0 if tokens >= 0 else -tokens / self.rate
+            shared[2] += 1
+            shared[3] += wait
+            return wait
+
+    def observe(self, remaining: Optional[float], used: Optional[float], reset_timestamp: Optional[float]):
+        """Headers are ignored; the shared rate is the budget"""
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'requests': int(self._shared[2]),
+                'wait_seconds': round(self._shared[3], 3)
+            }
@@ -0,0 +1,174 @@
+"""
+Per-subreddit choice between term search and listing scan
+Term search costs one request per packed query (shared by a multireddit batch)
+plus one comment-forest request per matching post. A listing scan reads /new and
+/comments back to the cursor (one request per 100 items) and matches locally,
+so it wins wherever most traffic is about the brand, e.g. r/TDBank. Volumes and
+match rates are learned from earlier runs; a subreddit whose search cost could
+exceed a scan is probed (one page of each listing) to measure its volume.
+"""
+
+import json
+import math
+import time
+import logging
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+from google.cloud import storage
+from google.api_core import exceptions as gcp_exceptions
+
+from state_backends import gcs_merge_write
+
+logger = logging.getLogger(__name__)
+
+LISTING_PAGE_SIZE = 100
+
+
+class ListingScanPlanner:
+    """Observed volume, match rate and mode per subreddit, stored in one GCS object"""
+
+    def __init__(self, storage_client: storage.Client, bucket_name: str, blob_path: str,
+                 max_listing_items: int = 900, switch_margin: float = 0.8,
+                 probe_interval_seconds: int = 86400, max_attempts: int = 8):
+        self.blob = storage_client.bucket(bucket_name).blob(blob_path)
+        self.max_listing_items = max_listing_items  # Reddit listings stop at ~1000 items
+        self.switch_margin = switch_margin
+        self.probe_interval_seconds = probe_interval_seconds
+        self.max_attempts = max_attempts
+        self.subreddits: Dict[str, Dict[str, Any]] = {}  # lowercase name -> entry
+        self._updated: set = set()
+        self.stats = {'probes': 0}
+        self._load()
+
+    def _read(self) -> Tuple[Dict[str, Any], int]:
+        try:
+            data = self.blob.download_as_bytes()
+            return json.loads(data), int(self.blob.generation)
+        except gcp_exceptions.NotFound:
+            return {}, 0
+
+    def _load(self):
+        try:
+            data, _ = self._read()
+            self.subreddits = data.get('subreddits', {})
+            logger.info(f"Loaded listing volumes for {len(self.subreddits)} subreddits")
+        except Exception as e:
+            logger.warning(f"Could not load listing volumes: {e}")
+            self.subreddits = {}
+
+    def _entry(self, subreddit: str) -> Dict[str, Any]:
+        key = subreddit.lower()
+        if key not in self.subreddits:
+            self.subreddits[key] = {'name': subreddit, 'mode': 'search'}
+        return self.subreddits[key]
+
+    @staticmethod
+    def _smooth(entry: Dict[str, Any], field: str, value: float, weight: float = 0.3):
+        entry[field] = value if entry.get(field) is None else (1 - weight) * entry[field] + weight * value
+
+    def _search_cost(self, entry: Dict[str, Any], window_hours: float, query_share: float) -> float:
+        return query_share + entry.get('matched_posts_per_hour', 0.0) * window_hours
+
+    def _scan_items(self, entry: Dict[str, Any], window_hours: float) -> Tuple[float, float]:
+        return entry['posts_per_hour'] * window_hours, entry['comments_per_hour'] * window_hours
+
+    @staticmethod
+    def _scan_cost(posts: float, comments: float) -> float:
+        return max(1, math.ceil(posts / LISTING_PAGE_SIZE)) + max(1, math.ceil(comments / LISTING_PAGE_SIZE))
+
+    def plan(self, subreddits: List[str], window_hours: Dict[str, float], query_share: float,
+             probe: Optional[Callable[[str], Tuple[float, float]]] = None) -> Dict[str, Any]:
+        """
+        Split subreddits into listing-scan groups and term-search subreddits
+        query_share: search requests per subreddit per poll (packed queries / batch size).
+        probe(subreddit) -> (posts_per_hour, comments_per_hour) measures volume when needed.
+        Scan groups are packed so each listing stays within max_listing_items.
+        """
+        now = time.time()
+        decisions = {}
+        scan = []
+        for name in subreddits:
+            entry = self._entry(name)
+            hours = window_hours[name]
+            search_cost = self._search_cost(entry, hours, query_share)
+            # Only measure volume where a scan (>= 2 requests) could beat searching
+            stale = now - entry.get('volume_observed_at', 0) > self.probe_interval_seconds
+            if probe and stale and search_cost * self.switch_margin >= 2:
+                try:
+                    posts_per_hour, comments_per_hour = probe(name)
+                    self.stats['probes'] += 1
+                    self._smooth(entry, 'posts_per_hour', posts_per_hour)
+                    self._smooth(entry, 'comments_per_hour', comments_per_hour)
+                    entry['volume_observed_at'] = now
+                    self._updated.add(name.lower())
+                except Exception as e:
+                    logger.warning(f"Could not probe listing volume for {name}: {e}")
+
+            decision = {'mode': 'search', 'search_cost': round(search_cost, 1)}
+            if entry.get('posts_per_hour') is not None:
+                posts, comments = self._scan_items(entry, hours)
+                scan_cost = self._scan_cost(posts, comments)
+                decision['scan_cost'] = scan_cost
+                fits = posts <= self.max_listing_items and comments <= self.max_listing_items
+                # Hysteresis: switch only on a clear win, so modes don't flap run to run
+                margin = 1.0 if entry['mode'] == 'scan' else self.switch_margin
+                if fits and scan_cost < search_cost * margin:
+                    decision['mode'] = 'scan'
+                    scan.append((name, posts, comments))
+            decisions[name] = decision
+
+        # First-fit pack scan subreddits into multireddit listings (quiet ones share pages)
+        groups, loads = [], []
+        for name, posts, comments in sorted(scan, key=lambda item: -(item[1] + item[2])):
+            for i, (group_posts, group_comments) in enumerate(loads):
+                if group_posts + posts <= self.max_listing_items and group_comments + comments <= self.max_listing_items:
+                    groups[i].append(name)
+                    loads[i] = (group_posts + posts, group_comments + comments)
+                    break
+            else:
+                groups.append([name])
+                loads.append((posts, comments))
+
+        scanned = {name for name, _, _ in scan}
+        return {
+            'scan_groups': groups,
+            'search': [name for name in subreddits if name not in scanned],
+            'decisions': decisions
+        }
+
+    def record(self, subreddit: str, mode: str, window_hours: float, matched_posts: int,
+               scanned_posts: Optional[int] = None, scanned_comments: Optional[int] = None):
+        """Fold one run's observations into the subreddit's volume and match rate"""
+        if window_hours <= 0:
+            return
+        entry = self._entry(subreddit)
+        entry['mode'] = mode
+        self._smooth(entry, 'matched_posts_per_hour', matched_posts / window_hours)
+        if mode == 'scan' and scanned_posts is not None:
+            self._smooth(entry, 'posts_per_hour', scanned_posts / window_hours)
+            self._smooth(entry, 'comments_per_hour', (scanned_comments or 0) / window_hours)
+            entry['volume_observed_at'] = time.time()
+        if entry.get('posts_per_hour'):
+            entry['match_rate'] = round(min(1.0, entry['matched_posts_per_hour'] / entry['posts_per_hour']), 4)
+        self._updated.add(subreddit.lower())
+
+    def save(self):
+        """Merge this run's subreddits into the stored volumes (generation-matched for concurrent workers)"""
+        if not self._updated:
+            return
+
+        def merge(data: Dict[str, Any]) -> Dict[str, Any]:
+            subreddits = data.get('subreddits', {})
+            subreddits.update({key: self.subreddits[key] for key in self._updated})
+            return {'subreddits': subreddits}
+
+        try:
+            saved = gcs_merge_write(self.blob, self._read, merge, self.max_attempts)
+        except Exception as e:
+            logger.error(f"Could not save listing volumes: {e}")
+            return
+        if not saved:
+            logger.error(f"Could not save listing volumes after {self.max_attempts} attempts")
+            return
+        logger.info(f"Saved listing volumes for {len(self._updated)} subreddits")
+        self._updated = set()
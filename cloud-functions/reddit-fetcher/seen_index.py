@@ -0,0 +1,181 @@
+"""
+Persisted index of Reddit events already emitted
+Maps event_id -> content_hash so unchanged posts/comments returned again by the
+overlap window or by several term queries are dropped before NLP enrichment
+and before they are written. Recent events are kept exactly; older ones live
+in one Bloom filter per event day, which keeps the index small.
+"""
+
+import json
+import math
+import zlib
+import base64
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Tuple
+
+from google.cloud import storage
+from google.api_core import exceptions as gcp_exceptions
+
+from state_backends import gcs_merge_write
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter (double hashing over sha256)"""
+
+    def __init__(self, capacity: int, error_rate: float, num_bits: Optional[int] = None,
+                 num_hashes: Optional[int] = None, bits: Optional[bytearray] = None):
+        self.num_bits = num_bits or max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = num_hashes or max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bits if bits is not None else bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.sha256(key.encode('utf-8')).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:16], 'big') | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'num_bits': self.num_bits,
+            'num_hashes': self.num_hashes,
+            'bits': base64.b64encode(zlib.compress(bytes(self.bits))).decode('ascii')
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'BloomFilter':
+        return cls(0, 0, num_bits=data['num_bits'], num_hashes=data['num_hashes'],
+                   bits=bytearray(zlib.decompress(base64.b64decode(data['bits']))))
+
+
+class SeenEventIndex:
+    """
+    event_id -> content_hash for events emitted by earlier runs, stored in one GCS object
+    Events dated within recent_days are kept in an exact map (so edits are always
+    caught); older events are looked up in per-day Bloom filters keyed by
+    event_id:content_hash and dropped entirely after retention_days.
+    """
+
+    def __init__(self, storage_client: storage.Client, bucket_name: str, blob_path: str,
+                 recent_days: int = 3, retention_days: int = 30, bloom_capacity: int = 20000,
+                 error_rate: float = 0.001, max_attempts: int = 8):
+        self.blob = storage_client.bucket(bucket_name).blob(blob_path)
+        self.recent_days = recent_days
+        self.retention_days = retention_days
+        self.bloom_capacity = bloom_capacity
+        self.error_rate = error_rate
+        self.max_attempts = max_attempts
+        self.recent: Dict[str, Tuple[str, str]] = {}  # event_id -> (content_hash, event day)
+        self.blooms: Dict[str, BloomFilter] = {}  # event day -> filter
+        self._added: Dict[str, Tuple[str, str]] = {}  # recorded by this run, merged on save
+        self.stats = {'new': 0, 'changed': 0, 'unchanged': 0}
+        self._lock = threading.Lock()  # records are made by the fetch thread, saved by the writer
+        self._load()
+
+    def _read(self) -> Tuple[Dict[str, Any], int]:
+        try:
+            data = self.blob.download_as_bytes()
+            return json.loads(data), int(self.blob.generation)
+        except gcp_exceptions.NotFound:
+            return {}, 0
+
+    def _load(self):
+        try:
+            data, _ = self._read()
+            self.recent = {event_id: tuple(entry) for event_id, entry in data.get('recent', {}).items()}
+            self.blooms = {day: BloomFilter.from_dict(bloom) for day, bloom in data.get('blooms', {}).items()}
+            logger.info(f"Loaded seen-event index: {len(self.recent)} recent events, {len(self.blooms)} daily filters")
+        except Exception as e:
+            logger.warning(f"Could not load seen-event index: {e}")
+            self.recent, self.blooms = {}, {}
+
+    def _bloom(self, day: str) -> BloomFilter:
+        if day not in self.blooms:
+            self.blooms[day] = BloomFilter(self.bloom_capacity, self.error_rate)
+        return self.blooms[day]
+
+    def check(self, event_id: str, content_hash: str, ts_event: str) -> bool:
+        """True if this exact event content was already emitted; updates new/changed/unchanged counts"""
+        entry = self.recent.get(event_id)
+        if entry is not None:
+            unchanged = entry[0] == content_hash
+            self.stats['unchanged' if unchanged else 'changed'] += 1
+            return unchanged
+
+        bloom = self.blooms.get(ts_event[:10])
+        if bloom is not None and f"{event_id}:{content_hash}" in bloom:
+            self.stats['unchanged'] += 1
+            return True
+        self.stats['new'] += 1
+        return False
+
+    def record(self, event_id: str, content_hash: str, ts_event: str):
+        day = ts_event[:10]
+        with self._lock:
+            self.recent[event_id] = (content_hash, day)
+            self._added[event_id] = (content_hash, day)
+            self._bloom(day).add(f"{event_id}:{content_hash}")
+
+    def unsaved(self) -> Dict[str, Tuple[str, str]]:
+        """Records made since the last save (carried in run checkpoints)"""
+        with self._lock:
+            return dict(self._added)
+
+    def restore(self, records: Dict[str, Any]):
+        """Re-apply records an interrupted run made but never saved"""
+        for event_id, (content_hash, day) in records.items():
+            self.record(event_id, content_hash, day)
+
+    def _merge_into(self, data: Dict[str, Any], records: Dict[str, Tuple[str, str]]) -> Dict[str, Any]:
+        """Fold records into the stored index and apply retention"""
+        today = datetime.utcnow().date()
+        recent_from = (today - timedelta(days=self.recent_days)).isoformat()
+        retain_from = (today - timedelta(days=self.retention_days)).isoformat()
+
+        recent = {event_id: tuple(entry) for event_id, entry in data.get('recent', {}).items()}
+        blooms = {day: BloomFilter.from_dict(bloom) for day, bloom in data.get('blooms', {}).items()}
+        for event_id, (content_hash, day) in records.items():
+            recent[event_id] = (content_hash, day)
+            if day not in blooms:
+                blooms[day] = BloomFilter(self.bloom_capacity, self.error_rate)
+            blooms[day].add(f"{event_id}:{content_hash}")
+
+        return {
+            'recent': {event_id: list(entry) for event_id, entry in recent.items() if entry[1] >= recent_from},
+            'blooms': {day: bloom.to_dict() for day, bloom in blooms.items() if day >= retain_from}
+        }
+
+    def save(self, records: Optional[Dict[str, Tuple[str, str]]] = None):
+        """
+        Merge records (default: everything unsaved) into the stored index; generation-matched,
+        so concurrent runs don't clobber each other
+        """
+        if records is None:
+            records = self.unsaved()
+        if not records:
+            return
+        try:
+            saved = gcs_merge_write(self.blob, self._read, lambda data: self._merge_into(data, records),
+                                    self.max_attempts)
+        except Exception as e:
+            logger.error(f"Could not save seen-event index: {e}")
+            return
+        if not saved:
+            logger.error(f"Could not save seen-event index after {self.max_attempts} attempts")
+            return
+        with self._lock:
+            for event_id, entry in records.items():
+                if self._added.get(event_id) == tuple(entry):
+                    del self._added[event_id]
+        logger.info(f"Saved seen-event index with {len(records)} new or changed events")
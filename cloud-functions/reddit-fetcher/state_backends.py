@@ -0,0 +1,295 @@
+"""
+Ingestion cursor storage backends
+Key-value stores for source -> (cursor_iso, tie_breaker_id) used by IngestionState:
+SQLite/local file for tests and local runs, a single GCS object with
+generation-match preconditions for production, and BigQuery (compacted table
+or append-only audit log)
+"""
+
+import json
+import time
+import random
+import logging
+import sqlite3
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, Any, Tuple, Optional, Callable
+
+from google.cloud import bigquery
+from google.cloud import storage
+from google.api_core import exceptions as gcp_exceptions
+
+logger = logging.getLogger(__name__)
+
+Cursor = Tuple[Optional[str], Optional[str]]  # (cursor_iso, tie_breaker_id)
+
+
+def is_newer_cursor(candidate: Cursor, current: Optional[Cursor]) -> bool:
+    """True if candidate should replace current (cursors never move backwards)"""
+    if current is None or current[0] is None:
+        return True
+    if candidate[0] is None:
+        return False
+    return (candidate[0], candidate[1] or '') >= (current[0], current[1] or '')
+
+
+class StateBackend(ABC):
+    """Interface for cursor storage"""
+
+    name = 'base'
+
+    @abstractmethod
+    def load_all(self, source_prefix: str = '') -> Dict[str, Cursor]:
+        """Return every cursor whose source starts with source_prefix"""
+
+    @abstractmethod
+    def commit(self, updates: Dict[str, Cursor]):
+        """Persist cursor updates without losing concurrent writers' updates"""
+
+
+class SQLiteStateBackend(StateBackend):
+    """Local-file backend for tests and local runs"""
+
+    name = 'sqlite'
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ingest_state (
+                    source TEXT PRIMARY KEY,
+                    cursor_iso TEXT,
+                    tie_breaker_id TEXT,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def load_all(self, source_prefix: str = '') -> Dict[str, Cursor]:
+        with self._connect() as conn:
+            # A plain prefix compare: LIKE would treat '_' and '%' in sources as wildcards and ignore case
+            rows = conn.execute(
+                "SELECT source, cursor_iso, tie_breaker_id FROM ingest_state "
+                "WHERE substr(source, 1, length(?)) = ?",
+                (source_prefix, source_prefix)
+            ).fetchall()
+        return {source: (cursor_iso, tie_breaker_id) for source, cursor_iso, tie_breaker_id in rows}
+
+    def commit(self, updates: Dict[str, Cursor]):
+        if not updates:
+            return
+        now = datetime.utcnow().isoformat() + 'Z'
+        conn = self._connect()
+        try:
+            # Upsert in one write transaction; the WHERE guard keeps the newest cursor
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("""
+                INSERT INTO ingest_state (source, cursor_iso, tie_breaker_id, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(source) DO UPDATE SET
+                    cursor_iso = excluded.cursor_iso,
+                    tie_breaker_id = excluded.tie_breaker_id,
+                    updated_at = excluded.updated_at
+                WHERE ingest_state.cursor_iso IS NULL
+                   OR excluded.cursor_iso > ingest_state.cursor_iso
+                   OR (excluded.cursor_iso = ingest_state.cursor_iso
+                       AND IFNULL(excluded.tie_breaker_id, '') >= IFNULL(ingest_state.tie_breaker_id, ''))
+            """, [(source, cursor_iso, tie_breaker_id, now)
+                  for source, (cursor_iso, tie_breaker_id) in updates.items()])
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def gcs_merge_write(blob: storage.Blob, load: Callable[[], Tuple[Dict[str, Any], int]],
+                    merge: Callable[[Dict[str, Any]], Dict[str, Any]], max_attempts: int = 8) -> bool:
+    """
+    Read-merge-write of one JSON object shared by concurrent instances
+    load() returns the stored (data, generation), generation 0 if the object does
+    not exist; merge(data) returns the object to write. The upload is conditional
+    on that generation, so an instance that lost the race re-reads and merges again
+    after a jittered backoff. Returns False if every attempt lost.
+    """
+    for attempt in range(max_attempts):
+        data, generation = load()
+        try:
+            blob.upload_from_string(
+                json.dumps(merge(data), sort_keys=True),
+                content_type='application/json',
+                if_generation_match=generation
+            )
+            return True
+        except gcp_exceptions.PreconditionFailed:
+            delay = min(2.0, 0.1 * (2 ** attempt)) * random.uniform(0.5, 1.5)
+            logger.info(f"{blob.name} changed concurrently, merging again in {delay:.2f}s")
+            time.sleep(delay)
+    return False
+
+
+class GCSStateBackend(StateBackend):
+    """
+    All cursors in one JSON object; writes use read-merge-write with
+    if_generation_match so concurrent instances never lose each other's updates
+    """
+
+    name = 'gcs'
+
+    def __init__(self, storage_client: storage.Client, bucket_name: str, blob_path: str, max_attempts: int = 8):
+        self.blob = storage_client.bucket(bucket_name).blob(blob_path)
+        self.max_attempts = max_attempts
+
+    def _read(self) -> Tuple[Dict[str, Dict[str, str]], int]:
+        """Return (cursors, generation); generation 0 means the object does not exist yet"""
+        try:
+            data = self.blob.download_as_bytes()
+            return json.loads(data), int(self.blob.generation)
+        except gcp_exceptions.NotFound:
+            return {}, 0
+
+    def load_all(self, source_prefix: str = '') -> Dict[str, Cursor]:
+        cursors, _ = self._read()
+        return {source: (entry.get('cursor_iso'), entry.get('tie_breaker_id'))
+                for source, entry in cursors.items() if source.startswith(source_prefix)}
+
+    def commit(self, updates: Dict[str, Cursor]):
+        if not updates:
+            return
+
+        def merge(cursors: Dict[str, Any]) -> Dict[str, Any]:
+            now = datetime.utcnow().isoformat() + 'Z'
+            for source, cursor in updates.items():
+                current = cursors.get(source)
+                current_cursor = (current.get('cursor_iso'), current.get('tie_breaker_id')) if current else None
+                if is_newer_cursor(cursor, current_cursor):
+                    cursors[source] = {'cursor_iso': cursor[0], 'tie_breaker_id': cursor[1], 'updated_at': now}
+            return cursors
+
+        if not gcs_merge_write(self.blob, self._read, merge, self.max_attempts):
+            raise RuntimeError(f"Could not commit ingestion state after {self.max_attempts} attempts")
+
+
+class BigQueryStateBackend(StateBackend):
+    """Keyed, compacted BigQuery table; one query to load, one MERGE to commit"""
+
+    name = 'bigquery'
+
+    def __init__(self, bq_client: bigquery.Client, project_id: str, dataset_id: str,
+                 table_id: str = 'ingest_state_current', history_table_id: str = 'ingest_state'):
+        self.bq_client = bq_client
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+        self.table_id = table_id
+        self.history_table_id = history_table_id  # legacy append-only log, used to seed the compacted table
+        self._table_ready = False
+
+    def _ensure_state_table(self):
+        """Create the compacted state table if it doesn't exist, seeded with the latest cursor per source"""
+        if self._table_ready:
+            return
+        self._table_ready = True
+        table_ref = self.bq_client.dataset(self.dataset_id).table(self.table_id)
+
+        try:
+            self.bq_client.get_table(table_ref)
+            logger.info("Ingestion state table exists")
+        except Exception:
+            # Create table (one row per source, clustered on the key)
+            schema = [
+                bigquery.SchemaField("source", "STRING", mode="REQUIRED"),
+                bigquery.SchemaField("cursor_iso", "STRING", mode="NULLABLE"),
+                bigquery.SchemaField("tie_breaker_id", "STRING", mode="NULLABLE"),
+                bigquery.SchemaField("updated_at", "TIMESTAMP", mode="REQUIRED"),
+            ]
+
+            table = bigquery.Table(table_ref, schema=schema)
+            table.clustering_fields = ["source"]
+            table = self.bq_client.create_table(table)
+            logger.info(f"Created ingestion state table: {table.table_id}")
+            self._seed_from_history()
+
+    def _seed_from_history(self):
+        """Compact the legacy append-only state log into the keyed table"""
+        query = f"""
+        INSERT INTO `{self.project_id}.{self.dataset_id}.{self.table_id}`
+        (source, cursor_iso, tie_breaker_id, updated_at)
+        SELECT source, cursor_iso, tie_breaker_id, updated_at
+        FROM `{self.project_id}.{self.dataset_id}.{self.history_table_id}`
+        WHERE TRUE
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY source ORDER BY updated_at DESC) = 1
+        """
+
+        try:
+            self.bq_client.query(query).result()
+            logger.info("Seeded ingestion state table from history")
+        except Exception as e:
+            logger.warning(f"Could not seed ingestion state from history: {e}")
+
+    def load_all(self, source_prefix: str = '') -> Dict[str, Cursor]:
+        self._ensure_state_table()
+        query = f"""
+        SELECT source, cursor_iso, tie_breaker_id
+        FROM `{self.project_id}.{self.dataset_id}.{self.table_id}`
+        WHERE STARTS_WITH(source, @source_prefix)
+        """
+
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ScalarQueryParameter("source_prefix", "STRING", source_prefix)
+            ]
+        )
+
+        return {row.source: (row.cursor_iso, row.tie_breaker_id)
+                for row in self.bq_client.query(query, job_config=job_config)}
+
+    def commit(self, updates: Dict[str, Cursor]):
+        if not updates:
+            return
+        self._ensure_state_table()
+
+        query = f"""
+        MERGE `{self.project_id}.{self.dataset_id}.{self.table_id}` T
+        USING UNNEST(@updates) S
+        ON T.source = S.source
+        WHEN MATCHED AND (T.cursor_iso IS NULL OR S.cursor_iso >= T.cursor_iso) THEN
+          UPDATE SET cursor_iso = S.cursor_iso, tie_breaker_id = S.tie_breaker_id, updated_at = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED THEN
+          INSERT (source, cursor_iso, tie_breaker_id, updated_at)
+          VALUES (S.source, S.cursor_iso, S.tie_breaker_id, CURRENT_TIMESTAMP())
+        """
+
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[bigquery.ArrayQueryParameter("updates", "STRUCT", [
+                bigquery.StructQueryParameter(
+                    None,
+                    bigquery.ScalarQueryParameter("source", "STRING", source),
+                    bigquery.ScalarQueryParameter("cursor_iso", "STRING", cursor_iso),
+                    bigquery.ScalarQueryParameter("tie_breaker_id", "STRING", tie_breaker_id),
+                )
+                for source, (cursor_iso, tie_breaker_id) in updates.items()
+            ])]
+        )
+
+        self.bq_client.query(query, job_config=job_config).result()
+
+
+class BigQueryAuditSink:
+    """Appends committed cursors to the legacy ingest_state log for auditing (streaming insert, best-effort)"""
+
+    def __init__(self, bq_client: bigquery.Client, project_id: str, dataset_id: str, table_id: str = 'ingest_state'):
+        self.bq_client = bq_client
+        self.table = f"{project_id}.{dataset_id}.{table_id}"
+
+    def record(self, updates: Dict[str, Cursor]):
+        if not updates:
+            return
+        now = datetime.utcnow().isoformat() + 'Z'
+        rows = [{'source': source, 'cursor_iso': cursor_iso, 'tie_breaker_id': tie_breaker_id, 'updated_at': now}
+                for source, (cursor_iso, tie_breaker_id) in updates.items()]
+        try:
+            errors = self.bq_client.insert_rows_json(self.table, rows)
+            if errors:
+                logger.warning(f"Ingestion state audit insert errors: {errors}")
+        except Exception as e:
+            logger.warning(f"Could not write ingestion state audit rows: {e}")
@@ -0,0 +1,291 @@
+"""
+Long-running Reddit stream worker (Cloud Run)
+Follows the submission and comment streams of the tracked subreddits, runs the
+fetcher's brand detection on every item and writes micro-batches through the
+partitioned NDJSON sink, so a complaint lands in raw/reddit seconds after it
+is posted instead of at the next scheduled run. The stream position is
+checkpointed after every micro-batch; on restart the worker first reads /new
+and /comments back to that position, so downtime leaves no gap (within
+Reddit's ~1000-item listing depth; the scheduled batch fetch covers the rest).
+
+Run locally against generated traffic: python stream_worker.py --fake
+"""
+
+import os
+import json
+import time
+import queue
+import signal
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional
+
+from main import IdempotentRedditFetcher, RELEVANT_SUBREDDITS, FINANCIAL_BRANDS, BUCKET_NAME
+from checkpoint import StreamCheckpoint
+
+logger = logging.getLogger(__name__)
+
+# Micro-batches are written once they hold STREAM_BATCH_MAX_MESSAGES or are STREAM_BATCH_MAX_SECONDS old
+STREAM_BATCH_MAX_MESSAGES = int(os.environ.get('STREAM_BATCH_MAX_MESSAGES', '50'))
+STREAM_BATCH_MAX_SECONDS = float(os.environ.get('STREAM_BATCH_MAX_SECONDS', '5'))
+STREAM_CHECKPOINT_BLOB = os.environ.get('STREAM_CHECKPOINT_BLOB', 'state/reddit/stream_checkpoint.json')
+STREAM_SUBREDDITS = [name for name in os.environ.get('STREAM_SUBREDDITS', '').split(',') if name]
+STREAM_NLP_ENABLED = os.environ.get('STREAM_NLP_ENABLED', 'true').lower() == 'true'
+STREAM_RECENT_IDS = int(os.environ.get('STREAM_RECENT_IDS', '2000'))  # per stream, for dedup across restarts
+STREAM_SEEN_INDEX_SAVE_SECONDS = int(os.environ.get('STREAM_SEEN_INDEX_SAVE_SECONDS', '60'))
+STREAM_RETRY_SECONDS = 10
+CATCH_UP_OVERLAP_SECONDS = 60
+
+# stream name -> listing read on restart to close the gap
+STREAMS = {'submissions': 'new', 'comments': 'comments'}
+
+
+class RedditStreamWorker:
+    """Follows the submission and comment streams of one multireddit and writes micro-batches"""
+
+    def __init__(self, fetcher: IdempotentRedditFetcher, subreddits: List[str], checkpoint: StreamCheckpoint,
+                 batch_max_messages: int = STREAM_BATCH_MAX_MESSAGES,
+                 batch_max_seconds: float = STREAM_BATCH_MAX_SECONDS, nlp_enabled: bool = STREAM_NLP_ENABLED):
+        self.fetcher = fetcher
+        self.label = '+'.join(subreddits)
+        self.checkpoint = checkpoint
+        self.batch_max_messages = batch_max_messages
+        self.batch_max_seconds = batch_max_seconds
+        self.nlp_enabled = nlp_enabled
+        self.searched_brands = set(FINANCIAL_BRANDS)
+        self.stop_event = threading.Event()
+        self.items: queue.Queue = queue.Queue(maxsize=10000)
+
+        # Per stream: recently processed ids (dedup of stream restarts and catch-up overlap) and position
+        self.recent: Dict[str, OrderedDict] = {stream: OrderedDict() for stream in STREAMS}
+        self.positions: Dict[str, Optional[float]] = {stream: None for stream in STREAMS}
+
+        self.pending: List[Dict[str, Any]] = []
+        self.pending_created: List[float] = []
+        self.batch_started_at: Optional[float] = None
+        self.seen_index_saved_at = time.time()
+        self.stats = {
+            'started_at': datetime.utcnow().isoformat() + 'Z',
+            'items': 0, 'catch_up_items': 0, 'messages': 0, 'duplicates': 0, 'batches': 0, 'files': 0,
+            'last_lag_seconds': None, 'max_lag_seconds': 0.0, 'last_batch_at': None
+        }
+
+    def _restore(self):
+        if not self.checkpoint.load():
+            logger.info("No stream checkpoint; starting from each stream's newest items")
+            return
+        for stream in STREAMS:
+            self.positions[stream] = self.checkpoint.position(stream)
+            for item_id in self.checkpoint.recent_ids(stream):
+                self.recent[stream][item_id] = None
+
+    def _remember(self, stream: str, item) -> bool:
+        """False if the item was already processed"""
+        recent = self.recent[stream]
+        if item.id in recent:
+            self.stats['duplicates'] += 1
+            return False
+        recent[item.id] = None
+        if len(recent) > STREAM_RECENT_IDS:
+            recent.popitem(last=False)
+        return True
+
+    def _handle(self, stream: str, item):
+        """Run brand detection on one item and queue it for the next micro-batch if it matches"""
+        if not self._remember(stream, item):
+            return
+        self.stats['items'] += 1
+        if self.batch_started_at is None:
+            self.batch_started_at = time.time()
+        position = self.positions[stream]
+        self.positions[stream] = item.created_utc if position is None else max(position, item.created_utc)
+
+        # Same detection and record shape as the batch fetcher
+        if stream == 'submissions':
+            messages = self.fetcher.handle_submission(item, self.searched_brands)
+        else:
+            messages = self.fetcher.handle_comments([item], self.searched_brands)
+        self.pending.extend(messages)
+        self.pending_created.extend(item.created_utc for _ in messages)
+
+    def _catch_up(self):
+        """Read listings back to the checkpointed position so time spent down leaves no gap"""
+        for stream, listing in STREAMS.items():
+            since = self.positions[stream]
+            if since is None:
+                continue  # first start: the stream's initial items are the backfill
+            items, complete = self.fetcher.scan_listing(self.label, listing, since - CATCH_UP_OVERLAP_SECONDS)
+            if not complete:
+                logger.warning(f"Catch-up of {stream} hit the listing depth; items before "
+                               f"{datetime.utcfromtimestamp(items[-1].created_utc).isoformat()}Z are left "
+                               f"to the scheduled batch fetch")
+            logger.info(f"Catching up {len(items)} {stream} since {datetime.utcfromtimestamp(since).isoformat()}Z")
+            for item in reversed(items):
+                self._handle(stream, item)
+            self.stats['catch_up_items'] += len(items)
+        self._flush()
+
+    def _read_stream(self, stream: str):
+        """Feed one PRAW stream into the queue (runs on its own thread with its own client)"""
+        while not self.stop_event.is_set():
+            try:
+                # pause_after=0 yields None after every empty poll so the stop flag is checked
+                for item in self.fetcher.subreddit_stream(self.label, stream, pause_after=0, skip_existing=False):
+                    if self.stop_event.is_set():
+                        return
+                    if item is not None:
+                        self.items.put((stream, item))
+            except Exception as e:
+                logger.error(f"{stream} stream failed, reconnecting in {STREAM_RETRY_SECONDS}s: {e}")
+                self.stop_event.wait(STREAM_RETRY_SECONDS)
+
+    def _batch_due(self) -> bool:
+        if self.batch_started_at is None:
+            return False
+        return (len(self.pending) >= self.batch_max_messages or
+                time.time() - self.batch_started_at >= self.batch_max_seconds)
+
+    def _unseen(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Drop events the batch fetcher (or an earlier stream run) already wrote, and record new ones"""
+        seen_index = self.fetcher.seen_index
+        if seen_index is None:
+            return messages
+        fresh = []
+        for message in messages:
+            if not seen_index.check(message['event_id'], message['content_hash'], message['ts_event']):
+                seen_index.record(message['event_id'], message['content_hash'], message['ts_event'])
+                fresh.append(message)
+        return fresh
+
+    def _flush(self):
+        """Write the pending micro-batch, then checkpoint the stream positions it covers"""
+        if self.batch_started_at is None:
+            return
+        messages = self._unseen(self.pending)
+        files = []
+        if messages:
+            if self.nlp_enabled:
+                messages = self.fetcher._enrich_with_nlp(messages)
+            sink = self.fetcher.create_output_sink(datetime.utcnow().strftime('%Y%m%d-%H%M%S'))
+            sink.write_all(messages)
+            files = sink.flush()
+
+        now = time.time()
+        if self.pending_created:
+            lag = now - min(self.pending_created)
+            self.stats['last_lag_seconds'] = round(lag, 1)
+            self.stats['max_lag_seconds'] = round(max(self.stats['max_lag_seconds'], lag), 1)
+        self.checkpoint.save(
+            {stream: {'created_utc': self.positions[stream], 'recent_ids': list(self.recent[stream])}
+             for stream in STREAMS},
+            files_written=len(files), messages_written=len(messages)
+        )
+        if self.fetcher.seen_index and now - self.seen_index_saved_at >= STREAM_SEEN_INDEX_SAVE_SECONDS:
+            self.fetcher.seen_index.save()
+            self.seen_index_saved_at = now
+
+        self.stats['messages'] += len(messages)
+        self.stats['files'] += len(files)
+        self.stats['batches'] += 1
+        self.stats['last_batch_at'] = datetime.utcnow().isoformat() + 'Z'
+        if messages:
+            logger.info(f"Wrote {len(messages)} messages in {len(files)} files "
+                        f"(lag {self.stats['last_lag_seconds']}s)")
+        self.pending, self.pending_created = [], []
+        self.batch_started_at = None
+
+    def run(self):
+        """Catch up, then follow both streams until stop() is called"""
+        self._restore()
+        self._catch_up()
+
+        readers = [threading.Thread(target=self._read_stream, args=(stream,), name=f"stream-{stream}", daemon=True)
+                   for stream in STREAMS]
+        for reader in readers:
+            reader.start()
+        logger.info(f"Streaming {self.label}")
+
+        while not self.stop_event.is_set():
+            timeout = 1.0
+            if self.batch_started_at is not None:
+                timeout = max(0.0, self.batch_started_at + self.batch_max_seconds - time.time())
+            try:
+                stream, item = self.items.get(timeout=timeout)
+                self._handle(stream, item)
+            except queue.Empty:
+                pass
+            if self._batch_due():
+                self._flush()
+
+        # Shutting down: process what the readers already delivered and checkpoint it
+        while True:
+            try:
+                stream, item = self.items.get_nowait()
+            except queue.Empty:
+                break
+            self._handle(stream, item)
+        self._flush()
+        if self.fetcher.seen_index:
+            self.fetcher.seen_index.save()
+        logger.info(f"Stream worker stopped: {self.stats}")
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def serve_health(worker: RedditStreamWorker, port: int) -> ThreadingHTTPServer:
+    """Cloud Run needs a listening port; /health reports the worker's counters"""
+
+    class HealthHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps(dict(worker.stats, nlp_cache=worker.fetcher.nlp_cache_stats(),
+                                   status='stopping' if worker.stop_event.is_set() else 'healthy'))
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(body.encode('utf-8'))
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('0.0.0.0', port), HealthHandler)
+    threading.Thread(target=server.serve_forever, name='health', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Real-time Reddit stream worker')
+    parser.add_argument('--fake', action='store_true',
+                        help='generate traffic with fake_reddit and keep all output and state in memory')
+    parser.add_argument('--fake-rate', type=float, default=2.0, help='fake items per second')
+    parser.add_argument('--subreddits', help='comma-separated subreddits (default: STREAM_SUBREDDITS or RELEVANT_SUBREDDITS)')
+    args = parser.parse_args()
+
+    subreddits = (args.subreddits.split(',') if args.subreddits else None) or STREAM_SUBREDDITS or RELEVANT_SUBREDDITS
+    reddit_factory, storage_client, bq_client = None, None, None
+    if args.fake:
+        # Fake traffic goes to in-memory GCS and BigQuery, so a local run needs no credentials and writes nothing
+        from fake_reddit import FakeReddit
+        from fake_gcp import MemoryStorage, MemoryBigQuery
+        fake_reddit = FakeReddit(subreddits, items_per_second=args.fake_rate)
+        reddit_factory = lambda: fake_reddit
+        storage_client, bq_client = MemoryStorage(), MemoryBigQuery()
+
+    fetcher = IdempotentRedditFetcher(reddit_factory=reddit_factory, storage_client=storage_client,
+                                      bq_client=bq_client)
+    checkpoint = StreamCheckpoint(fetcher.storage_client, BUCKET_NAME, STREAM_CHECKPOINT_BLOB)
+    worker = RedditStreamWorker(fetcher, subreddits, checkpoint)
+
+    # Cloud Run sends SIGTERM before stopping an instance; finish the batch in flight and checkpoint
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: worker.stop())
+    serve_health(worker, int(os.environ.get('PORT', 8080)))
+    worker.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""
+Activity-weighted polling of subreddits
+Estimates each subreddit's arrival rate of brand messages (new messages per
+hour of window scanned, decayed so recent runs count most) and its API cost per
+poll, then spreads a daily request budget so that expected freshness lag is
+minimised: polling subreddit i every T_i seconds leaves a message waiting T_i/2
+on average, and minimising sum(rate_i * T_i) subject to sum(cost_i / T_i) = budget
+gives poll frequency proportional to sqrt(rate_i / cost_i). Next-due times are
+kept in a priority queue; each invocation polls only the subreddits that are due.
+"""
+
+import json
+import math
+import time
+import heapq
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+from google.cloud import storage
+from google.api_core import exceptions as gcp_exceptions
+
+from state_backends import gcs_merge_write
+
+logger = logging.getLogger(__name__)
+
+
+class SubredditPollScheduler:
+    """Per-subreddit arrival rate, poll cost and next-due time, stored in one GCS object"""
+
+    # Prior for subreddits with little history: one message per week, so a quiet
+    # subreddit is still polled now and then instead of never
+    PRIOR_MESSAGES = 1.0
+    PRIOR_HOURS = 7 * 24.0
+
+    def __init__(self, storage_client: storage.Client, bucket_name: str, blob_path: str,
+                 daily_request_budget: int, min_interval_seconds: int = 3600,
+                 max_interval_seconds: int = 7 * 86400, half_life_hours: float = 72.0,
+                 default_cost: float = 10.0, max_attempts: int = 8, due_grace_seconds: int = 300):
+        self.blob = storage_client.bucket(bucket_name).blob(blob_path)
+        self.daily_request_budget = daily_request_budget
+        self.min_interval_seconds = min_interval_seconds
+        self.max_interval_seconds = max_interval_seconds
+        self.half_life_hours = half_life_hours
+        self.default_cost = default_cost
+        self.max_attempts = max_attempts
+        # Invocations arrive on a fixed schedule with some jitter; a subreddit due
+        # within this window of the current one is polled now rather than next time
+        self.due_grace_seconds = due_grace_seconds
+        self.subreddits: Dict[str, Dict[str, Any]] = {}  # lowercase name -> entry
+        self._updated: set = set()
+        self._load()
+
+    def _read(self) -> Tuple[Dict[str, Any], int]:
+        try:
+            data = self.blob.download_as_bytes()
+            return json.loads(data), int(self.blob.generation)
+        except gcp_exceptions.NotFound:
+            return {}, 0
+
+    def _load(self):
+        try:
+            data, _ = self._read()
+            self.subreddits = data.get('subreddits', {})
+            logger.info(f"Loaded poll history for {len(self.subreddits)} subreddits")
+        except Exception as e:
+            logger.warning(f"Could not load subreddit poll history: {e}")
+            self.subreddits = {}
+
+    def rate_per_hour(self, subreddit: str) -> float:
+        entry = self.subreddits.get(subreddit.lower(), {})
+        return ((entry.get('decayed_messages', 0.0) + self.PRIOR_MESSAGES) /
+                (entry.get('decayed_hours', 0.0) + self.PRIOR_HOURS))
+
+    def cost_per_poll(self, subreddit: str) -> float:
+        return self.subreddits.get(subreddit.lower(), {}).get('cost_per_poll') or self.default_cost
+
+    def intervals(self, subreddits: List[str]) -> Dict[str, float]:
+        """Poll interval in seconds for each subreddit under the daily request budget"""
+        rates = {name: self.rate_per_hour(name) for name in subreddits}
+        costs = {name: self.cost_per_poll(name) for name in subreddits}
+        norm = sum(math.sqrt(rates[name] * costs[name]) for name in subreddits)
+        intervals = {}
+        for name in subreddits:
+            polls_per_day = self.daily_request_budget * math.sqrt(rates[name] / costs[name]) / norm if norm else 0.0
+            interval = 86400.0 / polls_per_day if polls_per_day > 0 else self.max_interval_seconds
+            intervals[name] = min(self.max_interval_seconds, max(self.min_interval_seconds, interval))
+        return intervals
+
+    def due(self, subreddits: List[str], now: Optional[float] = None,
+            max_count: Optional[int] = None) -> List[str]:
+        """Subreddits due by now (plus the grace window), most overdue first (never-polled ones first of all)"""
+        now = (now or time.time()) + self.due_grace_seconds
+        queue = [(self.subreddits.get(name.lower(), {}).get('next_due_at', 0.0), index, name)
+                 for index, name in enumerate(subreddits)]
+        heapq.heapify(queue)
+        due = []
+        while queue and queue[0][0] <= now and (max_count is None or len(due) < max_count):
+            due.append(heapq.heappop(queue)[2])
+        return due
+
+    def next_due_at(self, subreddits: List[str]) -> Optional[float]:
+        return min((self.subreddits.get(name.lower(), {}).get('next_due_at', 0.0) for name in subreddits),
+                   default=None)
+
+    def record(self, subreddit: str, messages: int, requests: float, window_start: float,
+               polled_at: Optional[float] = None):
+        """Fold one poll's yield (new messages since window_start) and cost into the estimates"""
+        polled_at = polled_at or time.time()
+        key = subreddit.lower()
+        entry = self.subreddits.get(key) or {'name': subreddit, 'polls': 0, 'messages': 0,
+                                             'decayed_messages': 0.0, 'decayed_hours': 0.0}
+        # Consecutive windows overlap by the cursor overlap; count each hour once
+        window_start = max(window_start, entry.get('last_polled_at') or 0.0)
+        window_hours = max(0.0, polled_at - window_start) / 3600.0
+
+        if entry.get('last_polled_at'):
+            decay = 0.5 ** ((polled_at - entry['last_polled_at']) / 3600.0 / self.half_life_hours)
+            entry['decayed_messages'] *= decay
+            entry['decayed_hours'] *= decay
+        entry['decayed_messages'] += messages
+        entry['decayed_hours'] += window_hours
+        entry['polls'] += 1
+        entry['messages'] += messages
+        entry['last_polled_at'] = polled_at
+        entry['cost_per_poll'] = (requests if not entry.get('cost_per_poll')
+                                  else 0.7 * entry['cost_per_poll'] + 0.3 * requests)
+        self.subreddits[key] = entry
+        self._updated.add(key)
+
+    def reschedule(self, subreddits: List[str]):
+        """Set next-due times for the subreddits polled this run (intervals weigh every subreddit in the pool)"""
+        intervals = self.intervals(subreddits)
+        for name in subreddits:
+            entry = self.subreddits.get(name.lower())
+            if entry and name.lower() in self._updated:
+                entry['interval_seconds'] = round(intervals[name], 1)
+                entry['next_due_at'] = entry['last_polled_at'] + intervals[name]
+
+    def report(self, subreddits: List[str]) -> Dict[str, Any]:
+        """Rates, costs, intervals and the expected freshness lag they give"""
+        intervals = self.intervals(subreddits)
+        rates = {name: self.rate_per_hour(name) for name in subreddits}
+        total_rate = sum(rates.values())
+        expected_lag_hours = (sum(rates[name] * intervals[name] / 2 for name in subreddits) / total_rate / 3600
+                              if total_rate else 0.0)
+        planned_requests = sum(self.cost_per_poll(name) * 86400.0 / intervals[name] for name in subreddits)
+        return {
+            'daily_request_budget': self.daily_request_budget,
+            'planned_daily_requests': round(planned_requests),
+            'expected_lag_hours': round(expected_lag_hours, 2),
+            'subreddits': sorted((
+                {
+                    'subreddit': name,
+                    'rate_per_hour': round(rates[name], 3),
+                    'cost_per_poll': round(self.cost_per_poll(name), 1),
+                    'interval_hours': round(intervals[name] / 3600, 2),
+                    'next_due_at': self.subreddits.get(name.lower(), {}).get('next_due_at', 0.0)
+                }
+                for name in subreddits
+            ), key=lambda item: item['next_due_at'])
+        }
+
+    def save(self):
+        """Merge this run's subreddits into the stored history (generation-matched for concurrent workers)"""
+        if not self._updated:
+            return
+
+        def merge(data: Dict[str, Any]) -> Dict[str, Any]:
+            subreddits = data.get('subreddits', {})
+            subreddits.update({key: self.subreddits[key] for key in self._updated})
+            return {'subreddits': subreddits}
+
+        try:
+            saved = gcs_merge_write(self.blob, self._read, merge, self.max_attempts)
+        except Exception as e:
+            logger.error(f"Could not save subreddit poll history: {e}")
+            return
+        if not saved:
+            logger.error(f"Could not save subreddit poll history after {self.max_attempts} attempts")
+            return
+        logger.info(f"Saved poll history for {len(self._updated)} subreddits")
+        self._updated = set()
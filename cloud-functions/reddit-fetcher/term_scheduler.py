@@ -0,0 +1,160 @@
+"""
+Yield-aware scheduling of brand search terms
+Tracks per-(subreddit, term) hit yield across runs and backs off terms that keep
+coming up empty: after `grace` empty cycles a term is searched every 2nd, 4th,
+8th ... cycle (capped), and any hit puts it back on every cycle. When a demoted
+term comes due it searches back to when it last ran, so backing off saves API
+calls without leaving gaps.
+A hit is an emitted post or comment that matched the term: comments are only
+loaded under posts the searches returned, so they count toward those searches.
+"""
+
+import json
+import time
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+from google.cloud import storage
+from google.api_core import exceptions as gcp_exceptions
+
+from state_backends import gcs_merge_write
+
+logger = logging.getLogger(__name__)
+
+
+class TermYieldScheduler:
+    """Per-(subreddit, term) yield history stored in one GCS object"""
+
+    def __init__(self, storage_client: storage.Client, bucket_name: str, blob_path: str,
+                 grace_cycles: int = 3, max_skip_cycles: int = 32, max_attempts: int = 8):
+        self.blob = storage_client.bucket(bucket_name).blob(blob_path)
+        self.grace_cycles = grace_cycles
+        self.max_skip_cycles = max_skip_cycles
+        self.max_attempts = max_attempts
+        self.cycles: Dict[str, int] = {}  # subreddit -> completed cycles
+        self.terms: Dict[str, Dict[str, Any]] = {}  # "subreddit|term" -> yield entry
+        self._updated_subreddits: set = set()
+        self.plan_stats = {'regular_terms': 0, 'catch_up_terms': 0, 'skipped_terms': 0}
+        self._load()
+
+    @staticmethod
+    def _key(subreddit: str, term: str) -> str:
+        return f"{subreddit.lower()}|{term.lower()}"
+
+    def _read(self) -> Tuple[Dict[str, Any], int]:
+        try:
+            data = self.blob.download_as_bytes()
+            return json.loads(data), int(self.blob.generation)
+        except gcp_exceptions.NotFound:
+            return {}, 0
+
+    def _load(self):
+        try:
+            data, _ = self._read()
+            self.cycles = data.get('cycles', {})
+            self.terms = data.get('terms', {})
+            logger.info(f"Loaded term yield history for {len(self.terms)} (subreddit, term) pairs")
+        except Exception as e:
+            logger.warning(f"Could not load term yield history: {e}")
+            self.cycles, self.terms = {}, {}
+
+    def _is_regular(self, entry: Optional[Dict[str, Any]]) -> bool:
+        return entry is None or entry['empty_streak'] < self.grace_cycles
+
+    def _is_due(self, subreddit: str, entry: Optional[Dict[str, Any]]) -> bool:
+        return entry is None or entry['next_due_cycle'] <= self.cycles.get(subreddit.lower(), 0)
+
+    def plan(self, subreddits: List[str], terms: List[str]) -> Tuple[List[str], List[str], Optional[float]]:
+        """
+        Split terms for one (multi)subreddit search into (regular, catch_up, catch_up_since)
+        Regular terms run every cycle; catch-up terms are demoted terms that came due
+        and should search back to catch_up_since. Terms not returned are skipped.
+        """
+        regular, catch_up = [], []
+        catch_up_since = None
+        for term in terms:
+            entries = [(subreddit, self.terms.get(self._key(subreddit, term))) for subreddit in subreddits]
+            if any(self._is_regular(entry) for _, entry in entries):
+                regular.append(term)
+                continue
+            due = [entry for subreddit, entry in entries if self._is_due(subreddit, entry)]
+            if not due:
+                self.plan_stats['skipped_terms'] += 1
+                continue
+            catch_up.append(term)
+            last_searched_at = min(entry['last_searched_at'] for entry in due)
+            catch_up_since = last_searched_at if catch_up_since is None else min(catch_up_since, last_searched_at)
+        self.plan_stats['regular_terms'] += len(regular)
+        self.plan_stats['catch_up_terms'] += len(catch_up)
+        return regular, catch_up, catch_up_since
+
+    def record(self, subreddit: str, searched_terms: List[str], hits: Dict[str, int],
+               searched_at: Optional[float] = None):
+        """Update yield for every term searched in a subreddit this cycle, then close the cycle"""
+        searched_at = searched_at or time.time()
+        cycle = self.cycles.get(subreddit.lower(), 0)
+        for term in searched_terms:
+            key = self._key(subreddit, term)
+            entry = self.terms.get(key) or {'searches': 0, 'hits': 0, 'empty_streak': 0}
+            term_hits = hits.get(term.lower(), 0)
+            entry['searches'] += 1
+            entry['hits'] += term_hits
+            entry['empty_streak'] = 0 if term_hits else entry['empty_streak'] + 1
+            entry['last_searched_at'] = searched_at
+            if term_hits:
+                entry['last_hit_at'] = searched_at
+
+            # Exponential back-off once a term has been empty for grace_cycles in a row
+            skip = 0
+            if entry['empty_streak'] >= self.grace_cycles:
+                skip = min(2 ** (entry['empty_streak'] - self.grace_cycles + 1) - 1, self.max_skip_cycles)
+            entry['next_due_cycle'] = cycle + 1 + skip
+            self.terms[key] = entry
+        self.cycles[subreddit.lower()] = cycle + 1
+        self._updated_subreddits.add(subreddit.lower())
+
+    def demoted(self) -> List[Dict[str, Any]]:
+        """Terms currently backed off, most stale first"""
+        report = []
+        for key, entry in self.terms.items():
+            if self._is_regular(entry):
+                continue
+            subreddit, term = key.split('|', 1)
+            report.append({
+                'subreddit': subreddit,
+                'term': term,
+                'empty_streak': entry['empty_streak'],
+                'searches': entry['searches'],
+                'hits': entry['hits'],
+                'next_due_in_cycles': max(0, entry['next_due_cycle'] - self.cycles.get(subreddit, 0))
+            })
+        return sorted(report, key=lambda item: (-item['empty_streak'], item['subreddit'], item['term']))
+
+    def summary(self, limit: int = 25) -> Dict[str, Any]:
+        demoted = self.demoted()
+        return dict(self.plan_stats, demoted_pairs=len(demoted), most_demoted=demoted[:limit])
+
+    def save(self):
+        """Merge this run's subreddits into the stored history (generation-matched for concurrent workers)"""
+        if not self._updated_subreddits:
+            return
+
+        def merge(data: Dict[str, Any]) -> Dict[str, Any]:
+            cycles = data.get('cycles', {})
+            terms = data.get('terms', {})
+            for subreddit in self._updated_subreddits:
+                cycles[subreddit] = self.cycles[subreddit]
+            terms.update({key: entry for key, entry in self.terms.items()
+                          if key.split('|', 1)[0] in self._updated_subreddits})
+            return {'cycles': cycles, 'terms': terms}
+
+        try:
+            saved = gcs_merge_write(self.blob, self._read, merge, self.max_attempts)
+        except Exception as e:
+            logger.error(f"Could not save term yield history: {e}")
+            return
+        if not saved:
+            logger.error(f"Could not save term yield history after {self.max_attempts} attempts")
+            return
+        logger.info(f"Saved term yield history for {len(self._updated_subreddits)} subreddits")
+        self._updated_subreddits = set()
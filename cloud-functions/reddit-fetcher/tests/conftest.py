@@ -0,0 +1,12 @@
+"""
+Unit tests for the Reddit fetcher modules
+Run from cloud-functions/reddit-fetcher: python -m pytest -q tests
+"""
+
+import os
+import sys
+
+FUNCTION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, FUNCTION_DIR)
+os.environ.setdefault('PROJECT_ID', 'test-project')
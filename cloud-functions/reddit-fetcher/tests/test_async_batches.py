@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+import main
+
+
+class StubFetcher(main.IdempotentRedditFetcher):
+    """Serves each batch after a per-subreddit delay; 'broken' raises"""
+
+    def __init__(self, delays):
+        self.delays = delays
+
+    async def fetch_multireddit_posts_and_comments_async(self, subreddit_names, brand_terms, semaphore,
+                                                         routed_ids=None, **kwargs):
+        name = subreddit_names[0]
+        await asyncio.sleep(self.delays[name])
+        if name == 'broken':
+            raise RuntimeError('search failed')
+        routed_ids.add(f"{name}_post")
+        return {name: [{'event_id': f"{name}_post"}]}
+
+
+def fetch(fetcher, batches, deadline=None):
+    completed = []
+    results = asyncio.run(fetcher.fetch_batches_async(
+        batches, ['TD Bank'],
+        on_batch_complete=lambda batch, messages, routed_ids: completed.append((batch, routed_ids)),
+        deadline=deadline
+    ))
+    return results, completed
+
+
+def test_batches_are_reported_as_they_finish():
+    fetcher = StubFetcher({'slow': 0.05, 'fast': 0, 'broken': 0})
+    results, completed = fetch(fetcher, [['slow'], ['fast'], ['broken']])
+    assert completed == [(['fast'], {'fast_post'}), (['slow'], {'slow_post'})]
+    assert results == [{'slow': [{'event_id': 'slow_post'}]}, {'fast': [{'event_id': 'fast_post'}]}, {}]
+
+
+def test_batches_in_flight_at_deadline_are_cancelled():
+    fetcher = StubFetcher({'slow': 5, 'fast': 0})
+    started = time.time()
+    results, completed = fetch(fetcher, [['slow'], ['fast']], deadline=started + 0.2)
+    assert time.time() - started < 2
+    assert completed == [(['fast'], {'fast_post'})]
+    assert results[0] is None and results[1] == {'fast': [{'event_id': 'fast_post'}]}
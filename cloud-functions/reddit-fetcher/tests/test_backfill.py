@@ -0,0 +1,61 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import backfill
+from fake_gcp import MemoryStorage
+
+
+class StubFetcher:
+    """Serves search_time_range from a fixed oldest-reachable time and records each call"""
+
+    def __init__(self, complete_since: float):
+        self.complete_since = complete_since
+        self.storage_client = MemoryStorage()
+        self.seen_index = None
+        self.request_count = 0
+        self.searches = []
+        self.slices = []
+
+    def search_time_range(self, subreddit_name, brand_terms, start, end):
+        self.searches.append((subreddit_name, start, end))
+        self.request_count += 3
+        return [], max(start, self.complete_since)
+
+    def fetch_time_slice(self, subreddit_name, submissions, brand_terms, start, end):
+        self.slices.append(start)
+        return []
+
+
+def utc(*args) -> float:
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+@pytest.fixture
+def slices():
+    return backfill.plan_slices(['banking'], datetime(2024, 1, 1), datetime(2024, 1, 4), slice_hours=24)
+
+
+def run(monkeypatch, fetcher, slices):
+    monkeypatch.setattr(backfill, '_worker_fetcher', fetcher)
+    monkeypatch.setattr(backfill, '_worker_nlp_enabled', False)
+    entries = backfill.run_subreddit(slices, ['TD Bank'], 'bf', manifest_prefix='m')
+    manifest = backfill.BackfillManifest(fetcher.storage_client, backfill.BUCKET_NAME, 'bf', 'm')
+    return entries, manifest.completed()
+
+
+def test_one_search_pass_covers_every_slice(monkeypatch, slices):
+    fetcher = StubFetcher(complete_since=0)
+    entries, completed = run(monkeypatch, fetcher, slices)
+    assert fetcher.searches == [('banking', utc(2024, 1, 1), utc(2024, 1, 4))]
+    assert fetcher.slices == sorted(fetcher.slices, reverse=True) and len(fetcher.slices) == 3
+    assert completed == {time_slice['slice_id'] for time_slice in slices}
+    assert [entry['status'] for entry in entries] == ['done'] * 3
+
+
+def test_slices_older_than_search_reach_stay_pending(monkeypatch, slices):
+    fetcher = StubFetcher(complete_since=utc(2024, 1, 2, 6))
+    entries, completed = run(monkeypatch, fetcher, slices)
+    assert completed == {'banking-20240103T0000'}
+    assert [entry['status'] for entry in entries] == ['done', 'truncated', 'truncated']
+    assert entries[1]['complete_since'] == '2024-01-02T06:00:00Z'
@@ -0,0 +1,41 @@
+import json
+
+import benchmark
+
+
+def report(fixture='f', **metrics):
+    result = dict({'messages': 100, 'api_calls': 60, 'api_calls_per_message': 0.6,
+                   'messages_per_second': 1000.0, 'wall_seconds': 0.1}, **metrics)
+    return {'fixture': fixture, 'results': {'200': result}}
+
+
+def test_request_counts_fail_and_timings_warn():
+    failures, warnings = benchmark.compare(report(api_calls=61, messages_per_second=500.0), report())
+    assert failures == ['200 posts: api_calls 60 -> 61 (+2%)']
+    assert warnings == ['200 posts: messages_per_second 1000.0 -> 500.0 (-50%)']
+
+    failures, warnings = benchmark.compare(report(messages_per_second=500.0), report(), strict=True)
+    assert failures == ['200 posts: messages_per_second 1000.0 -> 500.0 (-50%)'] and warnings == []
+
+
+def test_improvements_and_noise_pass():
+    assert benchmark.compare(report(api_calls=50, messages_per_second=980.0, wall_seconds=0.15), report()) == ([], [])
+
+
+def test_baseline_from_another_fixture_is_not_compared():
+    failures, warnings = benchmark.compare(report(fixture='g', api_calls=500), report())
+    assert failures == [] and len(warnings) == 1
+
+
+def test_committed_fixture_matches_committed_baseline():
+    with open(benchmark.DEFAULT_BASELINE) as f:
+        baseline = json.load(f)
+    fixture = benchmark.load_fixture(benchmark.DEFAULT_FIXTURE)
+    assert benchmark.fixture_id(fixture) == baseline['fixture']
+
+    size = str(min(benchmark.DEFAULT_SIZES))
+    result = benchmark.run_once(benchmark.sample_fixture(fixture, int(size)))
+    expected = baseline['results'][size]
+    # Replays are deterministic, so request and message counts must match exactly
+    assert (result['messages'], result['api_calls_by_endpoint']) == \
+        (expected['messages'], expected['api_calls_by_endpoint'])
@@ -0,0 +1,40 @@
+import random
+
+from brand_matcher import BrandMatcher
+from main import FINANCIAL_BRANDS
+
+
+def naive_matches(matcher, text_lower):
+    """Every occurrence of every term, found one term at a time"""
+    found = set()
+    for entry_index, (_, _, term) in enumerate(matcher.terms):
+        pattern = term.lower()
+        start = text_lower.find(pattern)
+        while pattern and start != -1:
+            found.add((start, entry_index))
+            start = text_lower.find(pattern, start + 1)
+    return found
+
+
+def test_overlapping_and_nested_terms():
+    matcher = BrandMatcher({'td': ['TD Bank', 'TD'], 'rbc': ['Royal Bank', 'Bank']})
+    text = 'my td bank and royal bank accounts'
+    matches = {(start, matcher.terms[entry][2]) for start, entry in matcher.iter_matches(text)}
+    assert matches == {(3, 'TD Bank'), (3, 'TD'), (6, 'Bank'), (15, 'Royal Bank'), (21, 'Bank')}
+
+
+def test_matches_naive_scan_on_brand_terms():
+    matcher = BrandMatcher(FINANCIAL_BRANDS)
+    terms = [term for _, _, term in matcher.terms]
+    rng = random.Random(7)
+    filler = ['the', 'fees', 'at', 'my', 'bank', 'are', 'tdbank', 'rbc', 'chase', 'x', '!']
+    for _ in range(200):
+        words = [rng.choice(terms) if rng.random() < 0.3 else rng.choice(filler) for _ in range(rng.randint(1, 25))]
+        text_lower = ' '.join(words).lower()
+        assert set(matcher.iter_matches(text_lower)) == naive_matches(matcher, text_lower)
+
+
+def test_duplicate_terms_are_kept_per_brand():
+    matcher = BrandMatcher({'a': ['Bank'], 'b': ['bank']})
+    entries = sorted(entry for _, entry in matcher.iter_matches('bank'))
+    assert [matcher.terms[entry][0] for entry in entries] == ['a', 'b']
@@ -0,0 +1,36 @@
+import json
+import threading
+from types import SimpleNamespace
+
+import main
+from fake_gcp import MemoryBigQuery, MemoryStorage
+
+
+def test_clients_are_built_when_not_passed(monkeypatch):
+    built = {'storage': [], 'bigquery': [], 'reddit': [], 'secrets': 0}
+    creds = {'client_id': 'id', 'client_secret': 'secret', 'user_agent': 'agent'}
+
+    class StubSecretManager:
+        def access_secret_version(self, request):
+            built['secrets'] += 1
+            return SimpleNamespace(payload=SimpleNamespace(data=json.dumps(creds).encode('utf-8')))
+
+    def build(kind, client):
+        built[kind].append(client)
+        return client
+
+    monkeypatch.setattr(main.storage, 'Client', lambda: build('storage', MemoryStorage()))
+    monkeypatch.setattr(main.bigquery, 'Client', lambda: build('bigquery', MemoryBigQuery()))
+    monkeypatch.setattr(main.secretmanager, 'SecretManagerServiceClient', StubSecretManager)
+    monkeypatch.setattr(main.praw, 'Reddit', lambda **kwargs: build('reddit', SimpleNamespace(kwargs=kwargs)))
+
+    fetcher = main.IdempotentRedditFetcher()
+    assert fetcher.storage_client is built['storage'][0] and fetcher.bq_client is built['bigquery'][0]
+    assert fetcher.reddit.kwargs == dict(creds, username=None, password=None)
+
+    # Worker threads get their own PRAW client; credentials are fetched once
+    thread = threading.Thread(target=fetcher._thread_reddit)
+    thread.start()
+    thread.join()
+    assert len(built['reddit']) == 2 and built['secrets'] == 1
+    assert len(built['storage']) == 1 and len(built['bigquery']) == 1
@@ -0,0 +1,35 @@
+import time
+
+import pytest
+
+from fake_gcp import MemoryBigQuery, MemoryStorage
+from fake_reddit import FakeReddit
+from main import IdempotentRedditFetcher
+
+
+@pytest.fixture
+def fetcher():
+    # 72 posts and 288 comments an hour for ten hours: /comments holds under four hours
+    reddit = FakeReddit(['banking'], items_per_second=0.1, history_seconds=36000)
+    fetcher = IdempotentRedditFetcher(requests_per_minute=10 ** 9, reddit_factory=lambda: reddit,
+                                      storage_client=MemoryStorage(), bq_client=MemoryBigQuery())
+    fetcher._enrich_with_nlp = lambda messages: messages
+    return fetcher
+
+
+def test_listing_that_ends_before_the_cutoff_is_incomplete(fetcher):
+    items, complete = fetcher._scan_listing(fetcher.reddit, 'banking', 'comments', time.time() - 30000)
+    assert len(items) == 1000 and not complete
+
+    items, complete = fetcher._scan_listing(fetcher.reddit, 'banking', 'comments', time.time() - 3600)
+    assert 0 < len(items) < 1000 and complete
+    assert fetcher.scan_stats['truncated'] == 1
+
+
+def test_truncated_scan_holds_the_cursor(fetcher):
+    # Windows start two hours before since_timestamp
+    fetcher.fetch_listing_scan(['banking'], ['TD Bank'], since_timestamp=int(time.time() - 6 * 3600))
+    assert fetcher.state_manager.pending() == {}
+
+    fetcher.fetch_listing_scan(['banking'], ['TD Bank'], since_timestamp=int(time.time()))
+    assert list(fetcher.state_manager.pending()) == ['reddit_banking']
@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+import main_nlp
+
+
+@pytest.fixture
+def enricher():
+    # Parsing needs no model or BigQuery client
+    return object.__new__(main_nlp.NLPEnricher)
+
+
+def analysis(index, sentiment=0.5, **fields):
+    return dict({'index': index, 'sentiment': sentiment, 'severity': 0.2, 'topics': ['fees'],
+                 'language': 'en', 'confidence': 0.9}, **fields)
+
+
+def test_results_follow_the_index_not_the_order(enricher):
+    response = json.dumps([analysis(2, -0.5), analysis(0, 0.1), analysis(1, 0.3)])
+    results = enricher._parse_batch_response(response, 3)
+    assert [result['sentiment'] for result in results] == [0.1, 0.3, -0.5]
+
+
+def test_values_are_clamped_and_topics_capped(enricher):
+    response = json.dumps([analysis(0, 3.0, severity=-1, confidence=2, topics=['a', 'b', 'c', 'd'])])
+    assert enricher._parse_batch_response(response, 1) == [
+        {'sentiment': 1.0, 'severity': 0.0, 'topics': ['a', 'b', 'c'], 'language': 'en', 'confidence': 1.0}
+    ]
+
+
+def test_fenced_and_truncated_responses_keep_complete_entries(enricher):
+    full = json.dumps([analysis(0), analysis(1), analysis(2)])
+    response = '```json\n' + full[:full.index('"index": 2') + 5]
+    results = enricher._parse_batch_response(response, 3)
+    assert results[0] is not None and results[1] is not None
+    assert results[2] is None
+
+
+def test_bad_entries_are_left_for_individual_retry(enricher):
+    response = json.dumps([
+        analysis(0), analysis(0, -1.0),  # duplicate index: first answer kept
+        analysis(5),  # out of range
+        analysis(1, topics='fees'),  # malformed topics
+        {'sentiment': 0.2},  # no index
+    ])
+    results = enricher._parse_batch_response(response, 3)
+    assert results[0]['sentiment'] == 0.5
+    assert results[1] is None and results[2] is None
+
+
+def test_no_json_at_all(enricher):
+    assert enricher._parse_batch_response('Sorry, I cannot help with that.', 2) == [None, None]
+
+
+def test_fetcher_reuses_one_enricher(monkeypatch):
+    import main
+
+    built = []
+
+    class StubEnricher:
+        def __init__(self):
+            built.append(self)
+
+        def analyze_text_batch(self, texts):
+            return [analysis(0) for _ in texts]
+
+    monkeypatch.setattr(main_nlp, 'NLPEnricher', StubEnricher)
+    fetcher = object.__new__(main.IdempotentRedditFetcher)
+    fetcher.nlp_enricher = None
+    for _ in range(3):
+        records = fetcher._enrich_with_nlp([{'title': 'TD fees', 'body': 'again'}])
+    assert len(built) == 1 and records[0]['sentiment'] == 0.5 and 'nlp_error' not in records[0]
@@ -0,0 +1,13 @@
+import os
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+
+@pytest.mark.parametrize('function', ['reddit-fetcher', 'nlp-enricher'])
+def test_function_copy_matches_repo_root(function):
+    with open(os.path.join(REPO_ROOT, 'nlp_cache.py'), 'rb') as source:
+        expected = source.read()
+    with open(os.path.join(REPO_ROOT, 'cloud-functions', function, 'nlp_cache.py'), 'rb') as copy:
+        assert copy.read() == expected, f"copy nlp_cache.py from the repo root into cloud-functions/{function}/"
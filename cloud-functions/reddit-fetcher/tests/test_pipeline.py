@@ -0,0 +1,44 @@
+import threading
+
+import pytest
+
+from pipeline import BoundedPipeline, PipelineStageError
+
+
+def test_barrier_runs_on_the_writer_after_everything_before_it():
+    written, snapshots = [], []
+
+    def on_barrier():
+        snapshots.append((list(written), threading.current_thread().name))
+
+    pipeline = BoundedPipeline([('enrich', lambda item: item * 10), ('write', written.append)], maxsize=1).start()
+    for item in range(5):
+        pipeline.put(item)
+    pipeline.barrier(on_barrier)
+    for item in range(5, 8):
+        pipeline.put(item)
+    pipeline.barrier(on_barrier)
+    pipeline.close()
+
+    assert snapshots == [([0, 10, 20, 30, 40], 'pipeline-write'),
+                         ([0, 10, 20, 30, 40, 50, 60, 70], 'pipeline-write')]
+    assert pipeline.stats()['write']['items'] == 8
+
+
+def test_barrier_after_a_failed_stage_never_runs():
+    ran = []
+
+    def enrich(item):
+        if item == 2:
+            raise ValueError('boom')
+        return item
+
+    pipeline = BoundedPipeline([('enrich', enrich), ('write', lambda item: None)], maxsize=1).start()
+    with pytest.raises(PipelineStageError):
+        for item in range(50):
+            pipeline.put(item)
+            pipeline.barrier(lambda item=item: ran.append(item))
+        pipeline.close()
+    with pytest.raises(PipelineStageError):
+        pipeline.close()
+    assert all(item < 2 for item in ran)
@@ -0,0 +1,73 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+import rate_limiter
+from rate_limiter import AdaptiveRateLimiter
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record the waits acquire_async hands out instead of sleeping through them"""
+    waits = []
+
+    async def fake_sleep(seconds):
+        waits.append(seconds)
+
+    monkeypatch.setattr(rate_limiter.asyncio, 'sleep', fake_sleep)
+    return waits
+
+
+def draining_limiter(**kwargs) -> AdaptiveRateLimiter:
+    limiter = AdaptiveRateLimiter(10 ** 6, capacity=10 ** 6, **kwargs)
+    limiter.observe(remaining=50, used=550, reset_timestamp=time.time() + 60)
+    return limiter
+
+
+async def acquire_concurrently(limiter, callers):
+    return await asyncio.gather(*[limiter.acquire_async() for _ in range(callers)])
+
+
+def test_concurrent_async_callers_queue_behind_each_other(sleeps):
+    waits = sorted(asyncio.run(acquire_concurrently(draining_limiter(), 8)))
+    gaps = [later - earlier for earlier, later in zip(waits, waits[1:])]
+    assert waits[0] == 0.0
+    # (550/600)^2 * 60s spread over the ~44 requests left: about 1.15s apart, widening as it drains
+    assert gaps[0] == pytest.approx(1.15, abs=0.05)
+    assert gaps == sorted(gaps) and gaps[-1] < 1.5
+
+
+def test_concurrent_threads_get_distinct_slots():
+    limiter = draining_limiter(budget_share=0.25)
+    waits, start = [], threading.Barrier(8)
+
+    def reserve():
+        start.wait()
+        waits.append(limiter._reserve())
+
+    threads = [threading.Thread(target=reserve) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    waits.sort()
+    # A quarter share of ~49 requests leaves ~7, so slots start ~60s/7 apart
+    assert waits[0] == 0.0
+    assert all(later - earlier > 8.0 for earlier, later in zip(waits, waits[1:]))
+
+
+def test_configured_rate_stays_the_ceiling_while_the_window_is_fresh():
+    limiter = AdaptiveRateLimiter(60, capacity=1)
+    limiter.observe(remaining=590, used=10, reset_timestamp=time.time() + 600)
+    waits = [limiter._reserve() for _ in range(4)]
+    assert waits[0] == 0.0
+    assert waits[1:] == pytest.approx([1.0, 2.0, 3.0], abs=0.05)
+
+
+def test_reset_window_falls_back_to_the_bucket():
+    limiter = AdaptiveRateLimiter(60, capacity=2)
+    limiter.observe(remaining=0, used=600, reset_timestamp=time.time() - 1)
+    assert [limiter._reserve() for _ in range(2)] == [0.0, 0.0]
+    assert limiter.remaining is None and limiter.next_allowed_at is None
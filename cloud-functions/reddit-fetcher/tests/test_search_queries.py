@@ -0,0 +1,29 @@
+from main import plan_search_queries, build_search_query, all_brand_terms
+
+
+def test_every_query_fits_the_length_limit():
+    groups = plan_search_queries(all_brand_terms(), max_length=512)
+    assert all(len(build_search_query(group)) <= 512 for group in groups)
+
+
+def test_every_term_searched_once_case_insensitively():
+    terms = all_brand_terms()
+    groups = plan_search_queries(terms + [term.upper() for term in terms], max_length=512)
+    packed = [term.lower() for group in groups for term in group]
+    assert len(packed) == len(set(packed))
+    assert set(packed) == {term.replace('"', '').strip().lower() for term in terms}
+
+
+def test_packs_into_fewer_queries_than_one_per_term():
+    terms = all_brand_terms()
+    groups = plan_search_queries(terms, max_length=512)
+    total = sum(len(build_search_query([term])) for group in groups for term in group) + 4 * (len(terms) - 1)
+    assert len(groups) < len(terms)
+    assert len(groups) <= total // 512 + 2  # first-fit decreasing stays close to the lower bound
+
+
+def test_quotes_stripped_and_long_terms_get_their_own_query():
+    long_term = 'x' * 600
+    groups = plan_search_queries(['"TD Bank"', 'RBC', long_term, '  ', 'rbc'], max_length=512)
+    assert [long_term] in groups
+    assert sorted(term for group in groups for term in group if term != long_term) == ['RBC', 'TD Bank']
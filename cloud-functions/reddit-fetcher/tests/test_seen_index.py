@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+
+from fake_gcp import MemoryStorage
+from seen_index import SeenEventIndex
+
+
+def days_ago(days: int) -> str:
+    return (datetime.utcnow() - timedelta(days=days)).strftime('%Y-%m-%dT12:00:00Z')
+
+
+def make_index(storage: MemoryStorage) -> SeenEventIndex:
+    return SeenEventIndex(storage, 'bucket', 'state/seen.json', recent_days=3, retention_days=30)
+
+
+def test_saved_events_are_recognised_and_edits_are_not():
+    storage = MemoryStorage()
+    index = make_index(storage)
+    index.record('t3_a', 'hash1', days_ago(0))
+    index.save()
+
+    reloaded = make_index(storage)
+    assert reloaded.check('t3_a', 'hash1', days_ago(0))
+    assert not reloaded.check('t3_a', 'hash2', days_ago(0))
+    assert not reloaded.check('t3_b', 'hash1', days_ago(0))
+    assert reloaded.stats == {'new': 1, 'changed': 1, 'unchanged': 1}
+
+
+def test_older_events_fall_back_to_bloom_filters_and_expire():
+    storage = MemoryStorage()
+    index = make_index(storage)
+    index.record('t3_old', 'hash', days_ago(10))
+    index.record('t3_expired', 'hash', days_ago(40))
+    index.save()
+
+    reloaded = make_index(storage)
+    assert 't3_old' not in reloaded.recent
+    assert reloaded.check('t3_old', 'hash', days_ago(10))
+    assert not reloaded.check('t3_old', 'other', days_ago(10))
+    assert not reloaded.check('t3_expired', 'hash', days_ago(40))
+
+
+def test_concurrent_runs_merge_their_events():
+    storage = MemoryStorage()
+    first, second = make_index(storage), make_index(storage)
+    first.record('t3_a', 'hash', days_ago(0))
+    second.record('t3_b', 'hash', days_ago(0))
+    first.save()
+    second.save()
+
+    reloaded = make_index(storage)
+    assert set(reloaded.recent) == {'t3_a', 't3_b'}
+
+
+def test_unsaved_records_survive_a_restart_through_the_checkpoint():
+    storage = MemoryStorage()
+    index = make_index(storage)
+    index.record('t3_a', 'hash', days_ago(0))
+    carried = index.unsaved()
+
+    resumed = make_index(storage)
+    resumed.restore(carried)
+    assert resumed.check('t3_a', 'hash', days_ago(0))
+    resumed.save(carried)
+    assert resumed.unsaved() == {}
+    assert make_index(storage).check('t3_a', 'hash', days_ago(0))
@@ -0,0 +1,74 @@
+import json
+import threading
+
+from fake_gcp import MemoryStorage
+from state_backends import SQLiteStateBackend, GCSStateBackend, gcs_merge_write
+
+
+def test_sqlite_prefix_is_literal(tmp_path):
+    backend = SQLiteStateBackend(str(tmp_path / 'state.db'))
+    backend.commit({
+        'reddit_banking': ('2026-01-01T00:00:00Z', 'a'),
+        'redditXbanking': ('2026-01-01T00:00:00Z', 'b'),  # '_' must not act as a wildcard
+        'REDDIT_banking': ('2026-01-01T00:00:00Z', 'c'),  # nor may case be ignored
+        'reddit%banking': ('2026-01-01T00:00:00Z', 'd'),
+        'twitter_td': ('2026-01-01T00:00:00Z', 'e'),
+    })
+    assert set(backend.load_all('reddit_')) == {'reddit_banking'}
+    assert set(backend.load_all('reddit%')) == {'reddit%banking'}
+    assert len(backend.load_all()) == 5
+
+
+def test_sqlite_cursor_never_moves_backwards(tmp_path):
+    backend = SQLiteStateBackend(str(tmp_path / 'state.db'))
+    backend.commit({'reddit_td': ('2026-01-02T00:00:00Z', 'b')})
+    backend.commit({'reddit_td': ('2026-01-01T00:00:00Z', 'z')})
+    assert backend.load_all()['reddit_td'] == ('2026-01-02T00:00:00Z', 'b')
+
+    backend.commit({'reddit_td': ('2026-01-02T00:00:00Z', 'c')})  # same time, later tie-breaker
+    assert backend.load_all()['reddit_td'] == ('2026-01-02T00:00:00Z', 'c')
+
+
+def test_gcs_merge_write_merges_again_after_losing_a_race(monkeypatch):
+    monkeypatch.setattr('state_backends.time.sleep', lambda seconds: None)
+    storage = MemoryStorage()
+    blob = storage.bucket('bucket').blob('shared.json')
+    blob.upload_from_string(json.dumps({'first': 1}))
+    loads = []
+
+    def load():
+        data, generation = json.loads(blob.download_as_bytes()), blob.generation
+        if not loads:
+            # Another instance writes between this read and the conditional upload
+            storage.bucket('bucket').blob('shared.json').upload_from_string(json.dumps(dict(data, other=2)))
+        loads.append(generation)
+        return data, generation
+
+    assert gcs_merge_write(blob, load, lambda data: dict(data, mine=3))
+    assert len(loads) == 2
+    assert json.loads(blob.download_as_bytes()) == {'first': 1, 'other': 2, 'mine': 3}
+
+
+def test_gcs_merge_write_gives_up_after_max_attempts(monkeypatch):
+    monkeypatch.setattr('state_backends.time.sleep', lambda seconds: None)
+    storage = MemoryStorage()
+    blob = storage.bucket('bucket').blob('shared.json')
+    blob.upload_from_string('{}')
+    assert not gcs_merge_write(blob, lambda: ({}, 0), lambda data: data, max_attempts=3)
+
+
+def test_gcs_backend_concurrent_commits_keep_every_source():
+    storage = MemoryStorage()
+
+    def commit(index):
+        GCSStateBackend(storage, 'bucket', 'state.json').commit(
+            {f"reddit_sub{index}": (f"2026-01-01T00:00:0{index}Z", str(index))}
+        )
+
+    threads = [threading.Thread(target=commit, args=(index,)) for index in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(GCSStateBackend(storage, 'bucket', 'state.json').load_all('reddit_')) == \
+        [f"reddit_sub{index}" for index in range(6)]
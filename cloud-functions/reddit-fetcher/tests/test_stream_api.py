@@ -0,0 +1,23 @@
+import time
+
+from fake_gcp import MemoryBigQuery, MemoryStorage
+from fake_reddit import FakeComment, FakeReddit, FakeSubmission
+from main import IdempotentRedditFetcher, FINANCIAL_BRANDS
+
+
+def test_single_items_get_the_batch_record_shape():
+    reddit = FakeReddit(['banking', 'TDBank'], history_seconds=0)
+    fetcher = IdempotentRedditFetcher(requests_per_minute=10 ** 9, reddit_factory=lambda: reddit,
+                                      storage_client=MemoryStorage(), bq_client=MemoryBigQuery())
+    now = time.time()
+    submission = FakeSubmission('p1', 'TDBank', 'TD Bank froze my account', '', now)
+    comments = [FakeComment('c1', 'banking', 'TD Bank charged me an overdraft fee', now, 't3_p0'),
+                FakeComment('c2', 'TDBank', 'Budgeting tips for a new grad', now, 't3_p1'),
+                FakeComment('c3', 'TDBank', 'TD Canada Trust customer service was great', now, 't3_p1')]
+
+    [post] = fetcher.handle_submission(submission, set(FINANCIAL_BRANDS))
+    messages = fetcher.handle_comments(comments, set(FINANCIAL_BRANDS))
+    assert post['metadata']['reddit_id'] == 'p1'
+    assert [(m['metadata']['reddit_id'], m['metadata']['subreddit']) for m in messages] == [
+        ('c1', 'banking'), ('c3', 'TDBank')]
+    assert fetcher.state_manager.pending() == {}
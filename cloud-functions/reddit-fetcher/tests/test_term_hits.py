@@ -0,0 +1,18 @@
+import time
+
+from fake_gcp import MemoryBigQuery, MemoryStorage
+from fake_reddit import FakeComment, FakeReddit
+from main import IdempotentRedditFetcher, FINANCIAL_BRANDS
+
+
+def test_emitted_comments_credit_their_matched_terms():
+    reddit = FakeReddit(['banking'], history_seconds=0)
+    fetcher = IdempotentRedditFetcher(requests_per_minute=10 ** 9, reddit_factory=lambda: reddit,
+                                      storage_client=MemoryStorage(), bq_client=MemoryBigQuery())
+    window = fetcher._init_windows(['banking'], None, initial_fetch=True)['banking']
+    comments = [FakeComment('c1', 'banking', 'TD Bank charged me an overdraft fee twice', time.time(), 't3_p1'),
+                FakeComment('c2', 'banking', 'Budgeting tips for a new grad', time.time(), 't3_p1')]
+
+    fetcher._handle_comments(comments, window, set(FINANCIAL_BRANDS))
+    assert len(window['messages']) == 1
+    assert fetcher.term_hits['banking'] == {'td': 1, 'td bank': 1}
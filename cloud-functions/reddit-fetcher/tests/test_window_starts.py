@@ -0,0 +1,18 @@
+from datetime import datetime, timedelta
+
+from fake_gcp import MemoryBigQuery, MemoryStorage
+from fake_reddit import FakeReddit
+from main import IdempotentRedditFetcher, RedditIngestionRun
+
+
+def test_shard_window_starts_fall_back_to_the_unsharded_cursor():
+    reddit = FakeReddit(['banking'], history_seconds=0)
+    fetcher = IdempotentRedditFetcher(requests_per_minute=10 ** 9, reddit_factory=lambda: reddit,
+                                      storage_client=MemoryStorage(), bq_client=MemoryBigQuery())
+    cursor = datetime.utcnow() - timedelta(hours=5)
+    fetcher.state_manager.update_state('reddit_banking', cursor.isoformat() + 'Z', 'p1')
+
+    run = RedditIngestionRun(fetcher, 'shard', ['banking'], ['TD Bank'], source_suffix='#terms1of2')
+    window = fetcher._init_windows(['banking'], None, False, '#terms1of2')['banking']
+    assert run._window_starts['banking'] == window['since']
+    assert window['max_tie_breaker'] == 'p1'
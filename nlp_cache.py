@@ -0,0 +1,312 @@
+"""
+Persistent cache of NLP analyses
+Keyed by (sha256 of the cleaned text, nlp_model, nlp_version, prompt_version) so
+text that was already analyzed (overlap windows, duplicate posts, reprocessing
+runs) never goes back to the model. Changing the model, NLP_VERSION or either
+prompt changes the key: old entries are never read again and age out with the
+BigQuery partition expiry or the GCS prefix of their version.
+SQLite/local file for tests and local runs; BigQuery (one lookup query and one
+streaming insert per batch) or one GCS object per entry in production.
+NLP modules go through analyze_with_cache only. Edit the copy at the repo root;
+each NLP function commits an identical copy in its own source tree (checked by
+cloud-functions/reddit-fetcher/tests/test_nlp_cache_copies.py).
+"""
+
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple, Callable
+
+from google.cloud import bigquery
+from google.cloud import storage
+from google.api_core import exceptions as gcp_exceptions
+
+logger = logging.getLogger(__name__)
+
+
+def text_hash(cleaned_text: str) -> str:
+    return hashlib.sha256(cleaned_text.encode('utf-8')).hexdigest()
+
+
+class NLPCache(ABC):
+    """
+    text_hash -> analysis for one (nlp_model, nlp_version, prompt_version)
+    Backend errors are logged and treated as misses: the cache never fails enrichment.
+    """
+
+    name = 'base'
+
+    def __init__(self, nlp_model: str, nlp_version: str, prompt_version: str):
+        self.nlp_model = nlp_model
+        self.nlp_version = nlp_version
+        self.prompt_version = prompt_version
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'errors': 0}
+        self._lock = threading.Lock()
+
+    def lookup(self, text_hashes: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Cached analyses for the hashes that have one"""
+        wanted = sorted(set(text_hashes))
+        found = {}
+        if wanted:
+            try:
+                found = self._get_many(wanted)
+            except Exception as e:
+                logger.warning(f"NLP cache lookup failed ({self.name}): {e}")
+                self._count('errors')
+        hits = sum(1 for key in text_hashes if key in found)
+        self._count('hits', hits)
+        self._count('misses', len(text_hashes) - hits)
+        return found
+
+    def store(self, analyses: Dict[str, Dict[str, Any]]):
+        """Cache model answers by text hash"""
+        if not analyses:
+            return
+        try:
+            self._put_many(analyses)
+            self._count('writes', len(analyses))
+        except Exception as e:
+            logger.warning(f"NLP cache write failed ({self.name}): {e}")
+            self._count('errors')
+
+    def hit_ratio(self) -> float:
+        lookups = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / lookups if lookups else 0.0
+
+    def describe(self) -> str:
+        lookups = self.stats['hits'] + self.stats['misses']
+        return f"cache hit ratio {self.hit_ratio():.1%} ({self.stats['hits']}/{lookups})"
+
+    def _count(self, stat: str, amount: int = 1):
+        with self._lock:
+            self.stats[stat] += amount
+
+    @abstractmethod
+    def _get_many(self, text_hashes: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Stored analyses for the hashes that have one (raising counts as a miss for all)"""
+
+    @abstractmethod
+    def _put_many(self, analyses: Dict[str, Dict[str, Any]]):
+        """Store analyses by text hash"""
+
+
+class SQLiteNLPCache(NLPCache):
+    """Local-file cache for tests and local runs"""
+
+    name = 'sqlite'
+
+    def __init__(self, path: str, nlp_model: str, nlp_version: str, prompt_version: str):
+        super().__init__(nlp_model, nlp_version, prompt_version)
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS nlp_cache (
+                    text_hash TEXT NOT NULL,
+                    nlp_model TEXT NOT NULL,
+                    nlp_version TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    analysis TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    PRIMARY KEY (text_hash, nlp_model, nlp_version, prompt_version)
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _get_many(self, text_hashes: List[str]) -> Dict[str, Dict[str, Any]]:
+        found = {}
+        with self._connect() as conn:
+            for start in range(0, len(text_hashes), 500):  # stay under SQLite's bound-parameter limit
+                chunk = text_hashes[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT text_hash, analysis FROM nlp_cache "
+                    f"WHERE nlp_model = ? AND nlp_version = ? AND prompt_version = ? "
+                    f"AND text_hash IN ({', '.join('?' * len(chunk))})",
+                    [self.nlp_model, self.nlp_version, self.prompt_version] + chunk
+                ).fetchall()
+                found.update((key, json.loads(analysis)) for key, analysis in rows)
+        return found
+
+    def _put_many(self, analyses: Dict[str, Dict[str, Any]]):
+        now = datetime.utcnow().isoformat() + 'Z'
+        conn = self._connect()
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO nlp_cache VALUES (?, ?, ?, ?, ?, ?)",
+                [(key, self.nlp_model, self.nlp_version, self.prompt_version, json.dumps(analysis), now)
+                 for key, analysis in analyses.items()]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class BigQueryNLPCache(NLPCache):
+    """
+    Cache table partitioned by day and clustered on the key; one parameterized
+    query per lookup and one streaming insert per store. Rows expire with their
+    partition, which is also how entries of superseded versions are dropped.
+    """
+
+    name = 'bigquery'
+
+    def __init__(self, bq_client: bigquery.Client, project_id: str, dataset_id: str,
+                 nlp_model: str, nlp_version: str, prompt_version: str,
+                 table_id: str = 'nlp_cache', expiration_days: int = 90):
+        super().__init__(nlp_model, nlp_version, prompt_version)
+        self.bq_client = bq_client
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+        self.table_id = table_id
+        self.expiration_days = expiration_days
+        self.table = f"{project_id}.{dataset_id}.{table_id}"
+        self._table_ready = False
+
+    def _ensure_cache_table(self):
+        if self._table_ready:
+            return
+        self._table_ready = True
+        table_ref = self.bq_client.dataset(self.dataset_id).table(self.table_id)
+
+        try:
+            self.bq_client.get_table(table_ref)
+        except gcp_exceptions.NotFound:
+            schema = [
+                bigquery.SchemaField("text_hash", "STRING", mode="REQUIRED"),
+                bigquery.SchemaField("nlp_model", "STRING", mode="REQUIRED"),
+                bigquery.SchemaField("nlp_version", "STRING", mode="REQUIRED"),
+                bigquery.SchemaField("prompt_version", "STRING", mode="REQUIRED"),
+                bigquery.SchemaField("analysis", "STRING", mode="REQUIRED"),
+                bigquery.SchemaField("created_at", "TIMESTAMP", mode="REQUIRED"),
+            ]
+
+            table = bigquery.Table(table_ref, schema=schema)
+            table.time_partitioning = bigquery.TimePartitioning(
+                type_=bigquery.TimePartitioningType.DAY, field="created_at",
+                expiration_ms=self.expiration_days * 24 * 3600 * 1000
+            )
+            table.clustering_fields = ["nlp_model", "nlp_version", "prompt_version", "text_hash"]
+            table = self.bq_client.create_table(table, exists_ok=True)
+            logger.info(f"Created NLP cache table: {table.table_id}")
+
+    def _get_many(self, text_hashes: List[str]) -> Dict[str, Dict[str, Any]]:
+        self._ensure_cache_table()
+        query = f"""
+        SELECT text_hash, ANY_VALUE(analysis) AS analysis
+        FROM `{self.table}`
+        WHERE nlp_model = @nlp_model AND nlp_version = @nlp_version AND prompt_version = @prompt_version
+          AND text_hash IN UNNEST(@text_hashes)
+        GROUP BY text_hash
+        """
+
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ScalarQueryParameter("nlp_model", "STRING", self.nlp_model),
+                bigquery.ScalarQueryParameter("nlp_version", "STRING", self.nlp_version),
+                bigquery.ScalarQueryParameter("prompt_version", "STRING", self.prompt_version),
+                bigquery.ArrayQueryParameter("text_hashes", "STRING", text_hashes),
+            ]
+        )
+
+        return {row.text_hash: json.loads(row.analysis)
+                for row in self.bq_client.query(query, job_config=job_config)}
+
+    def _put_many(self, analyses: Dict[str, Dict[str, Any]]):
+        self._ensure_cache_table()
+        now = datetime.utcnow().isoformat() + 'Z'
+        rows = [{'text_hash': key, 'nlp_model': self.nlp_model, 'nlp_version': self.nlp_version,
+                 'prompt_version': self.prompt_version, 'analysis': json.dumps(analysis), 'created_at': now}
+                for key, analysis in analyses.items()]
+        errors = self.bq_client.insert_rows_json(self.table, rows)
+        if errors:
+            raise RuntimeError(f"insert errors: {errors[:3]}")
+
+
+class GCSNLPCache(NLPCache):
+    """
+    One small JSON object per entry under {prefix}/{nlp_model}/{nlp_version}/{prompt_version}/,
+    read and written concurrently; a superseded version is one prefix to delete
+    """
+
+    name = 'gcs'
+
+    def __init__(self, storage_client: storage.Client, bucket_name: str, prefix: str,
+                 nlp_model: str, nlp_version: str, prompt_version: str, max_workers: int = 16):
+        super().__init__(nlp_model, nlp_version, prompt_version)
+        self.bucket = storage_client.bucket(bucket_name)
+        self.base_path = f"{prefix}/{nlp_model}/{nlp_version}/{prompt_version}"
+        self.max_workers = max_workers
+
+    def _read_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(self.bucket.blob(f"{self.base_path}/{key}.json").download_as_bytes())
+        except gcp_exceptions.NotFound:
+            return None
+
+    def _write_entry(self, item):
+        key, analysis = item
+        self.bucket.blob(f"{self.base_path}/{key}.json").upload_from_string(
+            json.dumps(analysis), content_type='application/json'
+        )
+
+    def _get_many(self, text_hashes: List[str]) -> Dict[str, Dict[str, Any]]:
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(text_hashes))) as executor:
+            entries = list(executor.map(self._read_entry, text_hashes))
+        return {key: analysis for key, analysis in zip(text_hashes, entries) if analysis is not None}
+
+    def _put_many(self, analyses: Dict[str, Dict[str, Any]]):
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(analyses))) as executor:
+            list(executor.map(self._write_entry, analyses.items()))
+
+
+def create_nlp_cache(backend_name: str, nlp_model: str, nlp_version: str, prompt_version: str,
+                     sqlite_path: str = '/tmp/nlp_cache.db', bq_client: Optional[bigquery.Client] = None,
+                     project_id: Optional[str] = None, dataset_id: Optional[str] = None,
+                     storage_client: Optional[storage.Client] = None, bucket_name: Optional[str] = None,
+                     gcs_prefix: str = 'state/nlp_cache') -> Optional[NLPCache]:
+    """Build the cache for the configured backend (sqlite, bigquery, gcs or none); None if it cannot be built"""
+    try:
+        if backend_name == 'none':
+            return None
+        if backend_name == 'sqlite':
+            return SQLiteNLPCache(sqlite_path, nlp_model, nlp_version, prompt_version)
+        if backend_name == 'bigquery':
+            return BigQueryNLPCache(bq_client, project_id, dataset_id, nlp_model, nlp_version, prompt_version)
+        if backend_name == 'gcs':
+            return GCSNLPCache(storage_client or storage.Client(), bucket_name, gcs_prefix,
+                               nlp_model, nlp_version, prompt_version)
+        raise ValueError(f"Unknown NLP_CACHE_BACKEND: {backend_name}")
+    except Exception as e:
+        logger.warning(f"NLP result cache unavailable, analyzing every text: {e}")
+        return None
+
+
+def analyze_with_cache(cache: Optional[NLPCache], pending: List[Tuple[int, str]],
+                       analyze: Callable[[List[Tuple[int, str]]], Dict[int, Tuple[Dict[str, Any], bool]]]
+                       ) -> Dict[int, Dict[str, Any]]:
+    """
+    Analyses for (position, cleaned text) pairs, answered from the cache where possible
+    analyze(misses) returns {position: (analysis, from_model)}; only real model
+    answers are stored, never fallback or error results.
+    """
+    if cache is None or not pending:
+        return {position: analysis for position, (analysis, _) in analyze(pending).items()}
+
+    keys = {position: text_hash(cleaned_text) for position, cleaned_text in pending}
+    cached = cache.lookup(list(keys.values()))
+    results = {position: cached[key] for position, key in keys.items() if key in cached}
+    misses = [(position, cleaned_text) for position, cleaned_text in pending if position not in results]
+
+    answered = {}
+    for position, (analysis, from_model) in analyze(misses).items():
+        results[position] = analysis
+        if from_model:
+            answered[keys[position]] = analysis
+    cache.store(answered)
+    return results
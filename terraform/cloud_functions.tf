@@ -78,6 +78,31 @@ resource "google_cloud_run_v2_service" "reddit_fetcher" {
         value = google_secret_manager_secret.reddit_credentials.secret_id
       }
       
+      env {
+        name  = "REDDIT_SHARD_TOPIC"
+        value = google_pubsub_topic.reddit_shards.name
+      }
+      
+      env {
+        name  = "FANOUT_MAX_WORKERS"
+        value = "8"
+      }
+      
+      env {
+        name  = "REDDIT_DAILY_REQUEST_BUDGET"
+        value = "20000"
+      }
+      
+      env {
+        name  = "FUNCTION_TIMEOUT_SECONDS"
+        value = "600"  # keep in sync with timeout below; the run budget stops short of it
+      }
+      
+      env {
+        name  = "NLP_CACHE_BACKEND"
+        value = "bigquery"
+      }
+      
       resources {
         limits = {
           cpu    = "1"
@@ -95,7 +120,74 @@ resource "google_cloud_run_v2_service" "reddit_fetcher" {
     
     scaling {
       min_instance_count = 0
-      max_instance_count = 2
+      max_instance_count = 8  # fan-out workers (see FANOUT_MAX_WORKERS)
+    }
+  }
+
+  depends_on = [google_project_service.required_apis]
+}
+
+# Reddit Stream Worker (long-running; same image as reddit-fetcher)
+resource "google_cloud_run_v2_service" "reddit_stream_worker" {
+  name     = "reddit-stream-worker"
+  location = var.region
+  project  = var.project_id
+
+  template {
+    service_account = google_service_account.cloud_functions_sa.email
+    
+    containers {
+      image   = "gcr.io/${var.project_id}/reddit-fetcher:latest"
+      command = ["python", "stream_worker.py"]
+      
+      env {
+        name  = "PROJECT_ID"
+        value = var.project_id
+      }
+      
+      env {
+        name  = "GCS_BUCKET"
+        value = google_storage_bucket.brand_health_raw_data.name
+      }
+      
+      env {
+        name  = "REDDIT_SECRET_NAME"
+        value = google_secret_manager_secret.reddit_credentials.secret_id
+      }
+      
+      env {
+        name  = "STREAM_BATCH_MAX_SECONDS"
+        value = "5"
+      }
+      
+      env {
+        name  = "NLP_CACHE_BACKEND"
+        value = "bigquery"
+      }
+      
+      resources {
+        limits = {
+          cpu    = "1"
+          memory = "1Gi"
+        }
+        cpu_idle = false  # the worker runs without incoming requests
+      }
+      
+      ports {
+        container_port = 8080
+      }
+      
+      startup_probe {
+        http_get {
+          path = "/health"
+        }
+      }
+    }
+    
+    # One consumer per stream; a second instance would duplicate every item
+    scaling {
+      min_instance_count = 1
+      max_instance_count = 1
     }
   }
 
@@ -251,6 +343,34 @@ resource "google_eventarc_trigger" "reddit_trigger" {
   depends_on = [google_project_service.required_apis]
 }
 
+resource "google_eventarc_trigger" "reddit_shard_trigger" {
+  name     = "reddit-shard-trigger"
+  location = var.region
+  project  = var.project_id
+
+  matching_criteria {
+    attribute = "type"
+    value     = "google.cloud.pubsub.topic.v1.messagePublished"
+  }
+
+  destination {
+    cloud_run_service {
+      service = google_cloud_run_v2_service.reddit_fetcher.name
+      region  = var.region
+    }
+  }
+
+  transport {
+    pubsub {
+      topic = google_pubsub_topic.reddit_shards.id
+    }
+  }
+
+  service_account = google_service_account.cloud_functions_sa.email
+
+  depends_on = [google_project_service.required_apis]
+}
+
 resource "google_eventarc_trigger" "trends_trigger" {
   name     = "trends-pubsub-trigger"
   location = var.region
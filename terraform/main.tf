@@ -176,6 +176,12 @@ resource "google_project_iam_member" "cloud_functions_bigquery" {
   member  = "serviceAccount:${google_service_account.cloud_functions_sa.email}"
 }
 
+resource "google_project_iam_member" "cloud_functions_pubsub" {
+  project = var.project_id
+  role    = "roles/pubsub.publisher"
+  member  = "serviceAccount:${google_service_account.cloud_functions_sa.email}"
+}
+
 # Pub/Sub topics for triggering functions
 resource "google_pubsub_topic" "twitter_trigger" {
   name    = "twitter-data-fetch"
@@ -191,6 +197,14 @@ resource "google_pubsub_topic" "reddit_trigger" {
   depends_on = [google_project_service.required_apis]
 }
 
+# Work items for the sharded Reddit fan-out (one message per subreddit x term shard)
+resource "google_pubsub_topic" "reddit_shards" {
+  name    = "reddit-shard-work"
+  project = var.project_id
+
+  depends_on = [google_project_service.required_apis]
+}
+
 resource "google_pubsub_topic" "trends_trigger" {
   name    = "trends-data-fetch"
   project = var.project_id
@@ -225,14 +239,16 @@ resource "google_cloud_scheduler_job" "twitter_daily" {
   depends_on = [google_project_service.required_apis]
 }
 
-resource "google_cloud_scheduler_job" "reddit_daily" {
-  name             = "reddit-daily-fetch"
-  project          = var.project_id
-  region           = var.region
-  description      = "Daily Reddit data fetch"
-  schedule         = "0 3 * * *"  # 3 AM daily
-  time_zone        = "UTC"
-  attempt_deadline = "300s"
+# No attempt_deadline: Cloud Scheduler ignores it for Pub/Sub targets (the job ends once the
+# message is published). The run itself is bounded by the reddit-fetcher service timeout (600s),
+# and RUN_TIME_BUDGET_SECONDS stops it short of that.
+resource "google_cloud_scheduler_job" "reddit_hourly" {
+  name        = "reddit-hourly-fetch"
+  project     = var.project_id
+  region      = var.region
+  description = "Hourly Reddit poll (only subreddits due under the daily request budget are fetched)"
+  schedule    = "0 * * * *"  # Hourly
+  time_zone   = "UTC"
 
   pubsub_target {
     topic_name = google_pubsub_topic.reddit_trigger.id